@@ -0,0 +1,176 @@
+import argparse
+import csv
+import datetime
+
+import numpy as np
+
+import data_utils as du
+import db_utils as db
+import observations
+
+# Same thresholds as the stored functions in sql/stored_functions.sql
+RAIN_CONDITION = "Rain"
+COLD_THRESHOLD = 0
+WARM_THRESHOLD = 35
+
+
+class Observations:
+    """
+    Columnar view of weather_data rows.
+
+    Attributes:
+        created_at (numpy.ndarray): UTC timestamps (datetime64[s]).
+        temperature_c (numpy.ndarray): Temperatures in Celsius (float64, NaN if missing).
+        condition_text (numpy.ndarray): Condition texts (object).
+    """
+
+    def __init__(self, created_at, temperature_c, condition_text):
+        self.created_at = created_at
+        self.temperature_c = temperature_c
+        self.condition_text = condition_text
+
+    def __len__(self):
+        return len(self.created_at)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds the columns from a list of weather_data dictionaries.
+
+        Args:
+            rows (list): Dictionaries with 'created_at', 'temperature_c' and 'condition_text' keys.
+
+        Returns:
+            Observations: The columnar observations.
+        """
+
+        created_at = np.array([du.parse_timestamp(row['created_at']) for row in rows], dtype='datetime64[s]')
+        temperature_c = np.array([row.get('temperature_c') for row in rows], dtype=float)
+        condition_text = np.array([row.get('condition_text') for row in rows], dtype=object)
+        return cls(created_at, temperature_c, condition_text)
+
+
+def load_observations(supabase_client, start, end):
+    """
+    Loads weather_data rows in [start, end) from the database into columns.
+
+    Args:
+        supabase_client (Client): Database connection.
+        start (datetime.date): First day of the range.
+        end (datetime.date): Day after the last day of the range.
+
+    Rows are streamed page by page into an observations.ObservationBatch, which has
+    the same columns as Observations, so long ranges are never held as dictionaries.
+
+    Returns:
+        observations.ObservationBatch: The columnar observations, or None if an error occurred.
+    """
+
+    return observations.load_batch(supabase_client, start, end)
+
+
+def compute_climatology(observations, rain_condition=RAIN_CONDITION,
+                        cold_threshold=COLD_THRESHOLD, warm_threshold=WARM_THRESHOLD):
+    """
+    Computes the monthly counters and hourly average temperatures for every month.
+
+    The results match get_rainy_days, count_cold_days, count_warm_days and
+    hour_avg_temp, but are computed for all months and hours at once.
+
+    Args:
+        observations (Observations): The observations to aggregate.
+        rain_condition (str): Condition text of a rainy reading.
+        cold_threshold (float): A day is cold if its minimum temperature is at or below this.
+        warm_threshold (float): A day is warm if its maximum temperature is at or above this.
+
+    Returns:
+        list: One dictionary per month with 'year', 'month', 'rainy_days', 'cold_days',
+              'warm_days' and 'hour_avg_temp' (a list of 24 averages, None for hours without data).
+    """
+
+    if len(observations) == 0:
+        return []
+
+    temperature = observations.temperature_c
+    has_temperature = ~np.isnan(temperature)
+    rainy = observations.condition_text == rain_condition
+
+    day = observations.created_at.astype('datetime64[D]')
+    hour = ((observations.created_at - day) // np.timedelta64(1, 'h')).astype(np.int64)
+
+    # Daily min/max and rain flag
+    days, day_index = np.unique(day, return_inverse=True)
+    daily_min = np.full(len(days), np.inf)
+    daily_max = np.full(len(days), -np.inf)
+    np.fmin.at(daily_min, day_index, temperature)
+    np.fmax.at(daily_max, day_index, temperature)
+    daily_rainy = np.bincount(day_index, weights=rainy, minlength=len(days)) > 0
+
+    # Monthly day counters
+    months, month_of_day = np.unique(days.astype('datetime64[M]'), return_inverse=True)
+    rainy_days = np.bincount(month_of_day, weights=daily_rainy, minlength=len(months))
+    cold_days = np.bincount(month_of_day, weights=daily_min <= cold_threshold, minlength=len(months))
+    warm_days = np.bincount(month_of_day, weights=daily_max >= warm_threshold, minlength=len(months))
+
+    # Hourly averages per month
+    month_hour = month_of_day[day_index] * 24 + hour
+    sums = np.bincount(month_hour, weights=np.where(has_temperature, temperature, 0), minlength=len(months) * 24)
+    counts = np.bincount(month_hour, weights=has_temperature, minlength=len(months) * 24)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        averages = (sums / counts).reshape(len(months), 24)
+
+    result = []
+    for i, month in enumerate(months.astype(object)):
+        result.append({
+            'year': month.year,
+            'month': month.month,
+            'rainy_days': int(rainy_days[i]),
+            'cold_days': int(cold_days[i]),
+            'warm_days': int(warm_days[i]),
+            'hour_avg_temp': [None if np.isnan(value) else float(value) for value in averages[i]],
+        })
+
+    return result
+
+
+def write_climatology_csv(climatology, path):
+    """
+    Writes the climatology as a table with one row per (year, month, hour).
+
+    Args:
+        climatology (list): The result of compute_climatology.
+        path (str): Path of the CSV file.
+    """
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["year", "month", "hour", "hour_avg_temp", "rainy_days", "cold_days", "warm_days"])
+
+        for month in climatology:
+            for hour, average in enumerate(month['hour_avg_temp']):
+                writer.writerow([month['year'], month['month'], hour,
+                                 "" if average is None else round(average, 2),
+                                 month['rainy_days'], month['cold_days'], month['warm_days']])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Computes the monthly and hourly climatology of a date range.")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, required=True, help="first day (YYYY-MM-DD)")
+    parser.add_argument("--end", type=datetime.date.fromisoformat, required=True, help="day after the last day")
+    parser.add_argument("--out", default="climatology.csv", help="output CSV file")
+    parser.add_argument("--archive", help="read from this archive directory instead of the database")
+    args = parser.parse_args()
+
+    if args.archive:
+        import archive
+        observations = archive.load_observations(args.archive, args.start, args.end)
+    else:
+        observations = load_observations(db.init(), args.start, args.end)
+
+    if observations is not None:
+        write_climatology_csv(compute_climatology(observations), args.out)
+        print(f"Climatology of {len(observations)} readings written to {args.out}.")
+
+
+if __name__ == "__main__":
+    main()
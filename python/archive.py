@@ -0,0 +1,290 @@
+import argparse
+import datetime
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs
+
+import analytics
+import data_utils as du
+import db_utils as db
+
+# Columns of the weather_data table kept in the archive
+SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('created_at', pa.timestamp('us', tz='UTC')),
+    ('temperature_c', pa.float64()),
+    ('humidity', pa.int16()),
+    ('wind_speed', pa.float64()),
+    ('pressure', pa.int16()),
+    ('condition_text', pa.string()),
+    ('location', pa.string()),
+    ('month', pa.string()),
+])
+
+# Directory layout: <root>/month=YYYY-MM/location=<lat,lon>/part-0.<format>
+PARTITIONING = ds.partitioning(pa.schema([('month', pa.string()), ('location', pa.string())]), flavor='hive')
+
+FORMATS = {'parquet': 'parquet', 'ipc': 'feather'}
+
+
+def rows_to_table(rows):
+    """
+    Converts weather_data dictionaries into an Arrow table with the archive schema.
+
+    Args:
+        rows (list): A list of weather_data dictionaries.
+
+    Returns:
+        pyarrow.Table: The rows as a table.
+    """
+
+    created_at = [du.parse_timestamp(row['created_at']).replace(tzinfo=datetime.timezone.utc)
+                  for row in rows]
+
+    columns = {name: [row.get(name) for row in rows] for name in SCHEMA.names
+               if name not in ('created_at', 'month')}
+    columns['created_at'] = created_at
+    columns['month'] = [timestamp.strftime("%Y-%m") for timestamp in created_at]
+
+    return pa.table(columns, schema=SCHEMA)
+
+
+def export(rows, root, file_format='parquet'):
+    """
+    Writes rows into the archive, partitioned by month and location.
+
+    Args:
+        rows (list): A list of weather_data dictionaries.
+        root (str): Archive directory.
+        file_format (str): 'parquet' or 'ipc' (Arrow IPC / Feather).
+
+    Returns:
+        int: Number of exported rows.
+    """
+
+    if not rows:
+        return 0
+
+    return export_table(rows_to_table(rows), root, file_format)
+
+
+def export_table(table, root, file_format='parquet'):
+    """
+    Writes a table with the archive schema into the archive.
+
+    The rows already archived in the month/location partitions that receive rows
+    are merged with the new ones, so exporting part of a month again keeps the
+    rest of that month. Rows with the same location and created_at are kept once,
+    with the newly exported values.
+
+    Args:
+        table (pyarrow.Table): The rows, e.g. from rows_to_table.
+        root (str): Archive directory.
+        file_format (str): 'parquet' or 'ipc'.
+
+    Returns:
+        int: Number of exported rows.
+    """
+
+    if table.num_rows == 0:
+        return 0
+
+    existing = _existing_partitions(root, table, file_format)
+    if existing is not None and existing.num_rows:
+        table = _deduplicate(pa.concat_tables([existing.select(SCHEMA.names).cast(SCHEMA), table]))
+
+    ds.write_dataset(table.sort_by([('created_at', 'ascending')]), root,
+                     format=FORMATS[file_format],
+                     partitioning=PARTITIONING,
+                     basename_template="part-{i}." + file_format,
+                     existing_data_behavior='delete_matching')
+
+    return table.num_rows
+
+
+def _existing_partitions(root, table, file_format):
+    # The archived rows of every month/location partition the table writes to
+    if not os.path.isdir(root):
+        return None
+
+    dataset = ds.dataset(root, format=FORMATS[file_format], partitioning=PARTITIONING)
+    condition = None
+    for partition in pa.table({'month': table['month'], 'location': table['location']}).group_by(
+            ['month', 'location']).aggregate([]).to_pylist():
+        location = ds.field('location') == partition['location'] if partition['location'] is not None \
+            else ds.field('location').is_null()
+        expression = (ds.field('month') == partition['month']) & location
+        condition = expression if condition is None else condition | expression
+
+    return dataset.to_table(filter=condition)
+
+
+def _deduplicate(table):
+    # Keeps the last row of every (location, created_at), i.e. the newly exported one
+    indexed = table.append_column('_row', pa.array(range(table.num_rows), type=pa.int64()))
+    last = indexed.group_by(['location', 'created_at'], use_threads=False).aggregate([('_row', 'max')])
+    rows = last['_row_max']
+    return table.take(rows.take(pc.sort_indices(rows)))
+
+
+def read(root, start=None, end=None, columns=None, location=None, file_format='parquet'):
+    """
+    Reads rows from the archive.
+
+    Files are memory-mapped. The time range and location filters prune whole
+    partitions first and are then pushed down into the file scans, and only the
+    requested columns are read.
+
+    Args:
+        root (str): Archive directory.
+        start (datetime.datetime): Optional inclusive lower bound of created_at (naive values are UTC,
+                                   dates are midnight UTC).
+        end (datetime.datetime): Optional exclusive upper bound of created_at.
+        columns (list): Optional list of columns to read.
+        location (str): Optional location key to read.
+        file_format (str): 'parquet' or 'ipc'.
+
+    Returns:
+        pyarrow.Table: The matching rows ordered by created_at.
+    """
+
+    dataset = ds.dataset(root, format=FORMATS[file_format], partitioning=PARTITIONING,
+                         filesystem=pyarrow.fs.LocalFileSystem(use_mmap=True))
+
+    condition = None
+
+    def add(expression):
+        return expression if condition is None else condition & expression
+
+    if start is not None:
+        start = _utc(start)
+        condition = add((ds.field('month') >= start.strftime("%Y-%m")) & (ds.field('created_at') >= start))
+    if end is not None:
+        end = _utc(end)
+        condition = add((ds.field('month') <= end.strftime("%Y-%m")) & (ds.field('created_at') < end))
+    if location is not None:
+        condition = add(ds.field('location') == location)
+
+    table = dataset.to_table(columns=columns, filter=condition)
+
+    if 'created_at' in table.column_names:
+        table = table.sort_by([('created_at', 'ascending')])
+
+    return table
+
+
+def load_observations(root, start=None, end=None, location=None, file_format='parquet'):
+    """
+    Loads archived rows into the columns used by the analytics module.
+
+    Args:
+        root (str): Archive directory.
+        start (datetime.datetime): Optional inclusive lower bound of created_at.
+        end (datetime.datetime): Optional exclusive upper bound of created_at.
+        location (str): Optional location key to read.
+        file_format (str): 'parquet' or 'ipc'.
+
+    Returns:
+        analytics.Observations: The columnar observations.
+    """
+
+    table = read(root, start, end, ['created_at', 'temperature_c', 'condition_text'], location, file_format)
+
+    created_at = table['created_at'].to_numpy().astype('datetime64[s]')
+    temperature_c = table['temperature_c'].to_numpy(zero_copy_only=False).astype(float)
+    condition_text = table['condition_text'].to_numpy(zero_copy_only=False).astype(object)
+
+    return analytics.Observations(created_at, temperature_c, condition_text)
+
+
+def get_dashboard_data(root, location=None, now=None, file_format='parquet'):
+    """
+    Builds the dashboard sections from the archive instead of the database.
+
+    Returns the same 'last_data' and 'seven_days' shapes as the get_last_data and
+    get_last_seven_days stored functions, so the result can be passed to
+    dashboard_generator.render_html.
+
+    Args:
+        root (str): Archive directory.
+        location (str): Optional location key to read.
+        now (datetime.datetime): Current UTC time (defaults to now).
+        file_format (str): 'parquet' or 'ipc'.
+
+    Returns:
+        dict: A dictionary with 'last_data' and 'seven_days' keys.
+    """
+
+    now = _utc(now or datetime.datetime.now(datetime.timezone.utc))
+    today = now.date()
+
+    # Read the last few days only; that covers the 12 latest readings in practice
+    table = read(root, start=datetime.datetime.combine(today - datetime.timedelta(days=8), datetime.time()),
+                 columns=['created_at', 'temperature_c', 'humidity', 'wind_speed', 'pressure', 'condition_text'],
+                 location=location, file_format=file_format)
+
+    last_data = []
+    for row in reversed(table.slice(max(0, table.num_rows - 12)).to_pylist()):
+        created_at = row['created_at'].astimezone(datetime.timezone.utc)
+        last_data.append({
+            'd': created_at.date().isoformat(),
+            't': created_at.time().isoformat(),
+            'temp': row['temperature_c'],
+            'hum': row['humidity'],
+            'wind': row['wind_speed'],
+            'press': row['pressure'],
+            'condition': row['condition_text'],
+        })
+
+    # Daily min/max for the 7 days before today
+    days = pc.strftime(table["created_at"], format="%Y-%m-%d")
+    daily = (pa.table({'day': days, 'temperature_c': table['temperature_c']})
+             .group_by('day')
+             .aggregate([('temperature_c', 'min'), ('temperature_c', 'max')])
+             .sort_by([('day', 'descending')])
+             .to_pylist())
+
+    seven_days = [{'ts': day['day'], 'min_temp': day['temperature_c_min'], 'max_temp': day['temperature_c_max']}
+                  for day in daily if day['day'] < today.isoformat()][:7]
+
+    return {'last_data': last_data, 'seven_days': seven_days}
+
+
+def _utc(value):
+    # Dates, as passed by analytics.py --archive, are midnight UTC
+    if not isinstance(value, datetime.datetime):
+        return datetime.datetime.combine(value, datetime.time(), tzinfo=datetime.timezone.utc)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exports weather_data into a partitioned columnar archive.")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, required=True, help="first day (YYYY-MM-DD)")
+    parser.add_argument("--end", type=datetime.date.fromisoformat, required=True, help="day after the last day")
+    parser.add_argument("--dir", default="archive", help="archive directory")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet", help="file format")
+    args = parser.parse_args()
+
+    supabase_client = db.init()
+    if not supabase_client:
+        print("Supabase client not initialized.")
+        return
+
+    # The rows are streamed page by page and only held as compact Arrow tables
+    try:
+        tables = [rows_to_table(page) for page in db.iter_row_pages(supabase_client, args.start, args.end)]
+    except Exception as e:
+        print(f"An error occured while retrieving rows: {e}")
+        return
+
+    count = export_table(pa.concat_tables(tables), args.dir, args.format) if tables else 0
+    print(f"{count} rows exported to {args.dir}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import data_utils as du
+import db_utils as db
+
+# OpenWeatherMap History API; it returns at most one week of hourly readings per call
+HISTORY_API_URL = os.environ.get("WEATHER_HISTORY_URL", "https://history.openweathermap.org/data/2.5/history/city")
+
+DEFAULT_CHUNK_HOURS = 24 * 7
+
+
+class HistorySource:
+    """
+    Fetches hourly history from the OpenWeatherMap History API.
+
+    WEATHER_HISTORY_URL can point it at a local fixture server that returns the same JSON.
+    """
+
+    def __init__(self, api_key, url=HISTORY_API_URL, retries=3, backoff=0.5, pool_size=10):
+        self.api_key = api_key
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.session = du.create_session(pool_size=pool_size)
+
+    def fetch(self, location, start, end):
+        """
+        Fetches the readings of a location in [start, end).
+
+        Args:
+            location (dict): A dictionary containing 'lat' and 'lon'.
+            start (datetime.datetime): Start of the range (UTC).
+            end (datetime.datetime): End of the range (UTC).
+
+        Returns:
+            list: Readings shaped like current weather responses, or None if an error occurred.
+        """
+
+        params = {'type': 'hour', 'start': int(start.timestamp()), 'end': int(end.timestamp()) - 1}
+        data = du.fetch_with_retry(self.session, location, self.api_key, retries=self.retries,
+                                   backoff=self.backoff, url=self.url, params=params)
+        return data.get('list', []) if data is not None else None
+
+    def close(self):
+        self.session.close()
+
+
+class FileSource:
+    """
+    Reads readings from a JSON lines file instead of the API, e.g. for tests.
+
+    Every line is a current weather response with 'coord' and 'dt' keys, as returned
+    by data_utils.fetch_weather_data (or synthetic.api_response).
+    """
+
+    def __init__(self, path):
+        self.readings = {}
+
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    reading = json.loads(line)
+                    key = du.location_coordinates(reading['coord'])
+                    self.readings.setdefault(key, []).append(reading)
+
+    def fetch(self, location, start, end):
+        start, end = start.timestamp(), end.timestamp()
+        return [reading for reading in self.readings.get(du.location_coordinates(location), [])
+                if start <= reading['dt'] < end]
+
+    def close(self):
+        pass
+
+
+class RateLimiter:
+    """
+    Token bucket that allows rate calls per second on average, across all threads.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        Args:
+            rate (float): Calls per second.
+            burst (int): Calls that can be made at once after an idle period.
+        """
+
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Waits until a call is allowed.
+        """
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class Checkpoint:
+    """
+    Records the finished chunks in a JSON file, so an interrupted backfill resumes where it stopped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        try:
+            with open(path) as f:
+                self.done = json.load(f).get('done', {})
+        except FileNotFoundError:
+            self.done = {}
+
+    def is_done(self, key):
+        return key in self.done
+
+    def mark_done(self, key, rows):
+        """
+        Records a finished chunk and saves the file atomically.
+
+        Args:
+            key (str): The chunk key.
+            rows (int): Number of stored rows.
+        """
+
+        with self.lock:
+            self.done[key] = rows
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({'done': self.done}, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def split_range(start, end, chunk):
+    """
+    Splits [start, end) into consecutive chunks.
+
+    Args:
+        start (datetime.datetime): Start of the range.
+        end (datetime.datetime): End of the range.
+        chunk (datetime.timedelta): Length of a chunk; the last one may be shorter.
+
+    Returns:
+        list: (chunk start, chunk end) tuples.
+    """
+
+    chunks = []
+    while start < end:
+        chunks.append((start, min(start + chunk, end)))
+        start += chunk
+    return chunks
+
+
+def backfill(supabase_client, source, locations, start, end, chunk_hours=DEFAULT_CHUNK_HOURS, workers=4,
+             rate=None, checkpoint=None):
+    """
+    Fetches and stores the history of the locations in [start, end).
+
+    The range is split into chunks per location, which are fetched in parallel and
+    upserted on (location, created_at), with created_at set to the time of each
+    reading. Finished chunks are recorded in the checkpoint and skipped on the next run.
+
+    Args:
+        supabase_client (Client): Database connection.
+        source (HistorySource): Where the readings come from (HistorySource or FileSource).
+        locations (list): A list of dictionaries containing 'lat' and 'lon'.
+        start (datetime.datetime): Start of the range (UTC).
+        end (datetime.datetime): End of the range (UTC).
+        chunk_hours (int): Hours fetched per call.
+        workers (int): Number of chunks fetched at the same time.
+        rate (float): Optional maximum number of calls per second.
+        checkpoint (Checkpoint): Optional checkpoint of the finished chunks.
+
+    Returns:
+        dict: Counts of 'chunks', 'skipped', 'failed' chunks and stored 'rows'.
+    """
+
+    limiter = RateLimiter(rate) if rate else None
+    chunks = [(location, chunk_start, chunk_end)
+              for location in locations
+              for chunk_start, chunk_end in split_range(start, end, datetime.timedelta(hours=chunk_hours))]
+
+    def chunk_key(location, chunk_start, chunk_end):
+        return f"{du.location_key(location)}|{chunk_start.isoformat()}|{chunk_end.isoformat()}"
+
+    pending = [chunk for chunk in chunks if checkpoint is None or not checkpoint.is_done(chunk_key(*chunk))]
+    stats = {'chunks': len(chunks), 'skipped': len(chunks) - len(pending), 'failed': 0, 'rows': 0}
+    stats_lock = threading.Lock()
+
+    def run(location, chunk_start, chunk_end):
+        key = du.location_key(location)
+
+        if limiter:
+            limiter.acquire()
+
+        readings = source.fetch(location, chunk_start, chunk_end)
+        if readings is None:
+            print(f"Failed to fetch {key} from {chunk_start} to {chunk_end}.")
+            with stats_lock:
+                stats['failed'] += 1
+            return
+
+        rows = [row for row in (du.extract_data(reading, key) for reading in readings) if row]
+
+        with db.WeatherDataWriter(supabase_client, upsert=True) as writer:
+            for row in rows:
+                writer.add(row)
+
+        with stats_lock:
+            stats['rows'] += writer.stored
+            if writer.errors:
+                stats['failed'] += 1
+
+        if writer.errors:
+            print(f"{len(writer.errors)} rows of {key} from {chunk_start} to {chunk_end} could not be stored.")
+        elif checkpoint is not None:
+            checkpoint.mark_done(chunk_key(location, chunk_start, chunk_end), writer.stored)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for future in [executor.submit(run, *chunk) for chunk in pending]:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Backfill chunk failed: {e}")
+                with stats_lock:
+                    stats['failed'] += 1
+
+    return stats
+
+
+def parse_time(value):
+    """
+    Parses an ISO date or date-time; values without a timezone are UTC.
+    """
+
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfills the weather history of a date range.")
+    parser.add_argument("--start", type=parse_time, required=True, help="start of the range (YYYY-MM-DD[THH:MM])")
+    parser.add_argument("--end", type=parse_time, required=True, help="end of the range, exclusive")
+    parser.add_argument("--locations", help='semicolon separated "lat,lon" pairs (default: LOCATIONS or LAT/LON)')
+    parser.add_argument("--source", choices=["api", "file"], default="api", help="where the readings come from")
+    parser.add_argument("--file", help="JSON lines file of API responses for --source file")
+    parser.add_argument("--chunk-hours", type=int, default=DEFAULT_CHUNK_HOURS, help="hours fetched per call")
+    parser.add_argument("--workers", type=int, default=4, help="chunks fetched at the same time")
+    parser.add_argument("--rate", type=float, default=1.0, help="maximum API calls per second (0 for no limit)")
+    parser.add_argument("--checkpoint", default="backfill-checkpoint.json", help="file recording the finished chunks")
+    args = parser.parse_args()
+
+    supabase_client = db.init()
+
+    locations = du.parse_locations(args.locations) if args.locations else du.get_locations()
+
+    if args.source == "file":
+        if not args.file:
+            parser.error("--source file needs --file")
+        source = FileSource(args.file)
+    else:
+        source = HistorySource(du.get_api_key()['api_key'], pool_size=args.workers)
+
+    try:
+        stats = backfill(supabase_client, source, locations, args.start, args.end, args.chunk_hours,
+                         args.workers, args.rate, Checkpoint(args.checkpoint))
+    finally:
+        source.close()
+
+    print(f"{stats['rows']} rows stored from {stats['chunks'] - stats['skipped']} chunks "
+          f"({stats['skipped']} already done, {stats['failed']} failed).")
+
+    # The rollup triggers already recompute every touched day; rebuilding the range once
+    # also fills in the days of databases whose rollups predate the triggers
+    if stats['rows']:
+        end_day = args.end.date() + datetime.timedelta(days=1 if args.end.time() != datetime.time() else 0)
+        db.rebuild_rollups(supabase_client, args.start.date(), end_day)
+
+    if stats['failed']:
+        print("Run the same command again to retry the failed chunks.")
+
+
+if __name__ == "__main__":
+    main()
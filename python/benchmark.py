@@ -0,0 +1,367 @@
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import dashboard_generator as dash_gen
+import data_utils as du
+import db_utils as db
+import extraction
+import observations
+import storage
+import synthetic
+
+# Row counts of the rendered readings table
+RENDER_SIZES = (12, 100, 1000, 10000)
+
+
+def stored_function_calls(now, location):
+    """
+    Returns the calls of the stored functions in sql/stored_functions.sql, as (name, parameters) pairs.
+    """
+
+    month = {'current_month': now.month, 'current_year': now.year}
+    yesterday = now.date() - datetime.timedelta(days=1)
+    previous = du.shift_month(now.year, now.month, -1)
+
+    return [
+        ('get_last_data', {}),
+        ('get_last_data', {'p_location': location}),
+        ('get_last_seven_days', {}),
+        ('get_location_seven_days', {'p_location': location}),
+        ('get_rainy_days', month),
+        ('hour_avg_temp', dict(month, current_hour=now.hour)),
+        ('count_cold_days', month),
+        ('count_warm_days', month),
+        ('period_stats', {'p_years': [now.year, previous[0]], 'p_months': [now.month, previous[1]],
+                          'current_hour': now.hour}),
+        ('dashboard_snapshot', dict(month, current_hour=now.hour)),
+        ('dashboard_snapshot', dict(month, current_hour=now.hour, p_location=location)),
+        ('rebuild_weather_rollups', {'start_day': yesterday.isoformat(), 'end_day': now.date().isoformat()}),
+    ]
+
+
+def measure(function, repeat):
+    """
+    Calls a function repeat times.
+
+    Returns:
+        list: The duration of every call in seconds.
+    """
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def result(name, times, rows=None, **params):
+    """
+    Summarizes the durations of a benchmark.
+
+    Args:
+        name (str): Benchmark name.
+        times (list): Durations in seconds.
+        rows (int): Rows handled by one call, used for the throughput.
+        **params: Parameters of the benchmark.
+
+    Returns:
+        dict: The result as stored in the results file.
+    """
+
+    median = statistics.median(times)
+    entry = {
+        'name': name,
+        'params': params,
+        'runs': len(times),
+        'min_s': min(times),
+        'median_s': median,
+        'mean_s': statistics.mean(times),
+    }
+    if rows is not None:
+        entry['rows'] = rows
+        entry['rows_per_s'] = rows / median if median else None
+
+    print(f"{name:<40} {json.dumps(params):<50} median {median * 1000:10.3f} ms"
+          + (f"  {entry['rows_per_s']:,.0f} rows/s" if entry.get('rows_per_s') else ""))
+    return entry
+
+
+def bench_extract(count, repeat, seed):
+    """
+    Times extract_data on synthetic API responses, and the decoding and extraction
+    of the same responses as JSON lines, one at a time and with BatchExtractor.
+    """
+
+    responses = [synthetic.api_response(row) for row in synthetic.generate_rows(count, seed=seed)]
+    keys = [du.location_key(response['coord']) for response in responses]
+    lines = [json.dumps(response).encode("utf-8") + b"\n" for response in responses]
+
+    def run():
+        for response, key in zip(responses, keys):
+            du.extract_data(response, key)
+
+    def run_lines():
+        for line, key in zip(lines, keys):
+            du.extract_data(json.loads(line), key)
+
+    def run_batch():
+        extractor = extraction.BatchExtractor()
+        extractor.add_lines(lines)
+        return extractor.build()
+
+    decoder = "orjson" if extraction.orjson is not None else "json"
+
+    return [result('extract_data', measure(run, repeat), rows=count, count=count),
+            result('extract_data_json_lines', measure(run_lines, repeat), rows=count, count=count),
+            result('extract_batch_json_lines', measure(run_batch, repeat), rows=count, count=count, decoder=decoder)]
+
+
+def bench_render(count, repeat, seed):
+    """
+    Times generate_html with readings tables of different sizes.
+    """
+
+    rows = list(synthetic.generate_rows(min(count, max(RENDER_SIZES)), locations=1, seed=seed))
+    results = []
+
+    for size in RENDER_SIZES:
+        if size > len(rows):
+            break
+        weather_data = synthetic.dashboard_data(rows[-size:])
+        results.append(result('generate_html', measure(lambda: dash_gen.generate_html(weather_data), repeat),
+                              rows=size, rows_rendered=size))
+
+    return results
+
+
+def bench_memory(count, seed):
+    """
+    Measures the memory of count readings as row dictionaries and as an ObservationBatch.
+    """
+
+    def allocated(build):
+        tracemalloc.start()
+        try:
+            data = build()
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del data
+        return size
+
+    def build_rows():
+        return list(synthetic.generate_rows(count, seed=seed))
+
+    def build_batch():
+        builder = observations.BatchBuilder()
+        builder.extend(synthetic.generate_rows(count, seed=seed))
+        return builder.build()
+
+    results = []
+    for name, build in (('memory_rows', build_rows), ('memory_batch', build_batch)):
+        size = allocated(build)
+        print(f"{name:<40} {json.dumps({'count': count}):<50} {size / 1e6:10.1f} MB  {size / count:,.0f} bytes/row")
+        results.append({'name': name, 'params': {'count': count}, 'bytes': size, 'bytes_per_row': size / count})
+
+    return results
+
+
+def load(backend, count, locations, seed, batch_size):
+    """
+    Streams synthetic rows into the backend through WeatherDataWriter (the bulk store path).
+
+    Returns:
+        dict: The result of the load.
+    """
+
+    rows = synthetic.generate_rows(count, locations=locations, seed=seed)
+
+    start = time.perf_counter()
+    with db.WeatherDataWriter(backend, max_rows=batch_size, max_interval=float("inf")) as writer:
+        for row in rows:
+            writer.add(row)
+    elapsed = time.perf_counter() - start
+
+    if writer.errors:
+        print(f"{len(writer.errors)} rows failed to load, e.g. {writer.errors[0][1]}")
+
+    return result('store_bulk_insert', [elapsed], rows=count, count=count, batch_size=batch_size)
+
+
+def bench_store(backend, count, locations, repeat, seed, batch_size):
+    """
+    Times upserting the newest batch of rows again, which updates every row.
+    """
+
+    rows = list(itertools.islice(synthetic.generate_rows(count, locations=locations, seed=seed),
+                                 max(0, count - batch_size), None))
+
+    def run():
+        with db.WeatherDataWriter(backend, max_rows=batch_size, max_interval=float("inf"), upsert=True) as writer:
+            for row in rows:
+                writer.add(row)
+
+    results = [result('store_bulk_upsert', measure(run, repeat), rows=len(rows), batch_size=batch_size)]
+
+    # One row per statement, as store_weather_data writes
+    single = rows[:min(len(rows), 100)]
+    table = backend.table("weather_data")
+
+    def run_single():
+        for row in single:
+            table.upsert(row, on_conflict="location,created_at").execute()
+
+    results.append(result('store_single_row', measure(run_single, repeat), rows=len(single)))
+    return results
+
+
+def bench_stored_functions(backend, location, repeat):
+    """
+    Times every stored function on the loaded data.
+    """
+
+    now = datetime.datetime.now()
+    results = []
+
+    for name, params in stored_function_calls(now, location):
+        try:
+            times = measure(lambda: backend.rpc(name, params).execute(), repeat)
+        except Exception as e:
+            print(f"{name} failed: {e}")
+            continue
+        results.append(result(f"rpc {name}", times, **params))
+
+    return results
+
+
+def open_backend(name, directory, database_url=None):
+    """
+    Opens a scratch database for the benchmark.
+
+    SQLite and DuckDB files are created in directory. PostgreSQL needs a scratch
+    database with sql/schema.sql and sql/stored_functions.sql applied; the synthetic
+    locations are deleted from it before loading.
+    """
+
+    if name == "sqlite":
+        return storage.SQLiteBackend(os.path.join(directory, "benchmark.db"))
+    if name == "duckdb":
+        return storage.DuckDBBackend(os.path.join(directory, "benchmark.duckdb"))
+
+    return storage.PostgresBackend(database_url)
+
+
+def environment():
+    """
+    Describes the machine and commit the benchmark ran on, so results can be compared.
+    """
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the pipeline on synthetic weather data.")
+    parser.add_argument("--rows", type=synthetic.parse_count, default=synthetic.parse_count("10k"),
+                        help="rows loaded into the database, e.g. 1k, 1M or 100M (default 10k)")
+    parser.add_argument("--locations", type=int, help="number of locations (default: about a year of rows each)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark (default 5)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the synthetic data")
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per bulk write (default 1000)")
+    # The backend defaults to the configured one; sqlite and duckdb time the Python versions of the stored functions
+    db.load_environment()
+    configured = os.environ.get("STORAGE_BACKEND", "").lower()
+    parser.add_argument("--backend", choices=["sqlite", "duckdb", "postgres"],
+                        default=configured if configured in ("sqlite", "duckdb", "postgres") else None,
+                        help="database for the store and stored function benchmarks (default: STORAGE_BACKEND)")
+    parser.add_argument("--database-url",
+                        help="scratch PostgreSQL database for --backend postgres (never a production database)")
+    parser.add_argument("--only", nargs="+", choices=["extract", "render", "memory", "store", "rpc"],
+                        default=["extract", "render", "memory", "store", "rpc"], help="benchmarks to run")
+    parser.add_argument("--out", default="benchmark-results.json", help="results file (JSON)")
+    args = parser.parse_args()
+
+    if ("store" in args.only or "rpc" in args.only) and not args.backend:
+        parser.error("the store and rpc benchmarks need --backend (STORAGE_BACKEND is not sqlite, duckdb or postgres)")
+    if args.backend == "postgres" and not args.database_url:
+        parser.error("--backend postgres needs --database-url")
+
+    locations = args.locations or synthetic.default_locations(args.rows)
+    results = []
+
+    # extract and render work on in-memory data, so they are capped at 100k rows (memory at 1M)
+    if "extract" in args.only:
+        results += bench_extract(min(args.rows, 100000), args.repeat, args.seed)
+    if "render" in args.only:
+        results += bench_render(args.rows, args.repeat, args.seed)
+    if "memory" in args.only:
+        results += bench_memory(min(args.rows, 1000000), args.seed)
+
+    if "store" in args.only or "rpc" in args.only:
+        if args.backend == "postgres":
+            print("Store and stored function benchmarks on the postgres backend (the SQL stored functions).")
+        else:
+            print(f"Store and stored function benchmarks on the {args.backend} backend "
+                  "(Python versions of the stored functions, not the SQL ones).")
+
+        with tempfile.TemporaryDirectory() as directory:
+            backend = open_backend(args.backend, directory, args.database_url)
+            keys = synthetic.location_keys(locations)
+
+            measured = []
+            try:
+                if args.backend == "postgres":
+                    backend.query("delete from weather_data where location = any(?)", (keys,))
+
+                measured.append(load(backend, args.rows, locations, args.seed, args.batch_size))
+
+                if "store" in args.only:
+                    measured += bench_store(backend, args.rows, locations, args.repeat, args.seed, args.batch_size)
+                if "rpc" in args.only:
+                    measured += bench_stored_functions(backend, keys[0], args.repeat)
+            finally:
+                backend.close()
+
+            # Each result names its backend, so sqlite numbers are not read as Postgres ones
+            for entry in measured:
+                entry['params']['backend'] = args.backend
+            results += measured
+
+    report = {
+        'environment': environment(),
+        'settings': {'rows': args.rows, 'locations': locations, 'repeat': args.repeat, 'seed': args.seed,
+                     'batch_size': args.batch_size, 'backend': args.backend},
+        'results': results,
+    }
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    measured_on = f" (store and rpc on {args.backend})" if "store" in args.only or "rpc" in args.only else ""
+    print(f"{len(results)} results written to {args.out}{measured_on}.")
+
+
+if __name__ == "__main__":
+    main()
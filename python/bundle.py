@@ -0,0 +1,224 @@
+import argparse
+import datetime
+import gzip
+import json
+import os
+
+import numpy as np
+
+import data_utils as du
+import db_utils as db
+import observations
+import site_generator as site_gen
+
+# Days of readings per chunk; chunks start on Mondays, so finished weeks never change
+CHUNK_DAYS = 7
+
+# Days of history in the bundle
+DEFAULT_DAYS = 90
+
+# Chunk list of a location's bundle
+MANIFEST_NAME = "index.json"
+
+# 1970-01-01 was a Thursday; shifting by 3 days puts chunk boundaries on Mondays
+_MONDAY_OFFSET = 3
+
+
+def chunk_start(day, chunk_days=CHUNK_DAYS):
+    """
+    Returns the first day of the chunk a day belongs to.
+
+    Args:
+        day (datetime.date): The day.
+        chunk_days (int): Days per chunk.
+
+    Returns:
+        datetime.date: The first day of its chunk.
+    """
+
+    epoch_day = (day - datetime.date(1970, 1, 1)).days
+    return day - datetime.timedelta(days=(epoch_day + _MONDAY_OFFSET) % chunk_days)
+
+
+def encode_chunk(batch):
+    """
+    Encodes readings as compact columnar JSON, newest first.
+
+    Times are seconds after 'start' and conditions are indices into 'conds', so a
+    week of 10 minute readings is about 30 KB before compression and 7 KB after.
+
+    Args:
+        batch (observations.ObservationBatch): The readings of one chunk, ordered by time.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON.
+    """
+
+    batch = batch[::-1]
+    times = batch.created_at.astype(np.int64)
+    start = int(times.min())
+
+    def numbers(values, missing=None):
+        return [None if value == missing or value != value else value for value in values.tolist()]
+
+    chunk = {
+        'start': start,
+        't': (times - start).tolist(),
+        'temp': numbers(batch.temperature_c),
+        'hum': numbers(batch.humidity, observations.MISSING_INT),
+        'wind': numbers(batch.wind_speed),
+        'press': numbers(batch.pressure, observations.MISSING_INT),
+        'cond': batch.condition_codes.tolist(),
+        'conds': batch.conditions,
+    }
+
+    return json.dumps(chunk, separators=(',', ':')).encode("utf-8")
+
+
+def write_file(path, data):
+    """
+    Writes bytes to a file atomically, unless it already has them.
+
+    Returns:
+        bool: True if the file was written.
+    """
+
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def write_bundle(batch, bundle_dir, chunk_days=CHUNK_DAYS):
+    """
+    Writes the readings of one location as precompressed chunks plus a manifest.
+
+    Every chunk is written as <first day>.json.gz, which the page decompresses
+    itself. Compression is deterministic, so chunks of finished weeks are never
+    rewritten. Chunks that are no longer in the bundle are deleted.
+
+    Args:
+        batch (observations.ObservationBatch): The readings.
+        bundle_dir (str): Directory of the location's bundle.
+        chunk_days (int): Days per chunk.
+
+    Returns:
+        dict: The manifest, with 'chunks' listing 'file', 'start', 'end' and 'rows'
+              of every chunk, newest first.
+    """
+
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    batch = batch[~np.isnat(batch.created_at)].sort()
+    days = batch.created_at.astype('datetime64[D]').astype(object)
+    starts = np.array([chunk_start(day, chunk_days) for day in days], dtype=object)
+
+    chunks = []
+    files = {MANIFEST_NAME}
+    boundaries = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1], True]) if len(batch) else []
+
+    for first, last in zip(boundaries[:-1], boundaries[1:]):
+        start = starts[first]
+        data = encode_chunk(batch[first:last])
+        name = f"{start.isoformat()}.json"
+
+        write_file(os.path.join(bundle_dir, name + ".gz"), gzip.compress(data, mtime=0))
+        files.add(name + ".gz")
+
+        chunks.append({'file': name + ".gz", 'start': start.isoformat(),
+                       'end': (start + datetime.timedelta(days=chunk_days - 1)).isoformat(),
+                       'rows': int(last - first)})
+
+    # .json.br chunks were written by earlier versions
+    for name in os.listdir(bundle_dir):
+        if name not in files and name.endswith((".json.gz", ".json.br")):
+            os.remove(os.path.join(bundle_dir, name))
+
+    manifest = {'chunks': chunks[::-1]}
+    write_file(os.path.join(bundle_dir, MANIFEST_NAME), json.dumps(manifest, indent=1).encode("utf-8"))
+    return manifest
+
+
+def bundle_name(location):
+    """
+    Returns the directory name of a location's bundle, named like its page ("44.8_20.46").
+    """
+
+    return site_gen.page_name(location or "index")[:-len(".html")]
+
+
+def load_manifest(bundle_root, location):
+    """
+    Reads the manifest of a location's bundle.
+
+    Returns:
+        dict: The manifest, or None if there is no (readable) bundle.
+    """
+
+    try:
+        with open(os.path.join(bundle_root, bundle_name(location), MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def oldest_inline(weather_data):
+    """
+    Returns the time of the oldest reading shown inline on a page, so the page can
+    skip the bundle rows it already shows.
+
+    Args:
+        weather_data (dict): The page data, with 'last_data' rows as returned by get_last_data.
+
+    Returns:
+        int: Seconds since the epoch (UTC), or None if the page has no readings.
+    """
+
+    times = [du.parse_timestamp(f"{row['d']}T{row['t']}") for row in weather_data.get('last_data') or []
+             if row.get('d') and row.get('t')]
+    if not times:
+        return None
+    return int(min(times).replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes the reading history of every location as "
+                                                 "precompressed chunks that the dashboard loads on demand.")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="days of history (default 90)")
+    parser.add_argument("--chunk-days", type=int, default=CHUNK_DAYS, help="days per chunk (default 7)")
+    parser.add_argument("--archive", metavar="DIR", help="read the readings from this archive instead of the database")
+    parser.add_argument("--dir", default=os.path.join("docs", "bundle"), help="output directory")
+    args = parser.parse_args()
+
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    start = chunk_start(today - datetime.timedelta(days=args.days), args.chunk_days)
+    end = today + datetime.timedelta(days=1)
+
+    if args.archive:
+        import archive
+
+        table = archive.read(args.archive, datetime.datetime.combine(start, datetime.time()),
+                             datetime.datetime.combine(end, datetime.time()))
+        batch = observations.ObservationBatch.from_columns(
+            {name: table[name].to_numpy(zero_copy_only=False) for name in observations.FIELDS})
+    else:
+        batch = observations.load_batch(db.init(), start, end)
+        if batch is None:
+            return
+
+    for location in batch.locations:
+        manifest = write_bundle(batch.for_location(location), os.path.join(args.dir, bundle_name(location)),
+                                args.chunk_days)
+        print(f"{bundle_name(location)}: {len(manifest['chunks'])} chunks.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import datetime
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import metrics
+
+
+class Cache:
+    """
+    On-disk key-value cache backed by SQLite.
+
+    Every entry has its own TTL. When the stored values grow beyond max_bytes,
+    the least recently used entries are evicted. Hit and miss counters are kept
+    both for the current process (hits, misses) and across runs (get_stats).
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, default_ttl=600):
+        """
+        Args:
+            path (str): Path of the SQLite database file (":memory:" for an in-memory cache).
+            max_bytes (int): Maximum total size of the stored values.
+            default_ttl (float): TTL in seconds used when set() is called without one.
+        """
+
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("pragma journal_mode = wal")
+        self.connection.execute("""
+            create table if not exists cache (
+                key text primary key,
+                value text not null,
+                size integer not null,
+                expires_at real not null,
+                last_access real not null
+            )""")
+        self.connection.execute("create index if not exists cache_last_access on cache (last_access)")
+        self.connection.execute("""
+            create table if not exists cache_stats (
+                name text primary key,
+                value integer not null
+            )""")
+
+    def get(self, key):
+        """
+        Returns the cached value for key.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            object: The cached value, or None if the key is missing or expired.
+        """
+
+        now = time.time()
+
+        with self.lock:
+            row = self.connection.execute("select value, expires_at from cache where key = ?",
+                                          (key,)).fetchone()
+
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self.connection.execute("delete from cache where key = ?", (key,))
+                self.misses += 1
+                self._count("misses")
+                return None
+
+            self.connection.execute("update cache set last_access = ? where key = ?", (now, key))
+            self.hits += 1
+            self._count("hits")
+
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores a JSON serializable value.
+
+        Args:
+            key (str): Cache key.
+            value (object): Value to store.
+            ttl (float): Time to live in seconds, or None for the default TTL.
+        """
+
+        now = time.time()
+        encoded = json.dumps(value, default=str)
+        ttl = self.default_ttl if ttl is None else ttl
+
+        with self.lock:
+            self.connection.execute("insert or replace into cache values (?, ?, ?, ?, ?)",
+                                    (key, encoded, len(encoded), now + ttl, now))
+            self._evict(now)
+
+    def get_stats(self):
+        """
+        Returns the hit and miss counters accumulated over all runs.
+
+        Returns:
+            dict: A dictionary with 'hits', 'misses', 'entries' and 'bytes' keys.
+        """
+
+        with self.lock:
+            stats = dict(self.connection.execute("select name, value from cache_stats").fetchall())
+            entries, size = self.connection.execute("select count(*), coalesce(sum(size), 0) from cache").fetchone()
+
+        return {'hits': stats.get('hits', 0), 'misses': stats.get('misses', 0),
+                'entries': entries, 'bytes': size}
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+
+        with self.lock:
+            self.connection.execute("delete from cache")
+
+    def close(self):
+        self.connection.close()
+
+    def _count(self, name):
+        self.connection.execute("insert into cache_stats values (?, 1) "
+                                "on conflict (name) do update set value = value + 1", (name,))
+
+    def _evict(self, now):
+        # Drop expired entries, then the least recently used ones above max_bytes
+        self.connection.execute("delete from cache where expires_at <= ?", (now,))
+        self.connection.execute("""
+            delete from cache where key in (
+                select key from (
+                    select key, sum(size) over (order by last_access desc, key) as total
+                    from cache
+                ) where total > ?
+            )""", (self.max_bytes,))
+
+
+def make_key(endpoint, location=None, params=None):
+    """
+    Derives a cache key from an endpoint, a location and request parameters.
+
+    Args:
+        endpoint (str): API endpoint or stored function name.
+        location (str): Optional location key ("lat,lon").
+        params (dict): Optional request parameters.
+
+    Returns:
+        str: The cache key.
+    """
+
+    encoded = json.dumps([endpoint, location, params or {}], sort_keys=True, default=str)
+    return endpoint + ":" + hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:32]
+
+
+def cached_read(endpoint, ttl, key_period="%Y-%m-%d %H"):
+    """
+    Decorator that caches the result of a db_utils read function.
+
+    The decorated function gets a cache keyword argument; without it the function
+    runs uncached. The key is built from the endpoint, the 'location' argument,
+    the remaining arguments (except the client) and the current period formatted
+    with key_period, so results that depend on the current hour or month are
+    not served after it has passed. None and -1 (errors) are not cached.
+
+    Args:
+        endpoint (str): Name used in the cache key.
+        ttl (float): Time to live in seconds.
+        key_period (str): strftime format of the period the result belongs to.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(supabase_client, *args, cache=None, **kwargs):
+            if cache is None:
+                return function(supabase_client, *args, **kwargs)
+
+            params = dict(kwargs)
+            location = params.pop('location', None)
+            params['args'] = args
+            params['period'] = datetime.datetime.now().strftime(key_period)
+            key = make_key(endpoint, location, params)
+
+            with metrics.span("read", endpoint=endpoint):
+                value = cache.get(key)
+                metrics.annotate(cache_hit=value is not None)
+                if value is not None:
+                    return value
+
+                value = function(supabase_client, *args, **kwargs)
+                if value is not None and value != -1:
+                    cache.set(key, value, ttl)
+                return value
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,173 @@
+from concurrent.futures import ThreadPoolExecutor
+import fcntl
+import heapq
+import itertools
+import os
+import random
+import signal
+import threading
+import time
+
+
+class Job:
+    """
+    A function that runs every interval seconds, with random jitter.
+    """
+
+    def __init__(self, name, function, interval, jitter=0.1):
+        """
+        Args:
+            name (str): Name used in log messages.
+            function (callable): Function called without arguments.
+            interval (float): Seconds between two runs.
+            jitter (float): Fraction of the interval added or subtracted at random.
+        """
+
+        self.name = name
+        self.function = function
+        self.interval = interval
+        self.jitter = jitter
+        self.running = threading.Lock()
+
+    def next_delay(self):
+        return max(0.0, self.interval * (1 + random.uniform(-self.jitter, self.jitter)))
+
+
+class Scheduler:
+    """
+    Runs jobs on their intervals in a thread pool until stop() is called.
+
+    A job is never run twice at the same time: if its previous run is still
+    going when it is due again, that run is skipped.
+    """
+
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.queue = []
+        self.counter = itertools.count()
+        self.stop_event = threading.Event()
+
+    def add(self, job, delay=None):
+        """
+        Schedules a job.
+
+        Args:
+            job (Job): The job to schedule.
+            delay (float): Seconds until the first run. Defaults to a random part of the
+                           interval, so jobs added together don't all run at once.
+        """
+
+        if delay is None:
+            delay = random.uniform(0, job.interval * job.jitter)
+        heapq.heappush(self.queue, (time.monotonic() + delay, next(self.counter), job))
+
+    def run(self):
+        """
+        Runs the jobs until stop() is called, then waits for running jobs to finish.
+        """
+
+        while not self.stop_event.is_set():
+            if not self.queue:
+                self.stop_event.wait(1)
+                continue
+
+            due, _, job = self.queue[0]
+            wait = due - time.monotonic()
+            if wait > 0:
+                self.stop_event.wait(wait)
+                continue
+
+            heapq.heappop(self.queue)
+
+            if job.running.acquire(blocking=False):
+                self.executor.submit(self._run_job, job)
+            else:
+                print(f"Skipping {job.name}: the previous run is still going.")
+
+            # Schedule from the planned time, so runs don't drift
+            next_due = max(due + job.next_delay(), time.monotonic())
+            heapq.heappush(self.queue, (next_due, next(self.counter), job))
+
+        self.executor.shutdown(wait=True)
+
+    def stop(self, *args):
+        """
+        Stops the scheduler. Can be used as a signal handler.
+        """
+
+        self.stop_event.set()
+
+    @staticmethod
+    def _run_job(job):
+        try:
+            job.function()
+        except Exception as e:
+            print(f"Job {job.name} failed: {e}")
+        finally:
+            job.running.release()
+
+
+def acquire_pid_lock(path):
+    """
+    Takes an exclusive lock on a PID file, so that only one daemon runs at a time.
+
+    Args:
+        path (str): Path of the lock file.
+
+    Returns:
+        file: The open lock file (keep it open while running), or None if another daemon holds the lock.
+    """
+
+    lock_file = open(path, "a+")
+
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+
+def run(jobs, pid_file="weather-daemon.pid", max_workers=4, on_stop=None):
+    """
+    Runs jobs until SIGINT or SIGTERM is received.
+
+    Args:
+        jobs (list): The jobs to run.
+        pid_file (str): Lock file that prevents a second daemon from starting.
+        max_workers (int): Maximum number of jobs running at the same time.
+        on_stop (callable): Optional function called after the last job has finished.
+
+    Returns:
+        bool: False if another daemon is already running.
+    """
+
+    lock_file = acquire_pid_lock(pid_file)
+    if lock_file is None:
+        print(f"Another daemon holds {pid_file}, exiting.")
+        return False
+
+    scheduler = Scheduler(max_workers=max_workers)
+    for job in jobs:
+        scheduler.add(job)
+
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+
+    print(f"Daemon started with {len(jobs)} jobs.")
+
+    try:
+        scheduler.run()
+    finally:
+        if on_stop:
+            on_stop()
+        lock_file.close()
+        os.remove(pid_file)
+
+    print("Daemon stopped.")
+    return True
@@ -1,22 +1,13 @@
-def generate_html(weather_data):
-    """
-    Generates a simple HTML page to display the weather data.
+import io
+import json
+import string
 
-    Args:
-        weather_data (dict): A dictionary of dictionaries, where each dictionary
-                                represents a certain part of the site.
+import metrics
 
-    Returns:
-        str: A string containing the generated HTML.
-    """
+# The page is split into templates once, at import time. render_html only
+# substitutes values and writes the pieces to the output in order.
 
-    if not weather_data:
-        return "<p>No weather data available.</p>"
-
-    try:
-
-        # Create static dashboard using HTML and CSS
-        html_content = ("""
+PAGE_HEAD = ("""
             <!DOCTYPE html>
             <html lang="en">
             <head>
@@ -78,7 +69,7 @@ def generate_html(weather_data):
                         height: 100px;
                         margin: 0 auto;
                     }
-                    #historical-data {
+                    #historical-data, #long-range, #older-readings {
                         margin-top: 20px;
                     }
                     table {
@@ -110,34 +101,100 @@ def generate_html(weather_data):
                     <h1>Weather Dashboard</h1>
                     <div id="current-conditions">
                         <div>
-                            <img id="condition-icon" src=\"""" + get_condition_image(
-                                weather_data.get('last_data', {})[0].get('condition', "N/A")) + """\" alt=\"""" +
-                        weather_data.get('last_data', {})[0].get('condition', "N/A") + """\">
-                            <p>""" + weather_data.get('last_data', {})[0].get('condition', "N/A") + """</p>
+                            <img id="condition-icon" src="$icon" alt="$condition">
+                            <p>$condition</p>
                         </div>
                         <div>
-                            <p id="temperature">""" + str(weather_data.get('last_data', {})[0].
-                                                          get('temp', "N/A")) + """&degC</p>
+                            <p id="temperature">$temp&degC</p>
                             <p>Temperature</p>
                         </div>
                         <div>
-                            <p id="humidity">""" + str(weather_data.get('last_data', {})[0].
-                                                       get('hum', "N/A")) + """%</p>
+                            <p id="humidity">$hum%</p>
                             <p>Humidity</p>
                         </div>
                         <div>
-                            <p id="wind">""" + str(weather_data.get('last_data', {})[0].
-                                                   get('wind', "N/A")) + """ m/s</p>
+                            <p id="wind">$wind m/s</p>
                             <p>Wind</p>
                         </div>
                         <div>
-                            <p id="pressure">""" + str(weather_data.get('last_data', {})[0].
-                                                       get('press', "N/A")) + """ mbar</p>
+                            <p id="pressure">$press mbar</p>
                             <p>Pressure</p>
                         </div>
                     </div>
+""")
+
+# Long-range chart of the downsampled series (see downsample.py). The series JSON
+# is embedded between CHART_HEAD and CHART_TAIL and drawn as an SVG by the script.
+CHART_HEAD = """
+                    <div id="long-range">
+                        <h2>Temperature History</h2>
+                        <div id="chart-resolutions"></div>
+                        <svg id="chart" viewBox="0 0 800 240" width="100%" role="img"
+                             aria-label="Temperature history"></svg>
+                        <script type="application/json" id="chart-series">"""
+
+CHART_TAIL = """</script>
+                        <script>
+                            (function () {
+                                var data = JSON.parse(document.getElementById("chart-series").textContent);
+                                var svg = document.getElementById("chart");
+                                var buttons = document.getElementById("chart-resolutions");
+                                var ns = "http://www.w3.org/2000/svg";
+                                var W = 800, H = 240, PAD = 30;
+
+                                function path(points) {
+                                    return points.map(function (p, i) {
+                                        return (i ? "L" : "M") + p[0].toFixed(1) + " " + p[1].toFixed(1);
+                                    }).join("");
+                                }
+
+                                function draw(name) {
+                                    var s = data.series[name];
+                                    var n = s.t.length;
+                                    var lo = Math.min.apply(null, s.min), hi = Math.max.apply(null, s.max);
+                                    var last = s.t[n - 1] || 1;
+                                    var x = function (i) { return PAD + (W - 2 * PAD) * s.t[i] / last; };
+                                    var y = function (v) { return H - PAD - (H - 2 * PAD) * (v - lo) / ((hi - lo) || 1); };
+                                    var upper = [], lower = [], line = [];
+
+                                    for (var i = 0; i < n; i++) {
+                                        upper.push([x(i), y(s.max[i])]);
+                                        lower.unshift([x(i), y(s.min[i])]);
+                                        line.push([x(i), y(s.avg[i])]);
+                                    }
+
+                                    var first = new Date(s.t0 * 1000), end = new Date((s.t0 + last * s.step) * 1000);
+                                    svg.innerHTML = "";
+                                    [["path", {d: path(upper.concat(lower)) + "Z", fill: "#f5cba7"}],
+                                     ["path", {d: path(line), fill: "none", stroke: "#e67e22", "stroke-width": 1.5}],
+                                     ["text", {x: PAD, y: H - 8, "font-size": 12}, first.toISOString().slice(0, 10)],
+                                     ["text", {x: W - PAD, y: H - 8, "font-size": 12, "text-anchor": "end"},
+                                      end.toISOString().slice(0, 10)],
+                                     ["text", {x: 2, y: PAD, "font-size": 12}, hi.toFixed(1) + "\u00b0C"],
+                                     ["text", {x: 2, y: H - PAD, "font-size": 12}, lo.toFixed(1) + "\u00b0C"]
+                                    ].forEach(function (item) {
+                                        var node = document.createElementNS(ns, item[0]);
+                                        for (var key in item[1]) node.setAttribute(key, item[1][key]);
+                                        if (item[2]) node.textContent = item[2];
+                                        svg.appendChild(node);
+                                    });
+                                }
+
+                                Object.keys(data.series).forEach(function (name, i) {
+                                    var button = document.createElement("button");
+                                    button.textContent = name;
+                                    button.onclick = function () { draw(name); };
+                                    buttons.appendChild(button);
+                                    if (!i) draw(name);
+                                });
+                            })();
+                        </script>
+                    </div>
+"""
+
+HISTORY_HEAD = """
                     <div id="historical-data">
-                        <h2>Weather History for the Previous 24 Hours</h2>
+                        <h2>$title</h2>
                         <table>
                             <tr>
                                 <th>Date</th>
@@ -148,27 +205,21 @@ def generate_html(weather_data):
                                 <th>Pressure</th>
                                 <th>Condition</th>
                             </tr>
-            """)
+"""
 
-        # Add rows for each weather data entry
-        for i in range(0, 12):
-            html_content += f"""
+HISTORY_ROW = """
                             <tr>
-                                <td>{weather_data.get('last_data', {})[i].get('d', "N/A")}</td>
-                                <td>{weather_data.get('last_data', {})[i].get('t', "N/A").split('.')[0]}</td>
-                                <td>{"{:.2f}".format(round(weather_data.get('last_data', {})[i].get('temp', "N/A"), 2))}
-                                &degC</td>
-                                <td>{weather_data.get('last_data', {})[i].get('hum', "N/A")}%</td>
-                                <td>{"{:.2f}".format(round(weather_data.get('last_data', {})[i].get('wind', "N/A"), 2))}
-                                m/s</td>
-                                <td>{weather_data.get('last_data', {})[i].get('press', "N/A")} mbar</td>
-                                <td>{weather_data.get('last_data', {})[i].get('condition', "N/A")}</td>
-                                </tr>
-                            """
-
-
+                                <td>{d}</td>
+                                <td>{t}</td>
+                                <td>{temp}&degC</td>
+                                <td>{hum}%</td>
+                                <td>{wind} m/s</td>
+                                <td>{press} mbar</td>
+                                <td>{condition}</td>
+                            </tr>
+"""
 
-        html_content += """
+SEVEN_DAYS_HEAD = """
                         </table>
                     </div>
                     <div id="historical-data">
@@ -179,33 +230,350 @@ def generate_html(weather_data):
                                 <th>Minimum Temperature</th>
                                 <th>Maximum Temperature</th>
                             </tr>
-                    
-            """
+"""
 
-        # Add rows for each weather data entry
-        for data in weather_data.get('seven_days', {}):
-            html_content += f"""
+SEVEN_DAYS_ROW = """
+                            <tr>
+                                <td>{ts}</td>
+                                <td>{min_temp}&degC</td>
+                                <td>{max_temp}&degC</td>
+                            </tr>
+"""
+
+# Readings older than the tables above, loaded on demand from the precompressed
+# chunks written by bundle.py. The chunk list is embedded between OLDER_HEAD and
+# OLDER_TAIL; like SEVEN_DAYS_HEAD, OLDER_HEAD closes the table before it.
+OLDER_HEAD = """
+                        </table>
+                    </div>
+                    <div id="older-readings">
+                        <h2>Older Readings</h2>
+                        <script type="application/json" id="older-chunks">"""
+
+OLDER_TAIL = """</script>
+                        <script>
+                            (function () {
+                                var bundle = JSON.parse(document.getElementById("older-chunks").textContent);
+                                var next = 0;
+                                var button = document.createElement("button");
+                                document.currentScript.parentNode.appendChild(button);
+
+                                function decode(buffer) {
+                                    var bytes = new Uint8Array(buffer);
+                                    // Servers that negotiate Content-Encoding hand over plain JSON
+                                    if (bytes[0] !== 0x1f || bytes[1] !== 0x8b) {
+                                        return Promise.resolve(new TextDecoder().decode(bytes));
+                                    }
+                                    var stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream("gzip"));
+                                    return new Response(stream).text();
+                                }
+
+                                function number(value, digits) {
+                                    return value === null ? "N/A" : digits ? value.toFixed(digits) : String(value);
+                                }
+
+                                function show(chunk) {
+                                    var table = document.getElementById("older-table");
+                                    for (var i = 0; i < chunk.t.length; i++) {
+                                        // The newest readings are already in the tables above
+                                        if (bundle.before && chunk.start + chunk.t[i] >= bundle.before) {
+                                            continue;
+                                        }
+                                        var time = new Date((chunk.start + chunk.t[i]) * 1000).toISOString();
+                                        var row = document.createElement("tr");
+                                        [time.slice(0, 10), time.slice(11, 19), number(chunk.temp[i], 2) + "\u00b0C",
+                                         number(chunk.hum[i]) + "%", number(chunk.wind[i], 2) + " m/s",
+                                         number(chunk.press[i]) + " mbar", chunk.conds[chunk.cond[i]] || "N/A"
+                                        ].forEach(function (text) {
+                                            var cell = document.createElement("td");
+                                            cell.textContent = text;
+                                            row.appendChild(cell);
+                                        });
+                                        table.appendChild(row);
+                                    }
+                                }
+
+                                function label() {
+                                    var chunk = bundle.chunks[next];
+                                    button.textContent = chunk ? "Load " + chunk.start + " to " + chunk.end : "No older readings";
+                                    button.disabled = !chunk;
+                                }
+
+                                button.onclick = function () {
+                                    var chunk = bundle.chunks[next];
+                                    button.disabled = true;
+                                    fetch(bundle.base + chunk.file)
+                                        .then(function (response) { return response.arrayBuffer(); })
+                                        .then(decode)
+                                        .then(function (text) { show(JSON.parse(text)); next++; label(); })
+                                        .catch(function () { button.textContent = "Could not load " + chunk.start; button.disabled = false; });
+                                };
+
+                                if (typeof DecompressionStream === "undefined") {
+                                    button.textContent = "Older readings need a newer browser";
+                                    button.disabled = true;
+                                } else {
+                                    label();
+                                }
+                            })();
+                        </script>
+                        <table id="older-table">
                             <tr>
-                                <td>{data.get('ts', 'N/A')}</td>
-                                <td>{"{:.2f}".format(round(data.get('min_temp', 'N/A'), 2))}&degC</td>
-                                <td>{"{:.2f}".format(round(data.get('max_temp', 'N/A'), 2))}&degC</td>
+                                <th>Date</th>
+                                <th>Time</th>
+                                <th>Temperature</th>
+                                <th>Humidity</th>
+                                <th>Wind</th>
+                                <th>Pressure</th>
+                                <th>Condition</th>
                             </tr>
-                        """
+"""
 
-        html_content += """
+PAGE_TAIL = """
                         </table>
                     </div>
                 </div>
             </body>
             </html>
-            """
-        return html_content
+"""
+
+INDEX_HEAD = """
+                    <div id="historical-data">
+                        <h2>Locations</h2>
+                        <table>
+                            <tr>
+                                <th>Location</th>
+                                <th>Temperature</th>
+                                <th>Condition</th>
+                            </tr>
+"""
+
+INDEX_ROW = """
+                            <tr>
+                                <td><a href="{href}">{name}</a></td>
+                                <td>{temp}&degC</td>
+                                <td>{condition}</td>
+                            </tr>
+"""
+
+# Compiled once and reused for every page
+_page_head = string.Template(PAGE_HEAD).substitute
+_history_head = string.Template(HISTORY_HEAD).substitute
+_history_row = HISTORY_ROW.format
+_seven_days_row = SEVEN_DAYS_ROW.format
+_index_row = INDEX_ROW.format
+
+# The index page shares the page head up to (and including) the title
+PAGE_TITLE = PAGE_HEAD[:PAGE_HEAD.index('                    <div id="current-conditions">')]
+
+
+@metrics.timed("render")
+def generate_html(weather_data):
+    """
+    Generates a simple HTML page to display the weather data.
+
+    Args:
+        weather_data (dict): A dictionary of dictionaries, where each dictionary
+                                represents a certain part of the site.
+
+    Returns:
+        str: A string containing the generated HTML.
+    """
+
+    if not weather_data:
+        return "<p>No weather data available.</p>"
+
+    try:
+        buffer = io.StringIO()
+        render_html(weather_data, buffer)
+        html = buffer.getvalue()
+        metrics.annotate(bytes=len(html))
+        return html
 
     except Exception as e:
         print("Error generating index.html due to the lack of data.")
         return "Error generating index.html due to the lack of data."
 
 
+# Sections of a dashboard page, in page order. PAGE_TAIL follows the last one.
+SECTIONS = ('current', 'chart', 'history', 'seven_days', 'older')
+
+DEFAULT_HISTORY_TITLE = "Weather History for the Previous 24 Hours"
+
+
+@metrics.timed("render")
+def render_html(weather_data, out, history_title=DEFAULT_HISTORY_TITLE):
+    """
+    Writes the HTML page for the weather data to a file object, section by section.
+
+    Every row of 'last_data' and 'seven_days' is rendered, so the tables can hold
+    any number of entries. If weather_data has a 'series' entry (built by
+    downsample.build_series), a long-range chart is added above the tables; its size
+    depends on the number of points, not on the length of the history. A 'bundle'
+    entry (the manifest written by bundle.py plus the 'base' URL of its chunks) adds
+    a reading history whose chunks are fetched only when the reader asks for them.
+
+    Args:
+        weather_data (dict): A dictionary of dictionaries, where each dictionary
+                                represents a certain part of the site.
+        out (file): A text file object the HTML is written to.
+        history_title (str): Heading of the readings table.
+
+    Raises:
+        IndexError: If there are no readings in 'last_data'.
+    """
+
+    metrics.annotate(rows=len(weather_data.get('last_data') or []) + len(weather_data.get('seven_days') or []))
+
+    for name in SECTIONS:
+        render_section(name, weather_data, out.write, history_title)
+
+    out.write(PAGE_TAIL)
+
+
+def render_section(name, weather_data, write, history_title=DEFAULT_HISTORY_TITLE):
+    """
+    Writes one section of the dashboard page.
+
+    Args:
+        name (str): One of SECTIONS.
+        weather_data (dict): The page data, as for render_html.
+        write (callable): Called with each piece of HTML.
+        history_title (str): Heading of the readings table.
+
+    Raises:
+        IndexError: If the 'current' section is rendered without readings in 'last_data'.
+    """
+
+    last_data = weather_data.get('last_data') or []
+
+    if name == 'current':
+        current = last_data[0]
+        condition = current.get('condition', "N/A")
+
+        write(_page_head(icon=get_condition_image(condition),
+                         condition=condition,
+                         temp=current.get('temp', "N/A"),
+                         hum=current.get('hum', "N/A"),
+                         wind=current.get('wind', "N/A"),
+                         press=current.get('press', "N/A")))
+
+    elif name == 'chart':
+        series = weather_data.get('series')
+        if series and series.get('series'):
+            write(CHART_HEAD)
+            # "</" would end the script element early
+            write(json.dumps(series, separators=(',', ':')).replace("</", "<\\/"))
+            write(CHART_TAIL)
+
+    elif name == 'history':
+        write(_history_head(title=history_title))
+
+        # Add rows for each weather data entry
+        for row in last_data:
+            write(_history_row(d=row.get('d', "N/A"),
+                               t=str(row.get('t', "N/A")).split('.')[0],
+                               temp=format_number(row.get('temp')),
+                               hum=row.get('hum', "N/A"),
+                               wind=format_number(row.get('wind')),
+                               press=row.get('press', "N/A"),
+                               condition=row.get('condition', "N/A")))
+
+    elif name == 'seven_days':
+        write(SEVEN_DAYS_HEAD)
+
+        for data in weather_data.get('seven_days') or []:
+            write(_seven_days_row(ts=data.get('ts', 'N/A'),
+                                  min_temp=format_number(data.get('min_temp')),
+                                  max_temp=format_number(data.get('max_temp'))))
+
+    elif name == 'older':
+        bundle = weather_data.get('bundle')
+        if bundle and bundle.get('chunks'):
+            write(OLDER_HEAD)
+            write(json.dumps(bundle, separators=(',', ':')).replace("</", "<\\/"))
+            write(OLDER_TAIL)
+
+    else:
+        raise ValueError(f"Unknown section: {name}")
+
+
+def section_inputs(weather_data, history_title=DEFAULT_HISTORY_TITLE):
+    """
+    Returns the part of the page data each section is rendered from, so a caller can
+    tell which sections changed between two versions of the data.
+
+    Returns:
+        dict: Section name mapped to its JSON serializable input.
+    """
+
+    last_data = weather_data.get('last_data') or []
+
+    return {
+        'current': last_data[:1],
+        'chart': weather_data.get('series'),
+        'history': [history_title, last_data],
+        'seven_days': weather_data.get('seven_days') or [],
+        'older': weather_data.get('bundle'),
+    }
+
+
+def render_index(locations, out):
+    """
+    Writes an index page linking to the dashboard of every location.
+
+    Args:
+        locations (list): A list of (name, href, weather_data) tuples.
+        out (file): A text file object the HTML is written to.
+    """
+
+    write = out.write
+
+    write(PAGE_TITLE)
+    write(INDEX_HEAD)
+
+    for row in index_rows(locations):
+        write(_index_row(**row))
+
+    write(PAGE_TAIL)
+
+
+def index_rows(locations):
+    """
+    Returns the values the index page shows for every location, so a build can
+    tell whether the index changed without comparing the full page data.
+
+    Args:
+        locations (list): A list of (name, href, weather_data) tuples.
+
+    Returns:
+        list: One dictionary per location with 'href', 'name', 'temp' and 'condition'.
+    """
+
+    rows = []
+    for name, href, weather_data in locations:
+        last_data = (weather_data or {}).get('last_data') or [{}]
+        rows.append({'href': href, 'name': name, 'temp': format_number(last_data[0].get('temp')),
+                     'condition': last_data[0].get('condition', "N/A")})
+    return rows
+
+
+def format_number(value):
+    """
+    Formats a number with two decimals.
+
+    Args:
+        value (float): The number to format.
+
+    Returns:
+        str: The formatted number, or "N/A" if value is not a number.
+    """
+
+    if isinstance(value, (int, float)):
+        return f"{value:.2f}"
+    return "N/A"
+
+
 def get_condition_image(condition_text):
     """
     Returns the URL of the weather condition icon based on the condition text.
@@ -1,20 +1,54 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor
+import datetime
 import json
 import os
+import random
+import time
 
-def fetch_weather_data(env):
+import cache as cache_utils
+import metrics
+
+# requests is imported inside the functions that send requests, because importing it
+# takes longer than the rest of a render-only run
+
+# Can be pointed at a local stub server for testing
+API_URL = os.environ.get("WEATHER_API_URL", "https://api.openweathermap.org/data/2.5/weather")
+
+# Status codes that are worth retrying (rate limiting and server errors)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# OpenWeatherMap updates its current conditions roughly every 10 minutes
+API_CACHE_TTL = 600
+
+@metrics.timed("fetch")
+def fetch_weather_data(env, cache=None):
     """
     Fetches weather data from Wunderground (still not this one) API.
 
     Args:
         env (dict): A dictionary containing lat, lon and API key for the weather service.
+        cache (cache.Cache): Optional cache for API responses.
     Returns:
         dict: A dictionary containing the weather data, or None if an error occurred.
     """
 
+    if cache is not None:
+        key = weather_cache_key(env)
+        data = cache.get(key)
+        metrics.annotate(cache_hit=data is not None)
+        if data is not None:
+            return data
+
+        data = fetch_weather_data(env)
+        if data is not None:
+            cache.set(key, data, API_CACHE_TTL)
+        return data
+
+    import requests
+
     try:
         # Construct the API URL
-        api_url = (f"https://api.openweathermap.org/data/2.5/weather?lat={env['lat']}&lon={env['lon']}" +
+        api_url = (f"{API_URL}?lat={env['lat']}&lon={env['lon']}" +
                    f"&appid={env['api_key']}&units=metric")
 
         # Make the API request
@@ -22,6 +56,7 @@ def fetch_weather_data(env):
         response.raise_for_status() # Raise an exception for bad status codes
 
         # Parse the JSON response
+        metrics.annotate(bytes=len(response.content))
         data = response.json()
         return data
 
@@ -32,6 +67,20 @@ def fetch_weather_data(env):
         print (f"Error parsing JSON response: {e}")
         return None
 
+def weather_cache_key(location):
+    """
+    Returns the cache key of the current weather for a location.
+
+    Args:
+        location (dict): A dictionary containing 'lat' and 'lon'.
+
+    Returns:
+        str: The cache key.
+    """
+
+    return cache_utils.make_key("weather", location_key(location), {'units': 'metric'})
+
+
 def get_api_key():
     api_key = os.environ.get("API_KEY")
     lat = os.environ.get("LAT")
@@ -40,12 +89,242 @@ def get_api_key():
     return result
 
 
-def extract_data(weather_data):
+def get_locations():
+    """
+    Reads the list of tracked locations from the environment.
+
+    LOCATIONS holds semicolon separated "lat,lon" pairs (e.g. "44.8,20.46;45.25,19.84").
+    LOCATIONS_FILE can point to a file with one "lat,lon" pair per line instead.
+    If neither is set, the single LAT/LON pair is used.
+
+    Returns:
+        list: A list of dictionaries with 'lat' and 'lon' keys.
+    """
+
+    raw = os.environ.get("LOCATIONS", "")
+    locations_file = os.environ.get("LOCATIONS_FILE")
+
+    if locations_file:
+        with open(locations_file) as f:
+            raw = ";".join(f.read().splitlines())
+
+    locations = parse_locations(raw)
+
+    if not locations:
+        env = get_api_key()
+        locations.append({'lat': env['lat'], 'lon': env['lon']})
+
+    return locations
+
+
+def parse_locations(raw):
+    """
+    Parses semicolon separated "lat,lon" pairs. Empty pairs and pairs starting with # are skipped.
+
+    Args:
+        raw (str): The pairs, e.g. "44.8,20.46;45.25,19.84".
+
+    Returns:
+        list: A list of dictionaries with 'lat' and 'lon' keys.
+    """
+
+    locations = []
+    for pair in raw.split(";"):
+        pair = pair.strip()
+        if not pair or pair.startswith("#"):
+            continue
+        lat, lon = [part.strip() for part in pair.split(",")]
+        locations.append({'lat': lat, 'lon': lon})
+
+    return locations
+
+
+def create_session(pool_size=10):
+    """
+    Creates an HTTP session with a keep-alive connection pool.
+
+    Args:
+        pool_size (int): Maximum number of pooled connections per host.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@metrics.timed("fetch")
+def fetch_with_retry(session, location, api_key, retries=3, backoff=0.5, timeout=10, url=None, params=None):
+    """
+    Fetches weather data for one location, retrying on 429 and 5xx responses.
+
+    Args:
+        session (requests.Session): Shared session used for the request.
+        location (dict): A dictionary containing 'lat' and 'lon'.
+        api_key (str): API key for the weather service.
+        retries (int): Number of retries after the first attempt.
+        backoff (float): Base delay in seconds, doubled after every attempt.
+        timeout (float): Request timeout in seconds.
+        url (str): Endpoint to call. Defaults to the current weather API_URL.
+        params (dict): Optional extra query parameters.
+
+    Returns:
+        dict: A dictionary containing the weather data, or None if an error occurred.
+    """
+
+    import requests
+
+    params = dict({'lat': location['lat'], 'lon': location['lon'], 'appid': api_key, 'units': 'metric'},
+                  **(params or {}))
+
+    for attempt in range(retries + 1):
+        try:
+            metrics.annotate(retries=attempt)
+            response = session.get(url or API_URL, params=params, timeout=timeout)
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+                # Honour Retry-After if the server sent one, otherwise back off exponentially
+                retry_after = response.headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    delay = float(retry_after)
+                else:
+                    delay = backoff * (2 ** attempt) + random.uniform(0, backoff)
+                time.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            metrics.annotate(bytes=len(response.content))
+            return response.json()
+
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt < retries:
+                time.sleep(backoff * (2 ** attempt) + random.uniform(0, backoff))
+                continue
+            print(f"Error fetching weather data for {location['lat']},{location['lon']}: {e}")
+            return None
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching weather data for {location['lat']},{location['lon']}: {e}")
+            return None
+        except json.JSONDecodeError as e:
+            print(f"Error parsing JSON response: {e}")
+            return None
+
+    return None
+
+
+def fetch_weather_data_batch(locations, api_key, max_in_flight=10, retries=3, backoff=0.5, keyed=False,
+                             cache=None):
+    """
+    Fetches and extracts weather data for many locations concurrently.
+
+    All requests share one keep-alive connection pool and at most max_in_flight
+    requests are running at the same time.
+
+    Args:
+        locations (list): A list of dictionaries containing 'lat' and 'lon'.
+        api_key (str): API key for the weather service.
+        max_in_flight (int): Maximum number of concurrent requests.
+        retries (int): Number of retries on 429/5xx responses and connection errors.
+        backoff (float): Base delay in seconds between retries.
+        keyed (bool): True if results should carry 'location' and 'created_at' keys for upserts.
+        cache (cache.Cache): Optional cache for API responses.
+
+    Returns:
+        list: extract_data results in the same order as locations (None for failed locations).
+    """
+
+    if not locations:
+        return []
+
+    workers = max(1, min(max_in_flight, len(locations)))
+
+    def fetch_one(location):
+        data = fetch_location(session, location, api_key, retries, backoff, cache)
+        if not data:
+            return None
+        return extract_data(data, location_key(location) if keyed else None)
+
+    with create_session(pool_size=workers) as session:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fetch_one, locations))
+
+
+def fetch_location(session, location, api_key, retries=3, backoff=0.5, cache=None):
+    """
+    Fetches the raw weather data of one location, answering from the cache when possible.
+
+    Args:
+        session (requests.Session): Shared session used for the request.
+        location (dict): A dictionary containing 'lat' and 'lon'.
+        api_key (str): API key for the weather service.
+        retries (int): Number of retries on 429/5xx responses and connection errors.
+        backoff (float): Base delay in seconds between retries.
+        cache (cache.Cache): Optional cache for API responses.
+
+    Returns:
+        dict: The API response, or None if an error occurred.
+    """
+
+    # fetch_with_retry's span is merged into this one
+    with metrics.span("fetch"):
+        data = cache.get(weather_cache_key(location)) if cache is not None else None
+        if cache is not None:
+            metrics.annotate(cache_hit=data is not None)
+
+        if data is None:
+            data = fetch_with_retry(session, location, api_key, retries=retries, backoff=backoff)
+            if data and cache is not None:
+                cache.set(weather_cache_key(location), data, API_CACHE_TTL)
+
+    return data
+
+
+def location_coordinates(location):
+    """
+    Returns the coordinates of a location rounded like the 'coord' of API responses,
+    so that "44.80" and 44.8 compare equal.
+
+    Args:
+        location (dict): A dictionary containing 'lat' and 'lon'.
+
+    Returns:
+        tuple: (lat, lon) floats.
+    """
+
+    return round(float(location['lat']), 4), round(float(location['lon']), 4)
+
+
+def location_key(location):
+    """
+    Returns the string used to identify a location in the database.
+
+    Args:
+        location (dict): A dictionary containing 'lat' and 'lon'.
+
+    Returns:
+        str: The location as a "lat,lon" string.
+    """
+
+    return f"{location['lat']},{location['lon']}"
+
+
+@metrics.timed("extract")
+def extract_data(weather_data, location=None):
     """
     Extracts relevant weather data from the API response.
 
     Args:
         weather_data (dict): A dictionary containing the weather data.
+        location (str): Optional location key. If given, 'location' and 'created_at'
+                        (the observation time reported by the API) are added, so the
+                        row can be upserted idempotently.
 
     Returns:
         dict: A dictionary containing the extracted data, or None if input is invalid.
@@ -72,9 +351,10 @@ def extract_data(weather_data):
             'condition_text': condition_text
         }
 
-        ##
-        print(extracted_data)
-        ##
+        if location is not None:
+            extracted_data['location'] = location
+            extracted_data['created_at'] = datetime.datetime.fromtimestamp(
+                weather_data["dt"], tz=datetime.timezone.utc).isoformat()
 
         return extracted_data
 
@@ -83,4 +363,51 @@ def extract_data(weather_data):
         return None
     except TypeError as e:
         print(f"Error: Type error accessing weather data: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def parse_timestamp(value):
+    """
+    Parses a timestamp returned by the database into a naive UTC datetime.
+
+    Args:
+        value (str): ISO 8601 timestamp, e.g. "2025-03-01T10:00:00.12345+00:00".
+
+    Returns:
+        datetime.datetime: The timestamp in UTC without tzinfo.
+    """
+
+    if isinstance(value, datetime.datetime):
+        timestamp = value
+    else:
+        value = value.replace("Z", "+00:00").replace(" ", "T")
+
+        # Python 3.9 only accepts 3 or 6 fraction digits
+        if "." in value:
+            head, rest = value.split(".", 1)
+            digits = len(rest) - len(rest.lstrip("0123456789"))
+            value = head + "." + rest[:digits].ljust(6, "0")[:6] + rest[digits:]
+
+        timestamp = datetime.datetime.fromisoformat(value)
+
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return timestamp
+
+
+def shift_month(year, month, months):
+    """
+    Moves a month forwards or backwards, rolling over the year.
+
+    Args:
+        year (int): The year.
+        month (int): The month (1-12).
+        months (int): Number of months to move; negative moves back.
+
+    Returns:
+        tuple: The (year, month) of the resulting month, e.g. (2024, 12) for (2025, 1, -1).
+    """
+
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
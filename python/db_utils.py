@@ -1,19 +1,76 @@
-from dotenv import load_dotenv
 import os
-from supabase import create_client, Client
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import logging
+import threading
+import time
+
+from cache import cached_read
+import data_utils as du
+import metrics
+
+# Dashboard reads are cached for 5 minutes
+DB_CACHE_TTL = 300
+
+# Per-query success messages go to the debug level, so every dashboard render doesn't print them
+logger = logging.getLogger(__name__)
+
+
+def load_environment():
+    """
+    Loads environment variables from the nearest .env file.
+
+    The file is searched from this directory upwards, like load_dotenv() does,
+    but python-dotenv is only imported if a .env file exists.
+    """
+
+    path = os.path.dirname(os.path.abspath(__file__))
+
+    while True:
+        env_file = os.path.join(path, ".env")
+        if os.path.isfile(env_file):
+            from dotenv import load_dotenv
+            load_dotenv(env_file)
+            return
+
+        parent = os.path.dirname(path)
+        if parent == path:
+            return
+        path = parent
+
+
+def is_configured():
+    """
+    Checks whether init() has the settings it needs, without importing any client library.
+
+    Returns:
+        bool: False if the Supabase backend is selected and SUPABASE_URL or SUPABASE_KEY is not set.
+    """
+
+    if os.environ.get("STORAGE_BACKEND", "supabase").lower() != "supabase":
+        return True
+    return bool(os.environ.get("SUPABASE_URL") and os.environ.get("SUPABASE_KEY"))
 
 
 def init():
     """
     Initializes the database connection and creates a client.
 
+    STORAGE_BACKEND selects the storage: "supabase" (default), "postgres",
+    "sqlite" or "duckdb" (see storage.py). The other backends offer the same
+    calls as the Supabase client, so every function in this module works with them.
+
     Returns:
         Client: Database connection.
     """
 
     # Load environment variables from .env file
-    load_dotenv()
+    load_environment()
+
+    backend = os.environ.get("STORAGE_BACKEND", "supabase").lower()
+    if backend != "supabase":
+        import storage
+        return metrics.instrument(storage.create_backend(backend))
 
     # Supabase setup
     supabase_url = os.environ.get("SUPABASE_URL")
@@ -21,13 +78,67 @@ def init():
 
     # Initialize Supabase client
     if supabase_url and supabase_key:
+        # The Supabase client pulls in httpx, postgrest, realtime, storage3 and gotrue,
+        # so it's only imported when a client is created
+        from supabase import create_client, Client
+
         supabase_client: Client = create_client(supabase_url, supabase_key)  # Type hint
     else:
         print("Error: SUPABASE_URL or SUPABASE_KEY is not set.")
         supabase_client = None
 
-    return supabase_client
+    # Every RPC and table query is timed
+    return metrics.instrument(supabase_client)
+
+
+class LazyClient:
+    """
+    Database client that is only created by init() when it is first used.
+
+    Dashboard reads that are answered from the cache never touch the client, so a
+    render from a warm cache doesn't import or connect to the database at all.
+    """
+
+    def __init__(self, factory=None):
+        """
+        Args:
+            factory (callable): Function that creates the client. Defaults to init.
+        """
+
+        self._factory = factory or init
+        self._client = None
+        self._created = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns:
+            Client: The database client, created on the first call (None if it couldn't be created).
+        """
 
+        with self._lock:
+            if not self._created:
+                self._client = self._factory()
+                self._created = True
+        return self._client
+
+    def __bool__(self):
+        # Answered from the settings until the client exists, so that the
+        # "client not initialized" checks don't create it
+        if not self._created and not is_configured():
+            self.get()  # Reports the missing settings
+        if self._created:
+            return self._client is not None
+        return True
+
+    def __getattr__(self, name):
+        client = self.get()
+        if client is None:
+            raise AttributeError(f"Database client not initialized, cannot access {name}.")
+        return getattr(client, name)
+
+
+@metrics.timed("store")
 def store_weather_data(weather_data, supabase_client):
     """
     Stores weather data in the Supabase database.
@@ -35,35 +146,325 @@ def store_weather_data(weather_data, supabase_client):
     Args:
         weather_data (dict): A dictionary containing the weather data.
         supabase_client (Client): Database connection.
+
+    Returns:
+        bool: True if the data was stored, False otherwise.
     """
 
     if not supabase_client:
         print("Supabase client not initialized.")
-        return None
+        return False
 
     table_name = "weather_data"
 
     try:
         # Insert the data into the Supabase table
         response = supabase_client.table(table_name).insert(weather_data).execute()
-
-        ##
-        print(f"Supabase response: {response}")
-        ##
+        metrics.annotate(rows=len(response.data or []))
 
         if response.data:
             print("Data successfully stored in Supabase.")
-        else:
-            print("Error inserting data into Supabase.")
+            return True
+        print("Error inserting data into Supabase.")
     except Exception as e:
         print(f"An error occured while storing data: {e}")
+    return False
 
-def get_data_from_database(supabase_client):
+class WeatherDataWriter:
+    """
+    Buffers extracted observations and writes them as multi-row inserts.
+
+    The buffer is flushed when it holds max_rows rows or when the oldest buffered
+    row is older than max_interval seconds (checked whenever a row is added), and
+    on close(). Rows that fail are reported one by one in the errors list.
+
+    With upsert=True the rows are upserted on the on_conflict columns, so retries
+    and re-runs don't create duplicate rows. This needs the 'location' column and
+    unique index from sql/schema.sql, and rows created with extract_data(..., location).
+    """
+
+    def __init__(self, supabase_client, max_rows=500, max_interval=5.0, upsert=False,
+                 on_conflict="location,created_at"):
+        """
+        Args:
+            supabase_client (Client): Database connection.
+            max_rows (int): Number of buffered rows that triggers a flush.
+            max_interval (float): Age in seconds of the oldest buffered row that triggers a flush.
+            upsert (bool): True if rows should be upserted instead of inserted.
+            on_conflict (str): Comma separated columns used as the upsert key.
+        """
+
+        self.supabase_client = supabase_client
+        self.max_rows = max_rows
+        self.max_interval = max_interval
+        self.upsert = upsert
+        self.on_conflict = on_conflict
+        self.buffer = []
+        self.buffer_started = None
+        self.errors = []
+        self.stored = 0
+        self.lock = threading.Lock()
+
+    def add(self, weather_data):
+        """
+        Adds one observation to the buffer, flushing if a threshold is reached.
+
+        Args:
+            weather_data (dict): A dictionary containing the weather data.
+        """
+
+        with self.lock:
+            if not self.buffer:
+                self.buffer_started = time.monotonic()
+            self.buffer.append(weather_data)
+
+            due = (len(self.buffer) >= self.max_rows or
+                   time.monotonic() - self.buffer_started >= self.max_interval)
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all buffered rows to the database.
+
+        Returns:
+            list: A list of (row, error message) tuples for the rows that failed.
+        """
+
+        with self.lock:
+            rows = self.buffer
+            self.buffer = []
+            self.buffer_started = None
+
+        if not rows:
+            return []
+
+        if self.upsert:
+            rows = self._last_per_key(rows)
+
+        if not self.supabase_client:
+            print("Supabase client not initialized.")
+            errors = [(row, "Supabase client not initialized.") for row in rows]
+            self.errors.extend(errors)
+            return errors
+
+        try:
+            self._write(rows)
+            self.stored += len(rows)
+            return []
+        except Exception as e:
+            print(f"Bulk write of {len(rows)} rows failed, retrying row by row: {e}")
+
+        # Retry one row at a time so that the failing rows can be reported
+        errors = []
+        for row in rows:
+            try:
+                self._write([row])
+                self.stored += 1
+            except Exception as e:
+                errors.append((row, str(e)))
+
+        if errors:
+            print(f"{len(errors)} of {len(rows)} rows could not be stored.")
+        self.errors.extend(errors)
+        return errors
+
+    def close(self):
+        """
+        Flushes the remaining rows.
+
+        Returns:
+            list: A list of (row, error message) tuples for all rows that failed.
+        """
+
+        self.flush()
+        return self.errors
+
+    def _last_per_key(self, rows):
+        """
+        Keeps the last row of every upsert key, because an upsert fails when one
+        statement would update the same row twice. Rows with a missing key column
+        are kept, since nulls never conflict.
+        """
+
+        columns = [column.strip() for column in self.on_conflict.split(",")]
+        positions = {}
+        unkeyed = []
+
+        for position, row in enumerate(rows):
+            key = tuple(row.get(column) for column in columns)
+            if any(value is None for value in key):
+                unkeyed.append(position)
+                continue
+            # The same instant can be written as "+00:00" or "Z"
+            key = tuple(du.parse_timestamp(value) if column == 'created_at' and isinstance(value, str) else value
+                        for column, value in zip(columns, key))
+            positions[key] = position
+
+        if len(positions) + len(unkeyed) == len(rows):
+            return rows
+        return [rows[position] for position in sorted(unkeyed + list(positions.values()))]
+
+    @metrics.timed("store")
+    def _write(self, rows):
+        metrics.annotate(rows=len(rows))
+        table = self.supabase_client.table("weather_data")
+
+        if self.upsert:
+            response = table.upsert(rows, on_conflict=self.on_conflict).execute()
+        else:
+            response = table.insert(rows).execute()
+
+        if not response.data:
+            raise Exception("Database returned no rows.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_rows(supabase_client, start, end, columns="*", page_size=1000):
+    """
+    Retrieves the raw weather_data rows created in [start, end).
+
+    Rows are read in pages ordered by id, so the whole range is fetched with
+    len(rows) / page_size requests.
+
+    Args:
+        supabase_client (Client): Database connection.
+        start (datetime.date): First day of the range.
+        end (datetime.date): Day after the last day of the range.
+        columns (str): Comma separated columns to select (must include id when not "*").
+        page_size (int): Rows fetched per request.
+
+    Returns:
+        list: A list of dictionaries containing the rows, or None if an error occurred.
+    """
+
+    if not supabase_client:
+        print("Supabase client not initialized.")
+        return None
+
+    rows = []
+
+    try:
+        for page in iter_row_pages(supabase_client, start, end, columns, page_size):
+            rows.extend(page)
+
+    except Exception as e:
+        print(f"An error occured while retrieving rows: {e}")
+        return None
+
+    return rows
+
+
+def iter_row_pages(supabase_client, start=None, end=None, columns="*", page_size=1000, after_id=0):
+    """
+    Yields the raw weather_data rows created in [start, end) one page at a time,
+    so a long range can be processed without holding all of its rows.
+
+    The arguments are those of get_rows; without start and end every row is read.
+    With after_id only rows with a greater id are read, which is how new rows are
+    found after a known high-water mark. Errors are raised to the caller.
+
+    Yields:
+        list: Up to page_size row dictionaries, ordered by id.
+    """
+
+    last_id = after_id
+
+    while True:
+        query = supabase_client.table("weather_data").select(columns)
+        if start is not None:
+            query = query.gte("created_at", start.isoformat())
+        if end is not None:
+            query = query.lt("created_at", end.isoformat())
+
+        response = query.gt("id", last_id).order("id").limit(page_size).execute()
+        rows = response.data or []
+
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            break
+        last_id = rows[-1]['id']
+
+
+def rebuild_rollups(supabase_client, start_day=None, end_day=None):
+    """
+    Recomputes the daily and hourly rollup tables from the raw weather data.
+
+    Args:
+        supabase_client (Client): Database connection.
+        start_day (datetime.date): First day to rebuild, or None for the start of the history.
+        end_day (datetime.date): Day after the last day to rebuild, or None for no upper bound.
+
+    Returns:
+        int: Number of rebuilt days, or -1 if an error occurred.
+    """
+
+    if not supabase_client:
+        print("Supabase client not initialized.")
+        return -1
+
+    params = {'start_day': start_day.isoformat() if start_day else None,
+              'end_day': end_day.isoformat() if end_day else None}
+
+    try:
+        response = supabase_client.rpc('rebuild_weather_rollups', params).execute()
+        print(f"Rebuilt rollups for {response.data} days.")
+        return response.data
+
+    except Exception as e:
+        print(f"An error occured while rebuilding rollups: {e}")
+        return -1
+
+
+def maintain_partitions(supabase_client, months_ahead=3, retention_months=None, expired_action="detach"):
+    """
+    Creates upcoming monthly partitions of weather_data and retires expired ones
+    (see maintain_weather_partitions in sql/partitioning.sql).
+
+    Args:
+        supabase_client (Client): Database connection.
+        months_ahead (int): Number of months after the current one to create partitions for.
+        retention_months (int): Months of raw readings to keep, or None to keep everything.
+        expired_action (str): 'detach', 'archive' or 'drop' for expired partitions.
+
+    Returns:
+        list: Dictionaries with 'partition_name' and 'action' keys, or None if an error occurred.
+    """
+
+    if not supabase_client:
+        print("Supabase client not initialized.")
+        return None
+
+    params = {'months_ahead': months_ahead, 'retention_months': retention_months,
+              'expired_action': expired_action}
+
+    try:
+        response = supabase_client.rpc('maintain_weather_partitions', params).execute()
+
+        for change in response.data or []:
+            print(f"Partition {change['partition_name']} {change['action']}.")
+        return response.data or []
+
+    except Exception as e:
+        print(f"An error occured while maintaining partitions: {e}")
+        return None
+
+
+def get_data_from_database(supabase_client, location=None, cache=None):
     """
     Retrieves weather data from the database.
 
     Args:
         supabase_client (Client): Database connection.
+        location (str): Optional location key ("lat,lon") to limit the readings to.
+        cache (cache.Cache): Optional cache for query results.
 
     Returns:
         dict: A dictionary of lists containing the weather data.
@@ -73,19 +474,114 @@ def get_data_from_database(supabase_client):
         print("Supabase client not initialized.")
         return None
 
-    dictionary = {}
+    return get_dashboard_snapshot(supabase_client, location, cache=cache)
+
+
+# Set to False once dashboard_snapshot turns out not to be deployed, so that the fallback is used directly
+_snapshot_rpc_available = True
+
+# Attempts of a dashboard_snapshot call that failed for another reason (timeouts, 5xx errors)
+SNAPSHOT_ATTEMPTS = 3
+
+# Error codes of a function that doesn't exist: PostgREST, HTTP and PostgreSQL (undefined_function)
+MISSING_FUNCTION_CODES = ('PGRST202', '404', '42883')
+
+
+def is_missing_function(error):
+    """
+    Tells whether an RPC error means that the stored function is not deployed.
+
+    Args:
+        error (Exception): The error raised by the call.
+
+    Returns:
+        bool: True for a missing function, False for any other (possibly transient) error.
+    """
+
+    if isinstance(error, NotImplementedError):
+        return True
+    code = getattr(error, 'code', None) or getattr(error, 'sqlstate', None)
+    return code is not None and str(code) in MISSING_FUNCTION_CODES
+
+
+@cached_read('dashboard_snapshot', DB_CACHE_TTL)
+def get_dashboard_snapshot(supabase_client, location=None):
+    """
+    Retrieves every dashboard section with a single dashboard_snapshot RPC call.
+
+    If the stored function isn't deployed, the sections the page shows are fetched
+    with separate calls instead, and the RPC is not tried again. Other errors are
+    retried, and don't disable the RPC.
+
+    Args:
+        supabase_client (Client): Database connection.
+        location (str): Optional location key to limit the readings and the seven-day table to.
+
+    Returns:
+        dict: A dictionary with 'last_data' and 'seven_days' keys (plus the monthly
+              counters when the RPC answers), or None if an error occurred.
+    """
+
+    global _snapshot_rpc_available
+
+    if not _snapshot_rpc_available:
+        return get_dashboard_sections(supabase_client, location)
+
+    now = datetime.datetime.now()
+    params = {'current_hour': now.hour, 'current_month': now.month, 'current_year': now.year}
+    if location:
+        params['p_location'] = location
+
+    for attempt in range(SNAPSHOT_ATTEMPTS):
+        try:
+            response = supabase_client.rpc('dashboard_snapshot', params).execute()
+
+            if response.data:
+                logger.debug("get_dashboard_snapshot: data retrieved from Supabase.")
+                return response.data
+            return get_dashboard_sections(supabase_client, location)
+
+        except Exception as e:
+            if is_missing_function(e):
+                print(f"dashboard_snapshot is not available, falling back to separate calls: {e}")
+                _snapshot_rpc_available = False
+                return get_dashboard_sections(supabase_client, location)
+
+            if attempt + 1 < SNAPSHOT_ATTEMPTS:
+                time.sleep(0.5 * 2 ** attempt)
+                continue
+            print(f"An error occured while retrieving the dashboard snapshot: {e}")
 
-    dictionary['seven_days'] = get_last_seven_days(supabase_client)
-    dictionary['last_data'] = get_last_data(supabase_client)
+    return None
 
-    return dictionary
 
-def get_last_data(supabase_client):
+def get_dashboard_sections(supabase_client, location=None):
+    """
+    Retrieves the dashboard sections that dashboard_generator renders, the latest
+    readings and the seven-day table, with two concurrent RPC calls.
+
+    Args:
+        supabase_client (Client): Database connection.
+        location (str): Optional location key to limit the readings and the seven-day table to.
+
+    Returns:
+        dict: A dictionary with 'last_data' and 'seven_days' keys.
+    """
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        last_data = executor.submit(get_last_data, supabase_client, location)
+        seven_days = executor.submit(get_last_seven_days, supabase_client, location)
+        return {'last_data': last_data.result(), 'seven_days': seven_days.result()}
+
+
+@cached_read('get_last_data', DB_CACHE_TTL)
+def get_last_data(supabase_client, location=None):
     """
     Retrieves last 12 rows from the database.
 
     Args:
         supabase_client (Client): Database connection.
+        location (str): Optional location key to limit the rows to.
 
     Returns: list: A list of dictionaries containing the last 12 rows.
     """
@@ -94,10 +590,13 @@ def get_last_data(supabase_client):
 
     try:
         # Fetch last 12 rows from the weather_data table
-        response = supabase_client.rpc('get_last_data').execute()
+        if location:
+            response = supabase_client.rpc('get_last_data', {'p_location': location}).execute()
+        else:
+            response = supabase_client.rpc('get_last_data').execute()
 
         if response.data:
-            print("Data successfully retrieved from Supabase.")
+            logger.debug("get_last_data: data retrieved from Supabase.")
             return response.data
         else:
             print("Error fetching data from Supabase.")
@@ -108,12 +607,14 @@ def get_last_data(supabase_client):
         return None
 
 
-def get_last_seven_days(supabase_client):
+@cached_read('get_last_seven_days', DB_CACHE_TTL)
+def get_last_seven_days(supabase_client, location=None):
     """
         Retrieves some weather data for the previous seven days.
 
         Args:
             supabase_client (Client): Database connection.
+            location (str): Optional location key to limit the data to.
 
         Returns: list: A list of dictionaries containing the data.
         """
@@ -122,10 +623,13 @@ def get_last_seven_days(supabase_client):
 
     try:
         # Fetch last seven days' data from the weather_data table
-        response = supabase_client.rpc('get_last_seven_days', {}).execute()
+        if location:
+            response = supabase_client.rpc('get_location_seven_days', {'p_location': location}).execute()
+        else:
+            response = supabase_client.rpc('get_last_seven_days', {}).execute()
 
         if response.data:
-            print("Data successfully retrieved from Supabase.")
+            logger.debug("get_last_seven_days: data retrieved from Supabase.")
             return response.data
         else:
             print("Error fetching data from Supabase.")
@@ -136,6 +640,92 @@ def get_last_seven_days(supabase_client):
         return None
 
 
+def current_period(now=None, prev_flag=False):
+    """
+    Returns the month of now, or the month before it.
+
+    Args:
+        now (datetime.datetime): The current time (defaults to now).
+        prev_flag (bool): True for the previous month.
+
+    Returns:
+        tuple: (year, month), rolled over into the previous year in January.
+    """
+
+    now = now or datetime.datetime.now()
+    return du.shift_month(now.year, now.month, -1 if prev_flag else 0)
+
+
+def recent_periods(count=2, now=None):
+    """
+    Returns the current month and the count - 1 months before it, newest first.
+
+    Returns:
+        list: (year, month) tuples.
+    """
+
+    now = now or datetime.datetime.now()
+    return [du.shift_month(now.year, now.month, -offset) for offset in range(count)]
+
+
+@cached_read('period_stats', DB_CACHE_TTL)
+def period_stats(supabase_client, periods, hour=None, rain_condition="Rain", cold_threshold=0, warm_threshold=35,
+                 location=None):
+    """
+    Computes the rainy, cold and warm day counts and the hourly average temperature
+    of several months with one period_stats RPC call.
+
+    The stored function reads every month in one scan, so comparing this month with
+    the last one is a single query instead of eight.
+
+    Args:
+        supabase_client (Client): Database connection.
+        periods (list): (year, month) tuples, e.g. recent_periods(2).
+        hour (int): Hour of the day for 'hour_avg_temp' (defaults to the current hour).
+        rain_condition (str): Condition text of a rainy reading.
+        cold_threshold (float): A day is cold if its minimum temperature is at or below this.
+        warm_threshold (float): A day is warm if its maximum temperature is at or above this.
+        location (str): Optional location key; without one, all locations are counted.
+
+    Returns:
+        list: One dictionary per period, in the order of periods, with 'year', 'month',
+              'rainy_days', 'cold_days', 'warm_days' and 'hour_avg_temp' keys,
+              or None if an error occurred.
+    """
+
+    if not supabase_client:
+        print("Supabase client not initialized.")
+        return None
+
+    periods = [(int(year), int(month)) for year, month in periods]
+    if not periods:
+        return []
+
+    params = {
+        'p_years': [year for year, _ in periods],
+        'p_months': [month for _, month in periods],
+        'current_hour': datetime.datetime.now().hour if hour is None else hour,
+        'rain_condition': rain_condition,
+        'cold_threshold': cold_threshold,
+        'warm_threshold': warm_threshold,
+    }
+    if location:
+        params['p_location'] = location
+
+    try:
+        response = supabase_client.rpc('period_stats', params).execute()
+
+        stats = {(row['year'], row['month']): row for row in response.data or []}
+        return [stats.get(period) or {'year': period[0], 'month': period[1], 'rainy_days': 0, 'cold_days': 0,
+                                      'warm_days': 0, 'hour_avg_temp': None}
+                for period in periods]
+
+    except Exception as e:
+        print(f"An error occured while retrieving period stats: {e}")
+        return None
+
+
+@cached_read('get_rainy_days', DB_CACHE_TTL)
 def count_rainy_days(supabase_client, prev_flag = False):
     """
     Returns the number of rainy days in a current or previous month.
@@ -152,14 +742,7 @@ def count_rainy_days(supabase_client, prev_flag = False):
 
     now = datetime.datetime.now()
 
-    current_month = now.month
-    current_year = now.year
-
-    # Ovde bi moglo da se pristedi na sistemskim pozivima da se negde pre poziva svih funkcija pozove now
-    if prev_flag:
-        current_month -= 1
-        if current_month == 0:
-            current_year -= 1
+    current_year, current_month = current_period(now, prev_flag)
 
     table_name = "weather_data"
 
@@ -169,7 +752,7 @@ def count_rainy_days(supabase_client, prev_flag = False):
                                                           'current_year' : current_year}).execute()
 
         if response.data:
-            print(response.data)
+            logger.debug("count_rainy_days: %s", response.data)
             return response.data
         else:
             # print("Error retrieving data from Supabase.")
@@ -180,6 +763,7 @@ def count_rainy_days(supabase_client, prev_flag = False):
         return -1
 
 
+@cached_read('hour_avg_temp', DB_CACHE_TTL)
 def hour_avg_temp(supabase_client, prev_flag = False):
     """
     Computes average temperature in Celsius during current or previous month's hour.
@@ -197,14 +781,7 @@ def hour_avg_temp(supabase_client, prev_flag = False):
     now = datetime.datetime.now()
 
     current_hour = now.hour
-    current_month = now.month
-    current_year = now.year
-
-    # Ovde bi moglo da se pristedi na sistemskim pozivima da se negde pre poziva svih funkcija pozove now
-    if prev_flag:
-        current_month -= 1
-        if current_month == 0:
-            current_year -= 1
+    current_year, current_month = current_period(now, prev_flag)
 
     table_name = "weather_data"
 
@@ -216,7 +793,7 @@ def hour_avg_temp(supabase_client, prev_flag = False):
                                                          }).execute()
 
         if response.data:
-            print(response.data)
+            logger.debug("hour_avg_temp: %s", response.data)
             return response.data
         else:
             print("Error retrieving data from Supabase.")
@@ -227,6 +804,7 @@ def hour_avg_temp(supabase_client, prev_flag = False):
         return -1
 
 
+@cached_read('count_cold_days', DB_CACHE_TTL)
 def count_cold_days(supabase_client, prev_flag = False):
     """
     Returns the number of cold days in a current or previous month.
@@ -243,14 +821,7 @@ def count_cold_days(supabase_client, prev_flag = False):
 
     now = datetime.datetime.now()
 
-    current_month = now.month
-    current_year = now.year
-
-    # Ovde bi moglo da se pristedi na sistemskim pozivima da se negde pre poziva svih funkcija pozove now
-    if prev_flag:
-        current_month -= 1
-        if current_month == 0:
-            current_year -= 1
+    current_year, current_month = current_period(now, prev_flag)
 
     table_name = "weather_data"
 
@@ -261,7 +832,7 @@ def count_cold_days(supabase_client, prev_flag = False):
                                                          }).execute()
 
         if response.data:
-            print(response.data)
+            logger.debug("count_cold_days: %s", response.data)
             return response.data
         else:
             # print("Error retrieving data from Supabase.")
@@ -272,6 +843,7 @@ def count_cold_days(supabase_client, prev_flag = False):
         return -1
 
 
+@cached_read('count_warm_days', DB_CACHE_TTL)
 def count_warm_days(supabase_client, prev_flag = False):
     """
     Returns the number of warm days in a current or previous month.
@@ -288,14 +860,7 @@ def count_warm_days(supabase_client, prev_flag = False):
 
     now = datetime.datetime.now()
 
-    current_month = now.month
-    current_year = now.year
-
-    # Ovde bi moglo da se pristedi na sistemskim pozivima da se negde pre poziva svih funkcija pozove now
-    if prev_flag:
-        current_month -= 1
-        if current_month == 0:
-            current_year -= 1
+    current_year, current_month = current_period(now, prev_flag)
 
     table_name = "weather_data"
 
@@ -306,7 +871,7 @@ def count_warm_days(supabase_client, prev_flag = False):
                                                          }).execute()
 
         if response.data:
-            print(response.data)
+            logger.debug("count_warm_days: %s", response.data)
             return response.data
         else:
             # print("Error retrieving data from Supabase.")
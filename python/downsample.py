@@ -0,0 +1,288 @@
+import argparse
+import datetime
+import json
+import os
+
+import numpy as np
+
+import db_utils as db
+import observations
+import site_generator as site_gen
+
+# Resolutions of the long-range chart: (name, bucket width in seconds, days of history or None for all)
+RESOLUTIONS = (
+    ('hourly', 3600, 90),
+    ('daily', 86400, None),
+)
+
+# Maximum number of points per resolution, so the chart stays the same size however long the history is
+MAX_POINTS = 1000
+
+# Temperatures are stored with one decimal
+DECIMALS = 1
+
+
+def aggregate(times, values, step):
+    """
+    Aggregates readings into fixed-width time buckets.
+
+    Args:
+        times (numpy.ndarray): Reading times in seconds since the epoch (int64), sorted.
+        values (numpy.ndarray): Reading values (float64, NaN if missing).
+        step (int): Bucket width in seconds.
+
+    Returns:
+        tuple: Bucket start times, and the average, minimum and maximum of every bucket
+               (empty buckets are left out).
+    """
+
+    present = ~np.isnan(values)
+    times, values = times[present], values[present]
+
+    if len(times) == 0:
+        empty = np.array([], dtype=float)
+        return np.array([], dtype=np.int64), empty, empty, empty
+
+    buckets = times - times % step
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+
+    return (buckets[starts],
+            np.add.reduceat(values, starts) / counts,
+            np.minimum.reduceat(values, starts),
+            np.maximum.reduceat(values, starts))
+
+
+def lttb_edges(count, threshold):
+    """
+    Returns the bucket boundaries used by lttb: the first and the last point are
+    buckets of their own and the points in between are split into threshold - 2 buckets.
+
+    Returns:
+        numpy.ndarray: threshold + 1 increasing indices; bucket i is [edges[i], edges[i + 1]).
+    """
+
+    inner = np.floor(np.arange(threshold - 1) * (count - 2) / (threshold - 2)).astype(np.int64) + 1
+    return np.r_[0, inner, count]
+
+
+def lttb(x, y, threshold):
+    """
+    Selects threshold points that keep the visual shape of a series
+    (Largest-Triangle-Three-Buckets).
+
+    Every bucket keeps the point that forms the largest triangle with the point
+    kept in the previous bucket and the average of the next bucket, so peaks and
+    dips survive where plain averaging would flatten them.
+
+    Args:
+        x (numpy.ndarray): Point x values (e.g. times), increasing.
+        y (numpy.ndarray): Point y values.
+        threshold (int): Number of points to keep (at least 3).
+
+    Returns:
+        numpy.ndarray: Indices of the kept points, increasing.
+    """
+
+    count = len(x)
+    if threshold >= count or threshold < 3:
+        return np.arange(count)
+
+    x = x.astype(float)
+    edges = lttb_edges(count, threshold)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+
+    for bucket in range(1, threshold - 1):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+        next_x = x[next_start:next_end].mean()
+        next_y = y[next_start:next_end].mean()
+
+        previous = selected[bucket - 1]
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        selected[bucket] = start + int(np.argmax(areas))
+
+    return selected
+
+
+def downsample(times, average, minimum, maximum, max_points=MAX_POINTS):
+    """
+    Reduces aggregated buckets to at most max_points points.
+
+    The line points are chosen with LTTB on the averages, and every point gets the
+    minimum and maximum of the whole LTTB bucket it represents, so the envelope
+    still shows every extreme.
+
+    Args:
+        times (numpy.ndarray): Bucket start times.
+        average (numpy.ndarray): Bucket averages.
+        minimum (numpy.ndarray): Bucket minimums.
+        maximum (numpy.ndarray): Bucket maximums.
+        max_points (int): Maximum number of points.
+
+    Returns:
+        tuple: The reduced times, averages, minimums and maximums.
+    """
+
+    if len(times) <= max_points:
+        return times, average, minimum, maximum
+
+    selected = lttb(times, average, max_points)
+    edges = lttb_edges(len(times), max_points)[:-1]
+
+    return (times[selected], average[selected],
+            np.minimum.reduceat(minimum, edges), np.maximum.reduceat(maximum, edges))
+
+
+def build_series(times, values, resolutions=RESOLUTIONS, max_points=MAX_POINTS):
+    """
+    Builds the multi-resolution series of one location.
+
+    Times are stored as offsets from 't0' in units of 'step', and values are rounded,
+    so a series of max_points points is a few kilobytes of JSON.
+
+    Args:
+        times (numpy.ndarray): Reading times (datetime64 or seconds since the epoch), sorted.
+        values (numpy.ndarray): Reading values, e.g. temperatures.
+        resolutions (tuple): (name, step, days) tuples, see RESOLUTIONS.
+        max_points (int): Maximum number of points per resolution.
+
+    Returns:
+        dict: 'end', the time of the last reading, and 'series' mapping every
+              resolution name to its 'step', 't0', 't', 'avg', 'min' and 'max'.
+              The same readings always give the same result, so unchanged series
+              don't cause rewrites.
+    """
+
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        times = times.astype('datetime64[s]').astype(np.int64)
+    values = np.asarray(values, dtype=float)
+
+    series = {}
+
+    for name, step, days in resolutions:
+        if days is None:
+            window = slice(None)
+        else:
+            # Windows end at the last reading, not at the current time
+            window = slice(np.searchsorted(times, times[-1] - days * 86400 if len(times) else 0), None)
+
+        bucket_times, average, minimum, maximum = downsample(*aggregate(times[window], values[window], step),
+                                                             max_points=max_points)
+        if len(bucket_times) == 0:
+            continue
+
+        t0 = int(bucket_times[0])
+        series[name] = {
+            'step': step,
+            't0': t0,
+            't': ((bucket_times - t0) // step).tolist(),
+            'avg': np.round(average, DECIMALS).tolist(),
+            'min': np.round(minimum, DECIMALS).tolist(),
+            'max': np.round(maximum, DECIMALS).tolist(),
+        }
+
+    return {'end': int(times[-1]) if len(times) else None, 'series': series}
+
+
+def series_columns(batch):
+    """
+    Splits readings into the reading times and temperatures of every location.
+
+    Args:
+        batch (observations.ObservationBatch): The readings.
+
+    Returns:
+        dict: Location key mapped to (times, values) numpy arrays sorted by time.
+    """
+
+    columns = {}
+    for location in batch.locations:
+        readings = batch.for_location(location).sort()
+        columns[location] = (readings.created_at, readings.temperature_c)
+    return columns
+
+
+def series_name(location):
+    """
+    Returns the file name of a location's series, next to its page ("44.8_20.46.json").
+    """
+
+    return site_gen.page_name(location or "index")[:-len(".html")] + ".json"
+
+
+def dump_series(series, out):
+    json.dump(series, out, separators=(',', ':'))
+
+
+def write_series(series_dir, location, series):
+    """
+    Writes the series of a location, unless the file already has the same content.
+
+    Returns:
+        bool: True if the file was written.
+    """
+
+    os.makedirs(series_dir, exist_ok=True)
+    return site_gen.write_if_changed(os.path.join(series_dir, series_name(location)), dump_series, series)
+
+
+def load_series(series_dir, location):
+    """
+    Reads the series of a location written by write_series.
+
+    Returns:
+        dict: The series, or None if there is no (readable) file.
+    """
+
+    try:
+        with open(os.path.join(series_dir, series_name(location))) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the downsampled long-range chart series of every location.")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, required=True, help="first day (YYYY-MM-DD)")
+    parser.add_argument("--end", type=datetime.date.fromisoformat,
+                        help="day after the last day (default: tomorrow)")
+    parser.add_argument("--archive", metavar="DIR", help="read the readings from this archive instead of the database")
+    parser.add_argument("--dir", default=os.path.join("docs", "series"), help="output directory")
+    parser.add_argument("--max-points", type=int, default=MAX_POINTS, help="maximum points per resolution")
+    args = parser.parse_args()
+
+    end = args.end or datetime.date.today() + datetime.timedelta(days=1)
+
+    if args.archive:
+        import archive
+
+        start = datetime.datetime.combine(args.start, datetime.time())
+        table = archive.read(args.archive, start, datetime.datetime.combine(end, datetime.time()),
+                             ['created_at', 'temperature_c', 'location'])
+        # np.unique can't sort None among strings; rows without a location get "" and,
+        # as in series_columns, the series of the None key
+        locations = table['location'].fill_null("").to_numpy(zero_copy_only=False).astype(str)
+        times = table['created_at'].to_numpy().astype('datetime64[s]')
+        values = table['temperature_c'].to_numpy(zero_copy_only=False).astype(float)
+        columns = {location or None: (times[locations == location], values[locations == location])
+                   for location in np.unique(locations)}
+    else:
+        batch = observations.load_batch(db.init(), args.start, end)
+        if batch is None:
+            return
+        columns = series_columns(batch)
+
+    written = 0
+    for location, (times, values) in columns.items():
+        written += write_series(args.dir, location, build_series(times, values, max_points=args.max_points))
+
+    print(f"Series of {len(columns)} locations built, {written} files updated in {args.dir}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import argparse
+import json
+import time
+
+import data_utils as du
+import db_utils as db
+import observations
+
+# orjson decodes API responses several times faster than the json module; it is optional
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fields of a current weather response, in the order of BatchBuilder.add:
+# (column, path in the response, type, (minimum, maximum) or None, required)
+SCHEMA = (
+    ('created_at', ('dt',), int, (0, 2 ** 40), True),
+    ('temperature_c', ('main', 'temp'), float, (-100, 70), True),
+    ('humidity', ('main', 'humidity'), int, (0, 100), False),
+    ('wind_speed', ('wind', 'speed'), float, (0, 150), False),
+    ('pressure', ('main', 'pressure'), int, (800, 1200), False),
+    ('condition_text', ('weather', 0, 'main'), str, None, False),
+)
+
+# Rows per bulk write with --store
+STORE_BATCH = 1000
+
+
+class Rejected(Exception):
+    """
+    Raised by a compiled schema for a record that doesn't match it; the message is the reason.
+    """
+
+
+def decode(payload):
+    """
+    Decodes one JSON document, with orjson if it is installed.
+
+    Args:
+        payload (bytes or str): The document.
+
+    Returns:
+        object: The decoded value.
+
+    Raises:
+        ValueError: If the payload is not valid JSON.
+    """
+
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def compile_field(path, kind, bounds, required):
+    """
+    Builds the check of one schema field.
+
+    Returns:
+        callable: Function that takes a decoded response and returns the value of
+                  the field (None if it is missing and optional), or raises Rejected.
+    """
+
+    name = ".".join(str(key) for key in path)
+    parents = [".".join(str(key) for key in path[:depth]) for depth in range(len(path))]
+    low, high = bounds or (None, None)
+
+    def lookup(record):
+        # A missing key or list entry is a missing value, but a value of the wrong kind is rejected
+        value = record
+        for parent, key in zip(parents, path):
+            if value is None:
+                return None
+            if isinstance(key, int):
+                if not isinstance(value, list):
+                    raise Rejected(f"{parent}: expected a list, got {type(value).__name__}")
+                value = value[key] if key < len(value) else None
+            else:
+                if not isinstance(value, dict):
+                    raise Rejected(f"{parent}: expected an object, got {type(value).__name__}")
+                value = value.get(key)
+        return value
+
+    def check(record):
+        value = record
+        try:
+            for key in path:
+                value = value[key]
+        except (KeyError, IndexError, TypeError):
+            # Only failed lookups take the slower walk that tells missing from malformed
+            value = lookup(record)
+
+        if value is None:
+            if required:
+                raise Rejected(f"{name}: missing")
+            return None
+
+        # bool is a subclass of int, but never a valid reading
+        if kind is str:
+            if not isinstance(value, str):
+                raise Rejected(f"{name}: expected a string, got {type(value).__name__}")
+            return value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise Rejected(f"{name}: expected a number, got {type(value).__name__}")
+        # NaN and infinity fail the range check
+        if low is not None and not low <= value <= high:
+            raise Rejected(f"{name}: {value} out of range [{low}, {high}]")
+        if kind is int and value != int(value):
+            raise Rejected(f"{name}: expected an integer, got {value}")
+        return kind(value)
+
+    return check
+
+
+def compile_schema(schema=SCHEMA):
+    """
+    Turns a schema into a validator, so the field paths, types and ranges are
+    worked out once instead of for every record.
+
+    Args:
+        schema (tuple): (column, path, type, bounds, required) tuples, see SCHEMA.
+
+    Returns:
+        callable: Function that takes a decoded response and returns the list of
+                  field values in schema order, or raises Rejected.
+    """
+
+    checks = [compile_field(path, kind, bounds, required) for _, path, kind, bounds, required in schema]
+
+    def validate(record):
+        if not isinstance(record, dict):
+            raise Rejected(f"expected an object, got {type(record).__name__}")
+        return [check(record) for check in checks]
+
+    return validate
+
+
+class BatchExtractor:
+    """
+    Extracts many API responses straight into typed columns.
+
+    Every response is decoded, checked against a compiled schema and appended to
+    a BatchBuilder, so no row dictionaries are built and missing values are stored
+    as NaN or MISSING_INT instead of "N/A". Responses that can't be decoded or
+    don't match the schema are counted and written to the reject file, if one is
+    given, as JSON lines with the line number, the reason and the original record.
+
+    Attributes:
+        accepted (int): Number of extracted responses.
+        rejected (int): Number of rejected responses.
+    """
+
+    def __init__(self, location=None, rejects=None, schema=SCHEMA, locations=None):
+        """
+        Args:
+            location (str): Location key of every response. Without one, the 'coord'
+                            of every response is matched to the configured locations
+                            and their key is used, so the readings are stored under the
+                            same key as fetched ones; coordinates that match none keep
+                            the number formatting of the API ("44.8,20.46").
+            rejects (file): Optional text file object the rejected records are written to.
+            schema (tuple): The schema the responses are checked against.
+            locations (list): Configured locations, dictionaries with 'lat' and 'lon'
+                              (defaults to data_utils.get_locations()).
+        """
+
+        self.location = location
+        if location is None:
+            configured = du.get_locations() if locations is None else locations
+            self.keys = {du.location_coordinates(place): du.location_key(place)
+                         for place in configured if place['lat'] is not None and place['lon'] is not None}
+            # (lat, lon) of a response mapped to its key, so every coordinate is looked up once
+            self.coord_keys = {}
+        self.rejects = rejects
+        self.validate = compile_schema(schema)
+        self.builder = observations.BatchBuilder()
+        self.accepted = 0
+        self.rejected = 0
+
+    def add(self, payload, line=None):
+        """
+        Extracts one response.
+
+        Args:
+            payload (bytes, str or dict): The response, encoded or already decoded.
+            line (int): Optional line number, for the reject file.
+
+        Returns:
+            bool: True if the response was extracted, False if it was rejected.
+        """
+
+        try:
+            record = decode(payload) if isinstance(payload, (bytes, str)) else payload
+            values = self.validate(record)
+
+            location = self.location
+            if location is None:
+                coord = record.get('coord')
+                if not isinstance(coord, dict) or 'lat' not in coord or 'lon' not in coord:
+                    raise Rejected("coord: missing")
+                try:
+                    location = self.coord_keys.get((coord['lat'], coord['lon']))
+                except TypeError:
+                    raise Rejected("coord: expected numbers")
+                if location is None:
+                    location = self.coord_key(coord)
+
+        except Rejected as e:
+            self.reject(payload, str(e), line)
+            return False
+        except ValueError as e:
+            self.reject(payload, f"invalid JSON: {e}", line)
+            return False
+
+        self.builder.add(*values, location)
+        self.accepted += 1
+        return True
+
+    def coord_key(self, coord):
+        """
+        Returns the location key of a response's 'coord' and remembers it.
+        """
+
+        try:
+            location = self.keys.get(du.location_coordinates(coord)) or du.location_key(coord)
+        except (TypeError, ValueError):
+            raise Rejected("coord: expected numbers")
+
+        self.coord_keys[(coord['lat'], coord['lon'])] = location
+        return location
+
+    def add_lines(self, lines):
+        """
+        Extracts a JSON lines stream of responses; blank lines are skipped.
+        """
+
+        for number, line in enumerate(lines, 1):
+            if line.strip():
+                self.add(line, number)
+
+    def reject(self, payload, reason, line=None):
+        self.rejected += 1
+        if self.rejects is None:
+            return
+
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", errors="replace")
+        if isinstance(payload, str):
+            payload = payload.rstrip("\n")
+        self.rejects.write(json.dumps({'line': line, 'reason': reason, 'record': payload}, default=str) + "\n")
+
+    def build(self):
+        """
+        Returns:
+            observations.ObservationBatch: The extracted readings, in input order.
+        """
+
+        return self.builder.build()
+
+
+def extract_file(path, reject_path=None, location=None):
+    """
+    Extracts a JSON lines file of API responses, e.g. one written for backfill.FileSource.
+
+    Args:
+        path (str): The file.
+        reject_path (str): Optional file the rejected records are written to.
+        location (str): Optional location key of every response.
+
+    Returns:
+        observations.ObservationBatch: The extracted readings.
+    """
+
+    rejects = open(reject_path, "w") if reject_path else None
+    start = time.perf_counter()
+
+    try:
+        extractor = BatchExtractor(location, rejects)
+        with open(path, "rb") as f:
+            extractor.add_lines(f)
+    finally:
+        if rejects is not None:
+            rejects.close()
+
+    elapsed = time.perf_counter() - start
+    total = extractor.accepted + extractor.rejected
+    print(f"{extractor.accepted} records extracted, {extractor.rejected} rejected"
+          + (f" ({total / elapsed:,.0f} records/s)." if elapsed else "."))
+
+    return extractor.build()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extracts a JSON lines file of weather API responses.")
+    parser.add_argument("file", help="JSON lines file with one current weather response per line")
+    parser.add_argument("--rejects", help="file the rejected records are written to, with the reasons")
+    parser.add_argument("--location", help='location key ("lat,lon") of every response (default: their coord)')
+    parser.add_argument("--store", action="store_true", help="upsert the extracted readings into the database")
+    args = parser.parse_args()
+
+    batch = extract_file(args.file, args.rejects, args.location)
+
+    if args.store and len(batch):
+        with db.WeatherDataWriter(db.init(), max_rows=STORE_BATCH, upsert=True) as writer:
+            for start in range(0, len(batch), STORE_BATCH):
+                for row in batch[start:start + STORE_BATCH].to_rows():
+                    writer.add(row)
+        print(f"{writer.stored} rows stored.")
+
+
+if __name__ == "__main__":
+    main()
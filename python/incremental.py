@@ -0,0 +1,343 @@
+import datetime
+import hashlib
+import io
+import json
+import os
+
+import dashboard_generator as dash_gen
+import data_utils as du
+import db_utils as db
+import observations
+import site_generator as site_gen
+
+# State of the incremental refresh, kept in site_generator.state_dir so it isn't published with the pages
+STATE_NAME = "dashboard_state.json"
+
+# Rows created up to this long before the newest row seen are read again by every
+# refresh, so rows committed after a refresh with a slightly older timestamp are not missed
+OVERLAP = datetime.timedelta(hours=2)
+
+# Readings kept per location, as many as get_last_data returns
+RECENT_READINGS = 12
+
+# Days of daily min/max kept: the current and the previous month
+KEPT_DAYS = 62
+
+# Same thresholds as the stored functions in sql/stored_functions.sql
+RAIN_CONDITION = "Rain"
+COLD_THRESHOLD = 0
+WARM_THRESHOLD = 35
+
+# Key of the aggregates over all locations
+ALL = "*"
+
+
+class DashboardState:
+    """
+    Everything the dashboard needs, kept up to date from the rows added since the last refresh.
+
+    The newest created_at seen is the cursor. Ids are allocated when a row is
+    inserted but become visible when its transaction commits, so a cursor on the
+    id would skip rows of slower transactions; instead every refresh reads the rows
+    created since OVERLAP before the cursor, and the ids seen in that window are
+    remembered so no row is counted twice. Per location (and for all locations
+    together) the state keeps the newest readings in a bounded buffer, the daily
+    minimum, maximum and rain flag of the last KEPT_DAYS days, and the temperature
+    sum and count per hour of the current month. Rows that replace existing ones
+    (upserts of the same reading) keep their id and are not seen again.
+
+    Attributes:
+        cursor (str): ISO timestamp of the newest row seen, or None before the first refresh.
+        seen (dict): Id (as a string) mapped to the created_at of every row seen within
+                     OVERLAP of the cursor.
+        locations (dict): Location key (ALL for every location) mapped to its aggregates.
+        fragments (dict): Page name mapped to the rendered HTML of every section and the
+                          hash of the data it was rendered from.
+    """
+
+    def __init__(self, cursor=None, seen=None, locations=None, fragments=None):
+        self.cursor = cursor
+        self.seen = seen or {}
+        self.locations = locations or {}
+        self.fragments = fragments or {}
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads the state from a file.
+
+        Returns:
+            DashboardState: The state, or None if there is no (readable) file.
+        """
+
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            return cls(state['cursor'], state['seen'], state['locations'], state.get('fragments'))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, path):
+        """
+        Writes the state to a file atomically.
+        """
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'cursor': self.cursor, 'seen': self.seen, 'locations': self.locations,
+                       'fragments': self.fragments}, f,
+                      separators=(',', ':'), sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def start(self):
+        """
+        Returns:
+            datetime.datetime: Start (UTC) of the rows the next refresh reads, or None
+                               before the first refresh.
+        """
+
+        if self.cursor is None:
+            return None
+        start = datetime.datetime.fromisoformat(self.cursor) - OVERLAP
+        return start.replace(tzinfo=datetime.timezone.utc)
+
+    def apply(self, rows):
+        """
+        Adds the weather_data rows that weren't seen before to the aggregates and moves the cursor.
+
+        Args:
+            rows (list): Row dictionaries with 'id' and 'created_at'.
+
+        Returns:
+            set: Keys of the locations that changed (ALL included).
+        """
+
+        changed = set()
+
+        for row in rows:
+            row_id = str(row['id'])
+            observation = observations.Observation.from_row(row)
+            if row_id in self.seen or observation.created_at is None:
+                continue
+
+            created_at = observation.created_at.isoformat()
+            self.seen[row_id] = created_at
+            if self.cursor is None or observation.created_at > datetime.datetime.fromisoformat(self.cursor):
+                self.cursor = created_at
+
+            for key in (ALL, observation.location):
+                if key is not None:
+                    self._add(key, observation)
+                    changed.add(key)
+
+        for key in changed:
+            self._prune(self.locations[key])
+
+        # Rows older than the overlap window are never read again
+        if self.cursor is not None:
+            oldest = datetime.datetime.fromisoformat(self.cursor) - OVERLAP
+            self.seen = {row_id: created_at for row_id, created_at in self.seen.items()
+                         if datetime.datetime.fromisoformat(created_at) >= oldest}
+
+        return changed
+
+    def _add(self, key, observation):
+        aggregates = self.locations.setdefault(key, {'recent': [], 'days': {}, 'hours': {}})
+        created_at = observation.created_at.isoformat()
+
+        # Newest readings, oldest first; rows normally arrive in time order and are appended
+        recent = aggregates['recent']
+        reading = observation.to_row()
+        reading['created_at'] = created_at
+        if not recent or created_at >= recent[-1]['created_at']:
+            recent.append(reading)
+        else:
+            recent.insert(next(i for i, kept in enumerate(recent) if kept['created_at'] > created_at), reading)
+        del recent[:-RECENT_READINGS]
+
+        temperature = observation.temperature_c
+        rainy = observation.condition_text == RAIN_CONDITION
+
+        day = aggregates['days'].get(created_at[:10])
+        if day is None:
+            aggregates['days'][created_at[:10]] = [temperature, temperature, rainy]
+        else:
+            if temperature is not None:
+                day[0] = temperature if day[0] is None else min(day[0], temperature)
+                day[1] = temperature if day[1] is None else max(day[1], temperature)
+            day[2] = day[2] or rainy
+
+        if temperature is not None:
+            hours = aggregates['hours'].setdefault(created_at[:7], {})
+            hour = hours.setdefault(str(observation.created_at.hour), [0.0, 0])
+            hour[0] += temperature
+            hour[1] += 1
+
+    @staticmethod
+    def _prune(aggregates):
+        days = aggregates['days']
+        if days:
+            newest = datetime.date.fromisoformat(max(days))
+            oldest = (newest - datetime.timedelta(days=KEPT_DAYS)).isoformat()
+            for day in [day for day in days if day < oldest]:
+                del days[day]
+
+        hours = aggregates['hours']
+        for month in sorted(hours)[:-1]:
+            del hours[month]
+
+    def dashboard_data(self, location=None, now=None):
+        """
+        Builds the page data of a location, in the shape of db_utils.get_data_from_database.
+
+        Everything is computed from the readings of the location (of all
+        locations without one), as dashboard_snapshot does with p_location.
+
+        Args:
+            location (str): Optional location key.
+            now (datetime.datetime): Current UTC time (defaults to now).
+
+        Returns:
+            dict: The page data, or None if there are no readings.
+        """
+
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        aggregates = self.locations.get(location or ALL)
+        if not aggregates or not aggregates['recent']:
+            return None
+
+        last_data = [observations.Observation.from_row(row).to_dashboard_row()
+                     for row in reversed(aggregates['recent'])]
+
+        today = now.date().isoformat()
+        seven_days = [{'ts': day, 'min_temp': values[0], 'max_temp': values[1]}
+                      for day, values in sorted(aggregates['days'].items(), reverse=True) if day < today][:7]
+
+        month = today[:7]
+        days = [values for day, values in aggregates['days'].items() if day.startswith(month)]
+        total, count = aggregates['hours'].get(month, {}).get(str(now.hour), [0.0, 0])
+
+        return {
+            'last_data': last_data,
+            'seven_days': seven_days,
+            'rainy_days': sum(1 for values in days if values[2]),
+            'hour_avg_temp': total / count if count else None,
+            'cold_days': sum(1 for values in days if values[0] is not None and values[0] <= COLD_THRESHOLD),
+            'warm_days': sum(1 for values in days if values[1] is not None and values[1] >= WARM_THRESHOLD),
+        }
+
+
+def render_page(state, file_path, weather_data):
+    """
+    Renders a page from the section fragments of the previous refresh, rendering
+    again only the sections whose data changed, and writes it if its content changed.
+
+    Args:
+        state (DashboardState): The state holding the fragments.
+        file_path (str): Path of the page.
+        weather_data (dict): The page data.
+
+    Returns:
+        list: Names of the sections that were rendered again.
+    """
+
+    fragments = state.fragments.setdefault(os.path.basename(file_path), {})
+    inputs = dash_gen.section_inputs(weather_data)
+    rendered = []
+
+    for name in dash_gen.SECTIONS:
+        digest = hashlib.sha256(json.dumps(inputs[name], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        if fragments.get(name, [None])[0] != digest:
+            buffer = io.StringIO()
+            dash_gen.render_section(name, weather_data, buffer.write)
+            fragments[name] = [digest, buffer.getvalue()]
+            rendered.append(name)
+
+    def write_page(out):
+        for name in dash_gen.SECTIONS:
+            out.write(fragments[name][1])
+        out.write(dash_gen.PAGE_TAIL)
+
+    site_gen.write_if_changed(file_path, write_page)
+    return rendered
+
+
+def refresh(supabase_client, locations, docs_path, extras=None, page_size=1000, state_dir=None):
+    """
+    Brings the dashboard up to date from the rows added since the previous refresh.
+
+    The first refresh (or one without a readable state file) reads the current and
+    the previous month once. After that only the rows created since OVERLAP before
+    the newest row seen are read, so the cost follows the number of new rows, not
+    the length of the history.
+    Every page is assembled from its section fragments, and only sections whose
+    data changed are rendered again.
+
+    Args:
+        supabase_client (Client): Database connection.
+        locations (list): Location keys; one page per key when there are several,
+                          otherwise docs/index.html with the readings of every location.
+        docs_path (str): Directory of the pages.
+        extras (callable): Optional function called as extras(weather_data, location)
+                           to add prebuilt data, like the long-range chart series, to the page data.
+        page_size (int): Rows fetched per request.
+        state_dir (str): Directory of the state file (defaults to site_generator.state_dir(docs_path)).
+
+    Returns:
+        list: Paths of the pages with re-rendered sections, or None if an error occurred.
+    """
+
+    os.makedirs(docs_path, exist_ok=True)
+    state_dir = state_dir or site_gen.state_dir(docs_path)
+    os.makedirs(state_dir, exist_ok=True)
+    state_path = os.path.join(state_dir, STATE_NAME)
+    state = DashboardState.load(state_path)
+    changed = set()
+
+    try:
+        if state is None:
+            state = DashboardState()
+            today = datetime.datetime.now(datetime.timezone.utc).date()
+            start = datetime.date(*du.shift_month(today.year, today.month, -1), 1)
+            pages = db.iter_row_pages(supabase_client, start, page_size=page_size)
+        else:
+            pages = db.iter_row_pages(supabase_client, state.start(), page_size=page_size)
+
+        read_rows = 0
+        for rows in pages:
+            changed |= state.apply(rows)
+            read_rows += len(rows)
+
+    except Exception as e:
+        print(f"An error occured while retrieving new rows: {e}")
+        return None
+
+    print(f"{read_rows} rows read, {len(changed - {ALL})} locations changed, newest row at {state.cursor}.")
+
+    if len(locations) > 1:
+        targets = [(key, os.path.join(docs_path, site_gen.page_name(key))) for key in locations]
+    else:
+        targets = [(None, os.path.join(docs_path, "index.html"))]
+
+    rendered = []
+    index = []
+
+    for key, file_path in targets:
+        weather_data = state.dashboard_data(key)
+        if weather_data is None:
+            continue
+        index.append((key, os.path.basename(file_path), weather_data))
+
+        if extras:
+            extras(weather_data, key)
+
+        sections = render_page(state, file_path, weather_data)
+        if sections:
+            print(f"{os.path.basename(file_path)}: rendered {', '.join(sections)}.")
+            rendered.append(file_path)
+
+    if len(locations) > 1 and index:
+        site_gen.write_if_changed(os.path.join(docs_path, "index.html"), dash_gen.render_index, sorted(index))
+
+    state.save(state_path)
+    return rendered
@@ -0,0 +1,334 @@
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# Attributes that are summed into counters in the Prometheus export
+COUNTERS = ('bytes', 'rows', 'retries')
+
+# Number of finished spans kept for the JSON lines export
+MAX_EVENTS = 10000
+
+
+class Span:
+    """
+    Timing of one call, plus attributes such as payload size, retries and cache hits.
+
+    Attributes:
+        name (str): Span name, e.g. "fetch" or "rpc".
+        labels (dict): Labels that identify the span in the export, e.g. {'function': 'get_last_data'}.
+        attributes (dict): Values set with annotate() while the span is running.
+        start (float): Start time (seconds since the epoch).
+        duration (float): Duration in seconds, set when the span ends.
+        error (str): The exception that ended the span, if any.
+    """
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.attributes = {}
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+
+    def to_dict(self):
+        event = {'ts': round(self.start, 6), 'span': self.name, 'duration_ms': round(self.duration * 1000, 3)}
+        event.update(self.labels)
+        event.update(self.attributes)
+        if self.error:
+            event['error'] = self.error
+        return event
+
+
+class Registry:
+    """
+    Collects finished spans. Aggregates are kept for the Prometheus export and the
+    latest spans for the JSON lines export.
+    """
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self.lock = threading.Lock()
+        self.aggregates = {}
+        self.events = collections.deque(maxlen=max_events)
+
+    def record(self, span):
+        key = (span.name, tuple(sorted(span.labels.items())))
+
+        with self.lock:
+            aggregate = self.aggregates.get(key)
+            if aggregate is None:
+                aggregate = self.aggregates[key] = {'count': 0, 'seconds': 0.0, 'errors': 0,
+                                                    'cache_hits': 0, 'cache_misses': 0,
+                                                    **{name: 0 for name in COUNTERS}}
+
+            aggregate['count'] += 1
+            aggregate['seconds'] += span.duration
+            aggregate['errors'] += span.error is not None
+            for name in COUNTERS:
+                aggregate[name] += span.attributes.get(name) or 0
+
+            cache_hit = span.attributes.get('cache_hit')
+            if cache_hit is not None:
+                aggregate['cache_hits' if cache_hit else 'cache_misses'] += 1
+
+            self.events.append(span)
+
+    def prometheus_text(self):
+        """
+        Returns:
+            str: The aggregates in the Prometheus text exposition format.
+        """
+
+        with self.lock:
+            aggregates = sorted(self.aggregates.items())
+
+        metrics = [
+            ('weather_span_seconds', 'summary', 'Duration of the instrumented calls.', None),
+            ('weather_span_errors_total', 'counter', 'Calls that raised an exception.', 'errors'),
+            ('weather_span_bytes_total', 'counter', 'Payload bytes handled by the calls.', 'bytes'),
+            ('weather_span_rows_total', 'counter', 'Rows handled by the calls.', 'rows'),
+            ('weather_span_retries_total', 'counter', 'Retries made by the calls.', 'retries'),
+            ('weather_span_cache_total', 'counter', 'Cache lookups made by the calls.', None),
+        ]
+
+        lines = []
+        for metric, kind, help_text, field in metrics:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+
+            for (name, labels), aggregate in aggregates:
+                label_text = _labels(name, labels)
+
+                if metric == 'weather_span_seconds':
+                    lines.append(f"{metric}_count{{{label_text}}} {aggregate['count']}")
+                    lines.append(f"{metric}_sum{{{label_text}}} {aggregate['seconds']:.6f}")
+                elif metric == 'weather_span_cache_total':
+                    if aggregate['cache_hits'] or aggregate['cache_misses']:
+                        lines.append(f"{metric}{{{label_text},result=\"hit\"}} {aggregate['cache_hits']}")
+                        lines.append(f"{metric}{{{label_text},result=\"miss\"}} {aggregate['cache_misses']}")
+                elif aggregate[field] or field == 'errors':
+                    lines.append(f"{metric}{{{label_text}}} {aggregate[field]}")
+
+        return "\n".join(lines) + "\n"
+
+    def drain_events(self):
+        """
+        Removes and returns the finished spans that weren't exported yet.
+
+        Returns:
+            list: The spans, oldest first.
+        """
+
+        with self.lock:
+            events = list(self.events)
+            self.events.clear()
+        return events
+
+    def clear(self):
+        with self.lock:
+            self.aggregates.clear()
+            self.events.clear()
+
+
+REGISTRY = Registry()
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def span(name, **labels):
+    """
+    Times the enclosed block and records it in the registry.
+
+    Args:
+        name (str): Span name.
+        **labels: Labels of the span.
+
+    Yields:
+        Span: The running span.
+    """
+
+    stack = _stack()
+
+    # A nested span of the same call (e.g. a recursive call) is part of the outer span
+    if stack and stack[-1].name == name and stack[-1].labels == labels:
+        yield stack[-1]
+        return
+
+    current = Span(name, labels)
+    stack.append(current)
+    started = time.perf_counter()
+
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        stack.pop()
+        REGISTRY.record(current)
+
+
+def timed(name, **labels):
+    """
+    Decorator that runs every call of the function in a span.
+
+    Args:
+        name (str): Span name.
+        **labels: Labels of the span.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def annotate(**attributes):
+    """
+    Sets attributes (e.g. bytes, rows, retries, cache_hit) on the innermost running
+    span of this thread. Does nothing outside a span.
+    """
+
+    stack = _stack()
+    if stack:
+        stack[-1].attributes.update(attributes)
+
+
+def instrument(client):
+    """
+    Wraps a database client so that every rpc() and table() call is timed.
+
+    Args:
+        client (Client): A Supabase client or a storage backend.
+
+    Returns:
+        InstrumentedClient: The wrapped client, or None if client is None.
+    """
+
+    return InstrumentedClient(client) if client is not None else None
+
+
+class InstrumentedClient:
+    """
+    Database client wrapper that runs execute() of every query in an "rpc" or "query" span.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def rpc(self, function, *args, **kwargs):
+        return _Query(self.client.rpc(function, *args, **kwargs), "rpc", {'function': function})
+
+    def table(self, name):
+        return _Query(self.client.table(name), "query", {'table': name})
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class _Query:
+    """
+    Query builder wrapper that keeps wrapping the builders returned by chained calls.
+    """
+
+    def __init__(self, builder, name, labels):
+        self.builder = builder
+        self.name = name
+        self.labels = labels
+
+    def execute(self):
+        with span(self.name, **self.labels):
+            response = self.builder.execute()
+            data = getattr(response, 'data', None)
+            annotate(rows=len(data) if isinstance(data, list) else int(data is not None))
+            return response
+
+    def __getattr__(self, name):
+        attribute = getattr(self.builder, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            return _Query(result, self.name, self.labels) if hasattr(result, 'execute') else result
+
+        return call
+
+
+def export(target=None, file_format=None):
+    """
+    Exports the recorded spans.
+
+    Prometheus text replaces the whole file (for the node exporter's textfile collector)
+    or is pushed to a Pushgateway URL. JSON lines are appended, one span per line, and
+    every span is exported once.
+
+    Args:
+        target (str): File path or http(s) URL. Defaults to METRICS_FILE, then METRICS_URL.
+        file_format (str): "prometheus" or "jsonl". Defaults to METRICS_FORMAT, then to
+                           "jsonl" for .jsonl/.json files and "prometheus" otherwise.
+
+    Returns:
+        bool: True if the metrics were exported.
+    """
+
+    target = target or os.environ.get("METRICS_FILE") or os.environ.get("METRICS_URL")
+    if not target:
+        return False
+
+    file_format = file_format or os.environ.get("METRICS_FORMAT")
+    if not file_format:
+        file_format = "jsonl" if target.endswith((".jsonl", ".json")) else "prometheus"
+
+    if file_format == "jsonl":
+        body = "".join(json.dumps(event.to_dict(), default=str) + "\n" for event in REGISTRY.drain_events())
+    else:
+        body = REGISTRY.prometheus_text()
+
+    try:
+        if target.startswith(("http://", "https://")):
+            import requests
+
+            content_type = "application/x-ndjson" if file_format == "jsonl" else "text/plain; version=0.0.4"
+            response = requests.post(target, data=body.encode("utf-8"), headers={'Content-Type': content_type},
+                                     timeout=10)
+            response.raise_for_status()
+        elif file_format == "jsonl":
+            with open(target, "a") as f:
+                f.write(body)
+        else:
+            tmp_path = target + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(body)
+            os.replace(tmp_path, target)
+        return True
+
+    except Exception as e:
+        print(f"Error exporting metrics to {target}: {e}")
+        return False
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _labels(name, labels):
+    pairs = [('span', name)] + list(labels)
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in pairs)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
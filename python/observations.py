@@ -0,0 +1,472 @@
+import array
+import datetime
+
+import numpy as np
+
+import data_utils as du
+import db_utils as db
+
+# Columns of an observation, in the order of the weather_data table
+FIELDS = ('created_at', 'temperature_c', 'humidity', 'wind_speed', 'pressure', 'condition_text', 'location')
+
+# Stored in place of a missing humidity or pressure in the int16 columns
+MISSING_INT = -32768
+
+# Stored in place of a missing created_at (NaT)
+MISSING_TIME = np.iinfo(np.int64).min
+
+
+class Observation:
+    """
+    One weather reading.
+
+    Uses __slots__, so a reading takes a fraction of the memory of a row dictionary
+    and its fields are plain attribute lookups.
+
+    Attributes:
+        created_at (datetime.datetime): Reading time (naive UTC), or None.
+        temperature_c (float): Temperature in Celsius.
+        humidity (int): Relative humidity in percent.
+        wind_speed (float): Wind speed in m/s.
+        pressure (int): Pressure in mbar.
+        condition_text (str): Condition, e.g. "Clear" or "Rain".
+        location (str): Location key ("lat,lon"), or None.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, created_at=None, temperature_c=None, humidity=None, wind_speed=None, pressure=None,
+                 condition_text=None, location=None):
+        self.created_at = created_at
+        self.temperature_c = temperature_c
+        self.humidity = humidity
+        self.wind_speed = wind_speed
+        self.pressure = pressure
+        self.condition_text = condition_text
+        self.location = location
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds an observation from a weather_data dictionary, as returned by the
+        database or extract_data. "N/A" values are read as missing.
+
+        Args:
+            row (dict): The row.
+
+        Returns:
+            Observation: The reading.
+        """
+
+        created_at = row.get('created_at')
+
+        return cls(du.parse_timestamp(created_at) if created_at else None,
+                   _value(row.get('temperature_c')),
+                   _value(row.get('humidity')),
+                   _value(row.get('wind_speed')),
+                   _value(row.get('pressure')),
+                   _value(row.get('condition_text')),
+                   row.get('location'))
+
+    @classmethod
+    def from_dashboard_row(cls, row, location=None):
+        """
+        Builds an observation from a 'last_data' row of the dashboard data.
+
+        Args:
+            row (dict): A row with 'd', 't', 'temp', 'hum', 'wind', 'press' and 'condition' keys.
+            location (str): Optional location key.
+
+        Returns:
+            Observation: The reading.
+        """
+
+        created_at = None
+        if row.get('d') and row.get('t'):
+            created_at = du.parse_timestamp(f"{row['d']}T{str(row['t']).split('+')[0]}")
+
+        return cls(created_at, _value(row.get('temp')), _value(row.get('hum')), _value(row.get('wind')),
+                   _value(row.get('press')), _value(row.get('condition')), location)
+
+    def to_row(self):
+        """
+        Returns:
+            dict: The reading as a weather_data dictionary with a UTC ISO 'created_at'.
+                  Missing created_at and location are left out, as in extract_data.
+        """
+
+        row = {
+            'temperature_c': self.temperature_c,
+            'pressure': self.pressure,
+            'humidity': self.humidity,
+            'wind_speed': self.wind_speed,
+            'condition_text': self.condition_text,
+        }
+        if self.location is not None:
+            row['location'] = self.location
+        if self.created_at is not None:
+            row['created_at'] = self.created_at.replace(tzinfo=datetime.timezone.utc).isoformat()
+        return row
+
+    def to_dashboard_row(self):
+        """
+        Returns:
+            dict: The reading as a 'last_data' row for dashboard_generator.render_html.
+        """
+
+        return {
+            'd': self.created_at.date().isoformat() if self.created_at else None,
+            't': self.created_at.time().isoformat() if self.created_at else None,
+            'temp': self.temperature_c,
+            'hum': self.humidity,
+            'wind': self.wind_speed,
+            'press': self.pressure,
+            'condition': self.condition_text,
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, Observation):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in FIELDS)
+
+    def __repr__(self):
+        return "Observation(" + ", ".join(f"{name}={getattr(self, name)!r}" for name in FIELDS) + ")"
+
+
+class ObservationBatch:
+    """
+    Many readings stored as columns (struct of arrays).
+
+    Numbers are NumPy arrays; condition texts and locations are stored once in a
+    category list and referenced by int32 codes. A reading takes about 38 bytes,
+    against about 549 bytes as a row dictionary. The batch has the created_at,
+    temperature_c and condition_text columns of analytics.Observations, so it can
+    be passed to analytics.compute_climatology directly.
+
+    Attributes:
+        created_at (numpy.ndarray): Reading times (datetime64[s], NaT if missing).
+        temperature_c (numpy.ndarray): Temperatures (float64, NaN if missing).
+        humidity (numpy.ndarray): Humidities (int16, MISSING_INT if missing).
+        wind_speed (numpy.ndarray): Wind speeds (float64, NaN if missing).
+        pressure (numpy.ndarray): Pressures (int16, MISSING_INT if missing).
+        condition_codes (numpy.ndarray): Indices into conditions (int32).
+        conditions (list): Distinct condition texts.
+        location_codes (numpy.ndarray): Indices into locations (int32).
+        locations (list): Distinct location keys.
+    """
+
+    def __init__(self, created_at, temperature_c, humidity, wind_speed, pressure,
+                 condition_codes, conditions, location_codes, locations):
+        self.created_at = created_at
+        self.temperature_c = temperature_c
+        self.humidity = humidity
+        self.wind_speed = wind_speed
+        self.pressure = pressure
+        self.condition_codes = condition_codes
+        self.conditions = conditions
+        self.location_codes = location_codes
+        self.locations = locations
+
+    def __len__(self):
+        return len(self.created_at)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getitem__(self, key):
+        """
+        Returns the Observation at an integer index, or a new batch for a slice,
+        an index array or a boolean mask.
+        """
+
+        if isinstance(key, (int, np.integer)):
+            created_at = self.created_at[key]
+            humidity = int(self.humidity[key])
+            pressure = int(self.pressure[key])
+
+            return Observation(None if np.isnat(created_at) else created_at.astype(datetime.datetime),
+                               _float(self.temperature_c[key]),
+                               None if humidity == MISSING_INT else humidity,
+                               _float(self.wind_speed[key]),
+                               None if pressure == MISSING_INT else pressure,
+                               self.conditions[self.condition_codes[key]],
+                               self.locations[self.location_codes[key]])
+
+        return ObservationBatch(self.created_at[key], self.temperature_c[key], self.humidity[key],
+                                self.wind_speed[key], self.pressure[key], self.condition_codes[key],
+                                self.conditions, self.location_codes[key], self.locations)
+
+    @property
+    def condition_text(self):
+        """
+        numpy.ndarray: The condition texts as an object array.
+        """
+
+        return np.array(self.conditions, dtype=object)[self.condition_codes]
+
+    @property
+    def location(self):
+        """
+        numpy.ndarray: The location keys as an object array.
+        """
+
+        return np.array(self.locations, dtype=object)[self.location_codes]
+
+    @property
+    def nbytes(self):
+        """
+        int: Memory used by the columns (the category lists are not counted).
+        """
+
+        return sum(getattr(self, name).nbytes for name in ('created_at', 'temperature_c', 'humidity', 'wind_speed',
+                                                             'pressure', 'condition_codes', 'location_codes'))
+
+    def for_location(self, location):
+        """
+        Returns:
+            ObservationBatch: The readings of one location.
+        """
+
+        if location not in self.locations:
+            return self[np.zeros(len(self), dtype=bool)]
+        return self[self.location_codes == self.locations.index(location)]
+
+    def sort(self):
+        """
+        Returns:
+            ObservationBatch: The readings ordered by created_at (stable).
+        """
+
+        return self[np.argsort(self.created_at, kind='stable')]
+
+    def to_rows(self):
+        """
+        Returns:
+            list: The readings as weather_data dictionaries.
+        """
+
+        return [observation.to_row() for observation in self]
+
+    def to_dashboard_rows(self, limit=None):
+        """
+        Returns the newest readings as 'last_data' rows, newest first.
+
+        Args:
+            limit (int): Optional maximum number of rows.
+
+        Returns:
+            list: Rows for dashboard_generator.render_html.
+        """
+
+        order = np.argsort(self.created_at, kind='stable')[::-1][:limit]
+        return [self[int(index)].to_dashboard_row() for index in order]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds a batch from weather_data dictionaries.
+
+        Args:
+            rows (iterable): Row dictionaries or Observations.
+
+        Returns:
+            ObservationBatch: The readings.
+        """
+
+        builder = BatchBuilder()
+        builder.extend(rows)
+        return builder.build()
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Builds a batch from NumPy columns, e.g. a chunk of synthetic.generate_columns.
+
+        Args:
+            columns (dict): Column name mapped to an array; missing columns are filled as missing.
+
+        Returns:
+            ObservationBatch: The readings.
+        """
+
+        count = len(next(iter(columns.values())))
+
+        def column(name, dtype, missing):
+            values = columns.get(name)
+            if values is None:
+                return np.full(count, missing, dtype=dtype)
+
+            values = np.asarray(values)
+            if values.dtype == object:
+                values = np.array([missing if value is None else value for value in values])
+            # Nullable integer columns (e.g. from Arrow) arrive as floats with NaN for null
+            if np.issubdtype(np.dtype(dtype), np.integer) and values.dtype.kind == 'f':
+                values = np.where(np.isnan(values), missing, values)
+            return values.astype(dtype)
+
+        condition_codes, conditions = _encode(columns.get('condition_text', [None] * count))
+        location_codes, locations = _encode(columns.get('location', [None] * count))
+
+        return cls(column('created_at', 'datetime64[s]', np.datetime64('NaT')),
+                   column('temperature_c', np.float64, np.nan),
+                   column('humidity', np.int16, MISSING_INT),
+                   column('wind_speed', np.float64, np.nan),
+                   column('pressure', np.int16, MISSING_INT),
+                   condition_codes, conditions, location_codes, locations)
+
+    @classmethod
+    def concat(cls, batches):
+        """
+        Joins batches into one, merging their category lists.
+
+        Returns:
+            ObservationBatch: The readings of all batches, in order.
+        """
+
+        batches = list(batches)
+        if not batches:
+            return BatchBuilder().build()
+
+        conditions, locations = [], []
+        condition_codes, location_codes = [], []
+
+        for batch in batches:
+            condition_codes.append(_recode(batch.condition_codes, batch.conditions, conditions))
+            location_codes.append(_recode(batch.location_codes, batch.locations, locations))
+
+        return cls(np.concatenate([batch.created_at for batch in batches]),
+                   np.concatenate([batch.temperature_c for batch in batches]),
+                   np.concatenate([batch.humidity for batch in batches]),
+                   np.concatenate([batch.wind_speed for batch in batches]),
+                   np.concatenate([batch.pressure for batch in batches]),
+                   np.concatenate(condition_codes), conditions, np.concatenate(location_codes), locations)
+
+
+class BatchBuilder:
+    """
+    Appends readings one at a time into typed array.array buffers, then turns them
+    into an ObservationBatch without copying the rows again.
+    """
+
+    def __init__(self):
+        self.created_at = array.array('q')
+        self.temperature_c = array.array('d')
+        self.humidity = array.array('h')
+        self.wind_speed = array.array('d')
+        self.pressure = array.array('h')
+        self.condition_codes = array.array('i')
+        self.location_codes = array.array('i')
+        self.conditions = {}
+        self.locations = {}
+
+    def __len__(self):
+        return len(self.created_at)
+
+    def append(self, reading):
+        """
+        Adds one reading.
+
+        Args:
+            reading (dict or Observation): A weather_data dictionary or an Observation.
+        """
+
+        if not isinstance(reading, Observation):
+            reading = Observation.from_row(reading)
+
+        created_at = reading.created_at
+        self.add(None if created_at is None else int(created_at.replace(tzinfo=datetime.timezone.utc).timestamp()),
+                 reading.temperature_c, reading.humidity, reading.wind_speed, reading.pressure,
+                 reading.condition_text, reading.location)
+
+    def add(self, created_at, temperature_c, humidity, wind_speed, pressure, condition_text, location):
+        """
+        Adds one reading from plain values, without building an Observation first.
+
+        Args:
+            created_at (int): Reading time in seconds since the epoch, or None.
+            temperature_c (float): Temperature, or None. The other values are as in Observation.
+        """
+
+        self.created_at.append(MISSING_TIME if created_at is None else created_at)
+        self.temperature_c.append(_or_nan(temperature_c))
+        self.humidity.append(MISSING_INT if humidity is None else int(humidity))
+        self.wind_speed.append(_or_nan(wind_speed))
+        self.pressure.append(MISSING_INT if pressure is None else int(pressure))
+        self.condition_codes.append(self.conditions.setdefault(condition_text, len(self.conditions)))
+        self.location_codes.append(self.locations.setdefault(location, len(self.locations)))
+
+    def extend(self, readings):
+        for reading in readings:
+            self.append(reading)
+
+    def build(self):
+        """
+        Returns:
+            ObservationBatch: The readings added so far.
+        """
+
+        return ObservationBatch(np.frombuffer(self.created_at, dtype=np.int64).astype('datetime64[s]'),
+                                np.frombuffer(self.temperature_c, dtype=np.float64),
+                                np.frombuffer(self.humidity, dtype=np.int16),
+                                np.frombuffer(self.wind_speed, dtype=np.float64),
+                                np.frombuffer(self.pressure, dtype=np.int16),
+                                np.frombuffer(self.condition_codes, dtype=np.int32), list(self.conditions),
+                                np.frombuffer(self.location_codes, dtype=np.int32), list(self.locations))
+
+
+def load_batch(supabase_client, start, end, page_size=1000):
+    """
+    Loads weather_data rows in [start, end) into a batch, one page at a time, so
+    the rows are never all held as dictionaries.
+
+    Args:
+        supabase_client (Client): Database connection.
+        start (datetime.date): First day of the range.
+        end (datetime.date): Day after the last day of the range.
+        page_size (int): Rows fetched per request.
+
+    Returns:
+        ObservationBatch: The readings in id order, or None if an error occurred.
+    """
+
+    if not supabase_client:
+        print("Supabase client not initialized.")
+        return None
+
+    builder = BatchBuilder()
+
+    try:
+        for page in db.iter_row_pages(supabase_client, start, end, page_size=page_size):
+            builder.extend(page)
+
+    except Exception as e:
+        print(f"An error occured while retrieving rows: {e}")
+        return None
+
+    return builder.build()
+
+
+def _value(value):
+    return None if value == "N/A" else value
+
+
+def _float(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _or_nan(value):
+    return float("nan") if value is None else float(value)
+
+
+def _encode(values):
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int32, count=len(values))
+    return codes, list(index)
+
+
+def _recode(codes, categories, merged):
+    index = {category: position for position, category in enumerate(merged)}
+    mapping = np.array([index.setdefault(category, len(index)) for category in categories], dtype=np.int32)
+    merged[:] = list(index)
+    return mapping[codes] if len(codes) else codes.astype(np.int32)
@@ -0,0 +1,238 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import dashboard_generator as dash_gen
+import data_utils as du
+import db_utils as db
+import site_generator as site_gen
+
+# Marks the end of a queue; every worker of the next stage gets one
+_DONE = object()
+
+
+class Pipeline:
+    """
+    Fetches, extracts, stores and renders many locations as overlapping stages.
+
+    Every stage runs a number of workers that take items from a bounded queue and
+    hand their results to the queue of the next stage:
+
+        fetch -> extract -> store -> render
+
+    A full queue makes the stage before it wait, so a slow database holds the
+    fetch workers back instead of letting API responses pile up in memory. The
+    blocking calls (HTTP requests, database queries, page writes) run in a thread
+    pool sized for all workers, so network and database latency of different
+    locations overlap. Extraction only walks a small dictionary, so it runs on the
+    event loop itself.
+
+    The store workers write whatever rows are waiting, up to store_batch, with one
+    bulk upsert. As soon as a location's row is stored, a render worker queries its
+    dashboard data. Locations whose fetch, extraction or store failed are rendered
+    from the data already stored once the other stages are done, so every configured
+    page is kept up to date. The pages are written with site_generator.build_site
+    once every location is done.
+
+    Attributes:
+        counts (dict): Number of locations that got through every stage ('fetched',
+                       'extracted', 'stored', 'rendered') and that failed in it
+                       ('fetch_failed', 'extract_failed', 'store_failed', 'render_failed').
+        queue_peaks (dict): Largest size every queue reached.
+    """
+
+    def __init__(self, db_client, cache=None, fetch_workers=10, extract_workers=1, store_workers=2,
+                 render_workers=4, queue_size=50, store_batch=100, prepare=None):
+        """
+        Args:
+            db_client (Client): Database connection.
+            cache (cache.Cache): Optional cache for API responses and dashboard queries.
+            fetch_workers (int): Concurrent API requests.
+            extract_workers (int): Concurrent extractions.
+            store_workers (int): Concurrent database writes.
+            render_workers (int): Concurrent dashboard queries.
+            queue_size (int): Maximum number of items waiting between two stages.
+            store_batch (int): Maximum number of rows per database write.
+            prepare (callable): Optional function called as prepare(weather_data, location)
+                                to add prebuilt data to the page data before rendering.
+        """
+
+        self.db_client = db_client
+        self.cache = cache
+        self.workers = {'fetch': fetch_workers, 'extract': extract_workers,
+                        'store': store_workers, 'render': render_workers}
+        self.queue_size = queue_size
+        self.store_batch = store_batch
+        self.prepare = prepare
+        self.counts = {}
+        self.queue_peaks = {}
+
+    def run(self, locations, docs_path):
+        """
+        Runs the pipeline for a list of locations.
+
+        Args:
+            locations (list): A list of dictionaries containing 'lat' and 'lon'.
+            docs_path (str): Directory of the pages. With one location its page is
+                             docs/index.html, otherwise one page per location plus an index.
+
+        Returns:
+            list: Paths of the pages that were written.
+        """
+
+        return asyncio.run(self._run(locations, docs_path))
+
+    async def _run(self, locations, docs_path):
+        self.counts = {'fetched': 0, 'extracted': 0, 'stored': 0, 'rendered': 0,
+                       'fetch_failed': 0, 'extract_failed': 0, 'store_failed': 0, 'render_failed': 0}
+        self.queue_peaks = {}
+
+        api_key = du.get_api_key()['api_key']
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=sum(self.workers.values())))
+        multi_site = len(locations) > 1
+
+        queues = {name: asyncio.Queue(self.queue_size) for name in self.workers}
+        pages = {}
+
+        with du.create_session(pool_size=self.workers['fetch']) as session:
+            async def fetch(location):
+                data = await asyncio.to_thread(du.fetch_location, session, location, api_key, cache=self.cache)
+                if not data:
+                    print(f"Failed to fetch weather data for {location['lat']},{location['lon']}.")
+                    self.counts['fetch_failed'] += 1
+                    return []
+                self.counts['fetched'] += 1
+                return [(location, data)]
+
+            async def extract(item):
+                location, data = item
+                extracted_data = du.extract_data(data, du.location_key(location))
+                if not extracted_data:
+                    print(f"Failed to extract weather data for {location['lat']},{location['lon']}.")
+                    self.counts['extract_failed'] += 1
+                    return []
+                self.counts['extracted'] += 1
+                return [extracted_data]
+
+            async def store(rows):
+                writer = db.WeatherDataWriter(self.db_client, max_rows=len(rows) + 1,
+                                              max_interval=float('inf'), upsert=True)
+                for row in rows:
+                    writer.add(row)
+                failed = {id(row) for row, _ in await asyncio.to_thread(writer.close)}
+                keys = [row['location'] for row in rows if id(row) not in failed]
+                self.counts['stored'] += len(keys)
+                self.counts['store_failed'] += len(failed)
+                return keys
+
+            async def render(key):
+                # The single-site page shows the readings of every location, as script.render does
+                location = key if multi_site else None
+                pages[key] = None
+                weather_data = await asyncio.to_thread(db.get_data_from_database, self.db_client, location, self.cache)
+                if not weather_data:
+                    self.counts['render_failed'] += 1
+                    return []
+                if self.prepare:
+                    self.prepare(weather_data, location)
+                pages[key] = weather_data
+                self.counts['rendered'] += 1
+                return []
+
+            stages = [
+                self._stage('fetch', fetch, queues['fetch'], queues['extract']),
+                self._stage('extract', extract, queues['extract'], queues['store']),
+                self._stage('store', store, queues['store'], queues['render'], batch=self.store_batch),
+                self._stage('render', render, queues['render'], None),
+            ]
+
+            async def feed():
+                for location in locations:
+                    await self._put(queues['fetch'], 'fetch', location)
+                for _ in range(self.workers['fetch']):
+                    await queues['fetch'].put(_DONE)
+
+            await asyncio.gather(feed(), *stages)
+
+            # Locations that didn't make it through the store are rendered from the stored data
+            remaining = [key for key in dict.fromkeys(map(du.location_key, locations)) if key not in pages]
+            if remaining:
+                rerender = asyncio.Queue()
+                for key in remaining:
+                    rerender.put_nowait(key)
+                for _ in range(self.workers['render']):
+                    rerender.put_nowait(_DONE)
+                await self._stage('render', render, rerender, None)
+
+        return await asyncio.to_thread(self._write_pages, pages, docs_path, multi_site)
+
+    async def _stage(self, name, handle, inbox, outbox, batch=None):
+        """
+        Runs the workers of one stage until every one of them got _DONE, then
+        passes _DONE on to every worker of the next stage.
+
+        Args:
+            name (str): Stage name, as in self.workers.
+            handle (coroutine function): Called with one item (or, with batch, a list
+                                         of up to batch items) and returns a list of
+                                         results for the next stage.
+            inbox (asyncio.Queue): Queue the items are taken from.
+            outbox (asyncio.Queue): Queue the results go to, or None for the last stage.
+            batch (int): Optional maximum number of waiting items handled together.
+        """
+
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    return
+
+                items = [item]
+                while batch and len(items) < batch and not inbox.empty():
+                    item = inbox.get_nowait()
+                    if item is _DONE:
+                        # Only _DONE follows, so putting it back keeps the order
+                        inbox.put_nowait(item)
+                        break
+                    items.append(item)
+
+                try:
+                    results = await handle(items if batch else item)
+                except Exception as e:
+                    print(f"Error in the {name} stage: {e}")
+                    self.counts[f'{name}_failed'] += len(items)
+                    continue
+
+                if outbox is not None:
+                    for result in results:
+                        await self._put(outbox, self._next_stage(name), result)
+
+        await asyncio.gather(*(worker() for _ in range(self.workers[name])))
+
+        if outbox is not None:
+            for _ in range(self.workers[self._next_stage(name)]):
+                await outbox.put(_DONE)
+
+    async def _put(self, queue, name, item):
+        await queue.put(item)
+        self.queue_peaks[name] = max(self.queue_peaks.get(name, 0), queue.qsize())
+
+    def _next_stage(self, name):
+        names = list(self.workers)
+        return names[names.index(name) + 1]
+
+    @staticmethod
+    def _write_pages(pages, docs_path, multi_site):
+        if multi_site:
+            return site_gen.build_site(pages, docs_path)
+
+        os.makedirs(docs_path, exist_ok=True)
+        written = []
+        for weather_data in pages.values():
+            if weather_data:
+                file_path = os.path.join(docs_path, "index.html")
+                if site_gen.write_if_changed(file_path, dash_gen.render_html, weather_data):
+                    written.append(file_path)
+            else:
+                print("Failed to retrieve weather data from Supabase.")
+        return written
@@ -1,42 +1,337 @@
 import data_utils as du
 import db_utils as db
 import dashboard_generator as dash_gen
+import site_generator as site_gen
+import cache as cache_utils
+import metrics
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import datetime
+import logging
 import os
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fetches weather data and rebuilds the dashboard.")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="recompute the daily and hourly rollup tables and exit")
+    parser.add_argument("--start", type=datetime.date.fromisoformat,
+                        help="first day (YYYY-MM-DD) for --rebuild-rollups")
+    parser.add_argument("--end", type=datetime.date.fromisoformat,
+                        help="day after the last day (YYYY-MM-DD) for --rebuild-rollups")
+    parser.add_argument("--maintain-partitions", action="store_true",
+                        help="create upcoming weather_data partitions, retire expired ones and exit")
+    parser.add_argument("--retention-months", type=int,
+                        help="months of raw readings kept by --maintain-partitions (default: keep everything)")
+    parser.add_argument("--expired", choices=["detach", "archive", "drop"], default="detach",
+                        help="what --maintain-partitions does with expired partitions")
+    parser.add_argument("--archive", metavar="DIR",
+                        help="only render the dashboard, reading the data from this archive directory")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and fetch, store and render on the configured intervals")
+    parser.add_argument("--render-only", action="store_true",
+                        help="don't fetch new data, only render the dashboard from the database or the cache")
+    parser.add_argument("--incremental", action="store_true",
+                        help="update the dashboard from the rows added since the last run only")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="fetch, store and render the locations as overlapping stages (see pipeline.py)")
+    return parser.parse_args()
+
+
 def main():
-    db_client = db.init()
+    args = parse_args()
+
+    if args.archive:
+        render_from_archive(args.archive)
+        return
+
+    # Load .env before reading any setting. The database client is created on first use,
+    # so a render that is answered from the cache never imports or connects to it.
+    db.load_environment()
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "WARNING").upper(), format="%(name)s: %(message)s")
+    db_client = db.LazyClient()
+
+    # Optional on-disk cache for API responses and dashboard queries
+    cache_path = os.environ.get("CACHE_PATH")
+    cache = cache_utils.Cache(cache_path) if cache_path else None
+
+    if args.rebuild_rollups:
+        db.rebuild_rollups(db_client, args.start, args.end)
+        return
+
+    if args.maintain_partitions:
+        db.maintain_partitions(db_client, retention_months=args.retention_months, expired_action=args.expired)
+        return
+
+    locations = du.get_locations()
+
+    if args.daemon:
+        run_daemon(db_client, locations, cache, args.incremental)
+        return
+
+    if args.pipeline and not args.render_only and not args.incremental:
+        run_pipeline(db_client, locations, cache)
+    else:
+        if not args.render_only:
+            fetch_and_store(db_client, locations, cache)
+
+        if args.incremental:
+            refresh(db_client, locations)
+        else:
+            render(db_client, locations, cache)
+    print_cache_stats(cache)
+
+    # Spans of this run go to METRICS_FILE or METRICS_URL, if one is set
+    metrics.export()
+
+
+def fetch_and_store(db_client, locations, cache=None):
+    """
+    Fetches the current weather for every location and stores it.
+    """
+
+    if len(locations) > 1:
+        # Multi-location mode: fetch every site concurrently over a shared connection pool
+        results = du.fetch_weather_data_batch(locations, du.get_api_key()['api_key'], keyed=True,
+                                              cache=cache)
+
+        # Store all observations with one bulk upsert (cached responses are upserted without duplicates)
+        with db.WeatherDataWriter(db_client, upsert=True) as writer:
+            for location, extracted_data in zip(locations, results):
+                if extracted_data:
+                    writer.add(extracted_data)
+                else:
+                    print(f"Failed to fetch weather data for {location['lat']},{location['lon']}.")
+        return
 
-    data = du.fetch_weather_data(du.get_api_key())
+    # The response is only cached once it is stored, so a cached response means it is in the database
+    env = du.get_api_key()
+    key = du.weather_cache_key(env)
+    if cache is not None and cache.get(key) is not None:
+        print("Weather data was fetched recently and is already stored.")
+        return
+
+    data = du.fetch_weather_data(env)
     if data:
         extracted_data = du.extract_data(data)
 
         if extracted_data:
-            db.store_weather_data(extracted_data, db_client)
+            if db.store_weather_data(extracted_data, db_client) and cache is not None:
+                cache.set(key, data, du.API_CACHE_TTL)
 
         else:
             print("Failed to extract weather data.")
     else:
         print("Failed to fetch weather data.")
 
-    db_weather_data = db.get_data_from_database(db_client)
 
-    if db_weather_data:
-        html_content = dash_gen.generate_html(db_weather_data)
+def render(db_client, locations, cache=None):
+    """
+    Renders docs/index.html, or one page per location plus an index page.
+    """
+
+    # Determine the base path
+    base_path = os.path.abspath(".")
+    docs_path = os.path.join(base_path, "docs")
+
+    if len(locations) > 1:
+        # One page per location plus an index page; unchanged pages are not rewritten
+        keys = [du.location_key(location) for location in locations]
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            pages = dict(zip(keys, executor.map(lambda key: db.get_data_from_database(db_client, key, cache), keys)))
+
+        for key, weather_data in pages.items():
+            add_prebuilt(weather_data, docs_path, key)
 
-        # Determine the base path and file path
-        base_path = os.path.abspath(".")
-        docs_path = os.path.join(base_path, "docs")
+        written = site_gen.build_site(pages, docs_path)
+        print(f"{len(written)} pages updated.")
+        return
+
+    db_weather_data = db.get_data_from_database(db_client, cache=cache)
+
+    if db_weather_data:
+        add_prebuilt(db_weather_data, docs_path)
         file_path = os.path.join(docs_path, "index.html")
 
         # Ensure the directory exists
         os.makedirs(docs_path, exist_ok=True)
-        
-        with open(file_path, "w") as f:
-            f.write(html_content)
+
+        # Render into a temporary file, so a failed render keeps the previous page
+        # and an unchanged page is not rewritten
+        try:
+            site_gen.write_if_changed(file_path, dash_gen.render_html, db_weather_data)
+        except Exception as e:
+            print(f"Error generating index.html: {e}")
 
     else:
         print("Failed to retrieve weather data from Supabase.")
 
 
+def run_pipeline(db_client, locations, cache=None):
+    """
+    Fetches, stores and renders with the asyncio pipeline.
+
+    The concurrency of every stage is configured with PIPELINE_FETCH_WORKERS (default 10),
+    PIPELINE_EXTRACT_WORKERS (default 1), PIPELINE_STORE_WORKERS (default 2) and
+    PIPELINE_RENDER_WORKERS (default 4), the size
+    of the queues between stages with PIPELINE_QUEUE_SIZE (default 50) and the rows per
+    database write with PIPELINE_STORE_BATCH (default 100).
+    """
+
+    import pipeline
+
+    docs_path = os.path.join(os.path.abspath("."), "docs")
+
+    runner = pipeline.Pipeline(db_client, cache,
+                               fetch_workers=int(os.environ.get("PIPELINE_FETCH_WORKERS", "10")),
+                               extract_workers=int(os.environ.get("PIPELINE_EXTRACT_WORKERS", "1")),
+                               store_workers=int(os.environ.get("PIPELINE_STORE_WORKERS", "2")),
+                               render_workers=int(os.environ.get("PIPELINE_RENDER_WORKERS", "4")),
+                               queue_size=int(os.environ.get("PIPELINE_QUEUE_SIZE", "50")),
+                               store_batch=int(os.environ.get("PIPELINE_STORE_BATCH", "100")),
+                               prepare=lambda weather_data, key: add_prebuilt(weather_data, docs_path, key))
+
+    written = runner.run(locations, docs_path)
+    counts = runner.counts
+    print(f"{counts['stored']} of {len(locations)} locations stored ({counts['fetch_failed']} fetches, "
+          f"{counts['extract_failed']} extractions and {counts['store_failed']} stores failed), "
+          f"{counts['rendered']} pages rendered, {len(written)} updated.")
+
+
+def refresh(db_client, locations):
+    """
+    Updates the pages from the rows added since the previous refresh (see incremental.py).
+    """
+
+    import incremental
+
+    docs_path = os.path.join(os.path.abspath("."), "docs")
+    keys = [du.location_key(location) for location in locations]
+
+    rendered = incremental.refresh(db_client, keys, docs_path,
+                                   extras=lambda weather_data, key: add_prebuilt(weather_data, docs_path, key))
+    if rendered is not None:
+        print(f"{len(rendered)} pages updated.")
+
+
+def run_daemon(db_client, locations, cache=None, incremental=False):
+    """
+    Runs fetch, store and render jobs on intervals until stopped with SIGINT or SIGTERM.
+
+    The database client, the HTTP session and the cache stay open for the whole run.
+    Intervals are configured with FETCH_INTERVAL (default 600 s), RENDER_INTERVAL
+    (default 300 s), FLUSH_INTERVAL (default 5 s) and METRICS_INTERVAL (default 60 s),
+    and DAEMON_JITTER (default 0.1) randomizes them by that fraction. With incremental,
+    the render job only reads the rows added since its previous run.
+    """
+
+    import daemon
+
+    fetch_interval = float(os.environ.get("FETCH_INTERVAL", "600"))
+    render_interval = float(os.environ.get("RENDER_INTERVAL", "300"))
+    flush_interval = float(os.environ.get("FLUSH_INTERVAL", "5"))
+    jitter = float(os.environ.get("DAEMON_JITTER", "0.1"))
+
+    api_key = du.get_api_key()['api_key']
+    session = du.create_session(pool_size=len(locations))
+    writer = db.WeatherDataWriter(db_client, upsert=True, max_interval=flush_interval)
+
+    def fetch_job(location):
+        def run():
+            data = du.fetch_with_retry(session, location, api_key)
+            extracted_data = du.extract_data(data, du.location_key(location)) if data else None
+
+            if extracted_data:
+                writer.add(extracted_data)
+            else:
+                print(f"Failed to fetch weather data for {location['lat']},{location['lon']}.")
+        return run
+
+    # One fetch job per location, plus jobs that flush the writer and render the site
+    jobs = [daemon.Job(f"fetch {du.location_key(location)}", fetch_job(location), fetch_interval, jitter)
+            for location in locations]
+    jobs.append(daemon.Job("flush", writer.flush, flush_interval, jitter))
+    if incremental:
+        jobs.append(daemon.Job("render", lambda: refresh(db_client, locations), render_interval, jitter))
+    else:
+        jobs.append(daemon.Job("render", lambda: render(db_client, locations, cache), render_interval, jitter))
+
+    if os.environ.get("METRICS_FILE") or os.environ.get("METRICS_URL"):
+        metrics_interval = float(os.environ.get("METRICS_INTERVAL", "60"))
+        jobs.append(daemon.Job("metrics", metrics.export, metrics_interval, jitter))
+
+    def stop():
+        writer.close()
+        session.close()
+        metrics.export()
+
+    daemon.run(jobs, pid_file=os.environ.get("DAEMON_PID_FILE", "weather-daemon.pid"),
+               max_workers=min(len(jobs), 16), on_stop=stop)
+
+
+def render_from_archive(archive_dir):
+    import archive
+
+    docs_path = os.path.join(os.path.abspath("."), "docs")
+    os.makedirs(docs_path, exist_ok=True)
+
+    weather_data = archive.get_dashboard_data(archive_dir)
+
+    if weather_data['last_data']:
+        # The archive holds the whole history, so the chart series are built from it directly
+        import downsample
+
+        table = archive.read(archive_dir, columns=['created_at', 'temperature_c'])
+        weather_data['series'] = downsample.build_series(table['created_at'].to_numpy(),
+                                                         table['temperature_c'].to_numpy(zero_copy_only=False))
+        site_gen.write_if_changed(os.path.join(docs_path, "index.html"), dash_gen.render_html, weather_data)
+    else:
+        print("No recent weather data in the archive.")
+
+
+def add_series(weather_data, docs_path, location=None):
+    """
+    Adds the long-range chart series of a location, if downsample.py has built them.
+    """
+
+    series_dir = os.path.join(docs_path, "series")
+    if weather_data and os.path.isdir(series_dir):
+        import downsample
+
+        series = downsample.load_series(series_dir, location)
+        if series:
+            weather_data['series'] = series
+
+
+def add_bundle(weather_data, docs_path, location=None):
+    """
+    Adds the chunk list of a location's reading history, if bundle.py has written it.
+    """
+
+    bundle_root = os.path.join(docs_path, "bundle")
+    if weather_data and os.path.isdir(bundle_root):
+        import bundle
+
+        manifest = bundle.load_manifest(bundle_root, location)
+        if manifest and manifest.get('chunks'):
+            weather_data['bundle'] = {'base': f"bundle/{bundle.bundle_name(location)}/",
+                                      'chunks': manifest['chunks'],
+                                      'before': bundle.oldest_inline(weather_data)}
+
+
+def add_prebuilt(weather_data, docs_path, location=None):
+    """
+    Adds the data written next to the pages by downsample.py and bundle.py.
+    """
+
+    add_series(weather_data, docs_path, location)
+    add_bundle(weather_data, docs_path, location)
+
+
+def print_cache_stats(cache):
+    if cache is not None:
+        print(f"Cache: {cache.hits} hits, {cache.misses} misses.")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,204 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import re
+
+import dashboard_generator as dash_gen
+import metrics
+
+# Hashes of the data each page was last rendered from, kept in state_dir
+MANIFEST_NAME = "build_hashes.json"
+
+
+def state_dir(out_dir):
+    """
+    Returns the directory of the build state (page hashes, incremental refresh state).
+
+    It is BUILD_STATE_DIR if set, otherwise .build next to the pages directory, so
+    publishing the pages directory doesn't publish the state with it.
+
+    Args:
+        out_dir (str): Directory the pages are written to.
+
+    Returns:
+        str: Path of the state directory.
+    """
+
+    return os.environ.get("BUILD_STATE_DIR") or os.path.join(os.path.dirname(os.path.abspath(out_dir)), ".build")
+
+
+def page_name(location):
+    """
+    Returns the file name of a location's page.
+
+    Args:
+        location (str): Location key ("lat,lon").
+
+    Returns:
+        str: A file name such as "44.8_20.46.html".
+    """
+
+    return re.sub(r"[^0-9A-Za-z.-]+", "_", location) + ".html"
+
+
+def data_hash(weather_data):
+    """
+    Computes a stable hash of the data a page is rendered from.
+
+    Args:
+        weather_data (object): JSON serializable page data.
+
+    Returns:
+        str: Hex encoded SHA-256 digest.
+    """
+
+    encoded = json.dumps(weather_data, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+@metrics.timed("write")
+def write_if_changed(file_path, render, *args):
+    """
+    Renders a page into a temporary file and replaces file_path only if the content changed.
+
+    Unchanged pages are not rewritten, so their mtime is kept.
+
+    Args:
+        file_path (str): Path of the page.
+        render (callable): Function called as render(*args, out) that writes the page.
+        *args: Arguments passed to render.
+
+    Returns:
+        bool: True if the file was written.
+    """
+
+    tmp_path = file_path + ".tmp"
+
+    try:
+        with open(tmp_path, "w") as f:
+            render(*args, f)
+        metrics.annotate(bytes=os.path.getsize(tmp_path))
+
+        if os.path.exists(file_path):
+            with open(file_path) as old, open(tmp_path) as new:
+                if old.read() == new.read():
+                    os.remove(tmp_path)
+                    return False
+
+        os.replace(tmp_path, file_path)
+        return True
+
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def render_location_page(file_path, weather_data):
+    """
+    Renders one location's dashboard. Runs in a worker of build_site.
+
+    Args:
+        file_path (str): Path of the page.
+        weather_data (dict): The data returned by db_utils.get_data_from_database.
+
+    Returns:
+        tuple: (file_path, True if the file was written, error message or None).
+    """
+
+    try:
+        return file_path, write_if_changed(file_path, dash_gen.render_html, weather_data), None
+    except Exception as e:
+        return file_path, False, str(e)
+
+
+@metrics.timed("build")
+def build_site(pages, out_dir, workers=4, processes=True):
+    """
+    Renders one dashboard page per location plus an index page.
+
+    A page is only re-rendered when the hash of its input data differs from the
+    previous build, and only rewritten when the rendered content differs. The
+    hashes are kept in state_dir(out_dir), outside the published pages; a build
+    without them (e.g. a fresh CI checkout that doesn't restore the directory, see
+    the actions/cache step of the workflow) renders every page and relies on the
+    content comparison alone.
+
+    Args:
+        pages (dict): Location key mapped to the data returned by db_utils.get_data_from_database.
+        out_dir (str): Directory the pages are written to.
+        workers (int): Number of parallel renderers.
+        processes (bool): True to render in a process pool, False to use threads.
+
+    Returns:
+        list: Paths of the files that were written.
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+    os.makedirs(state_dir(out_dir), exist_ok=True)
+
+    manifest_path = os.path.join(state_dir(out_dir), MANIFEST_NAME)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    new_manifest = {}
+    locations = []
+    jobs = []
+
+    for location, weather_data in pages.items():
+        if not weather_data or not weather_data.get('last_data'):
+            print(f"No weather data for {location}, skipping its page.")
+            continue
+
+        name = page_name(location)
+        locations.append((location, name, weather_data))
+        file_path = os.path.join(out_dir, name)
+        digest = data_hash(weather_data)
+        new_manifest[name] = digest
+
+        if manifest.get(name) != digest or not os.path.exists(file_path):
+            jobs.append((file_path, weather_data))
+
+    written = []
+    metrics.annotate(pages=len(jobs))
+
+    if jobs:
+        if processes and len(jobs) > 1:
+            # Imported here because multiprocessing is slow to import and a single page doesn't need it
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor
+        else:
+            pool = ThreadPoolExecutor
+        with pool(max_workers=max(1, min(workers, len(jobs)))) as executor:
+            futures = [executor.submit(render_location_page, *job) for job in jobs]
+
+            for future in futures:
+                file_path, changed, error = future.result()
+                if error:
+                    print(f"Error generating {file_path}: {error}")
+                    # Forget the hash so the page is rendered again on the next build
+                    new_manifest[os.path.basename(file_path)] = None
+                elif changed:
+                    written.append(file_path)
+
+    # Index page
+    index = sorted(locations)
+    index_name = "index.html"
+    index_path = os.path.join(out_dir, index_name)
+    # Only the latest reading of every location is on the index, so only that is hashed
+    index_digest = data_hash(dash_gen.index_rows(index))
+    new_manifest[index_name] = index_digest
+
+    if manifest.get(index_name) != index_digest or not os.path.exists(index_path):
+        if write_if_changed(index_path, dash_gen.render_index, index):
+            written.append(index_path)
+
+    if new_manifest != manifest:
+        with open(manifest_path, "w") as f:
+            json.dump(new_manifest, f, indent=2, sort_keys=True)
+
+    return written
@@ -0,0 +1,111 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Directory of the pipeline modules, so the benchmark can be started from anywhere
+PYTHON_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(stderr):
+    """
+    Parses the output of python -X importtime.
+
+    Args:
+        stderr (str): Standard error of the measured process.
+
+    Returns:
+        list: (module, self_us, cumulative_us, depth) tuples in import order.
+    """
+
+    imports = []
+
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        module = name.lstrip()
+        depth = (len(name) - len(module) - 1) // 2
+        imports.append((module, int(self_us), int(cumulative_us), depth))
+
+    return imports
+
+
+def summarize(imports, top=15):
+    """
+    Sums the import times per top-level package.
+
+    Args:
+        imports (list): The result of parse_importtime.
+        top (int): Number of packages to return.
+
+    Returns:
+        tuple: Total import time in microseconds and a list of (package, microseconds)
+               pairs, slowest first.
+    """
+
+    total = sum(cumulative for _, _, cumulative, depth in imports if depth == 0)
+
+    packages = {}
+    for module, self_us, _, _ in imports:
+        package = module.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+
+    return total, sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def measure(command, runs):
+    """
+    Runs a command several times with -X importtime.
+
+    Args:
+        command (list): Arguments passed to the interpreter.
+        runs (int): Number of runs.
+
+    Returns:
+        tuple: Wall times in seconds and the parsed imports of the last run.
+    """
+
+    times = []
+    imports = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime"] + command, cwd=PYTHON_DIR,
+                                 capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+        imports = parse_importtime(process.stderr)
+
+    return times, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the cold start of script.py with -X importtime.")
+    parser.add_argument("--runs", type=int, default=5, help="number of runs per command")
+    parser.add_argument("--top", type=int, default=15, help="number of packages to list")
+    parser.add_argument("--modules", nargs="+", default=["script", "data_utils", "db_utils", "supabase", "requests"],
+                        help="modules whose import is measured")
+    args = parser.parse_args()
+
+    # Interpreter start-up alone, as a baseline
+    commands = [("python -c pass", ["-c", "pass"]),
+                ("script.py --help", ["script.py", "--help"])]
+    commands += [(f"import {module}", ["-c", f"import {module}"]) for module in args.modules]
+
+    for label, command in commands:
+        times, imports = measure(command, args.runs)
+        total, packages = summarize(imports, args.top)
+
+        print(f"{label}: median {statistics.median(times) * 1000:.1f} ms wall, "
+              f"{total / 1000:.1f} ms imports ({len(imports)} modules)")
+
+        if label == "script.py --help":
+            for package, self_us in packages:
+                print(f"    {package:<28} {self_us / 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,666 @@
+import datetime
+import os
+import re
+import sqlite3
+import threading
+
+import data_utils as du
+
+# Columns of weather_data that are written by the pipeline
+COLUMNS = ('created_at', 'temperature_c', 'humidity', 'wind_speed', 'pressure', 'condition_text', 'location')
+
+# Same thresholds as the stored functions in sql/stored_functions.sql
+RAIN_CONDITION = "Rain"
+COLD_THRESHOLD = 0
+WARM_THRESHOLD = 35
+
+# Stored functions that return a single value instead of a set of rows
+SCALAR_FUNCTIONS = ('get_rainy_days', 'hour_avg_temp', 'count_cold_days', 'count_warm_days',
+                    'dashboard_snapshot', 'rebuild_weather_rollups')
+
+OPERATORS = {'eq': '=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+
+class Response:
+    """
+    Result of a query, shaped like the responses of the Supabase client.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+
+class Call:
+    """
+    A stored function call that runs when execute() is called.
+    """
+
+    def __init__(self, function, params):
+        self.function = function
+        self.params = params
+
+    def execute(self):
+        return Response(self.function(**self.params))
+
+
+class Table:
+    """
+    The part of the Supabase query builder used by db_utils: inserts, upserts and
+    filtered, ordered and limited selects on weather_data.
+    """
+
+    def __init__(self, backend, name):
+        if name != "weather_data":
+            raise ValueError(f"Unknown table: {name}")
+
+        self.backend = backend
+        self.columns = "*"
+        self.filters = []
+        self.order_by = None
+        self.descending = False
+        self.row_limit = None
+        self.rows = None
+        self.on_conflict = None
+
+    def select(self, columns="*"):
+        self.columns = columns
+        return self
+
+    def insert(self, rows):
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict=""):
+        self.insert(rows)
+        self.on_conflict = on_conflict or None
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, 'eq', value))
+        return self
+
+    def gt(self, column, value):
+        self.filters.append((column, 'gt', value))
+        return self
+
+    def gte(self, column, value):
+        self.filters.append((column, 'gte', value))
+        return self
+
+    def lt(self, column, value):
+        self.filters.append((column, 'lt', value))
+        return self
+
+    def lte(self, column, value):
+        self.filters.append((column, 'lte', value))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = column
+        self.descending = desc
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        if self.rows is not None:
+            return Response(self.backend.insert_rows(self.rows, self.on_conflict))
+
+        return Response(self.backend.select_rows(self.columns, self.filters, self.order_by,
+                                                  self.descending, self.row_limit))
+
+
+class StorageBackend:
+    """
+    Storage interface behind the db_utils API.
+
+    A backend offers the same calls db_utils makes on a Supabase client:
+    rpc(name, params) for the stored functions and table("weather_data") for
+    inserts, upserts and paged reads. Subclasses implement the stored functions
+    as rpc_<name> methods, and insert_rows and select_rows.
+    """
+
+    def rpc(self, name, params=None):
+        function = getattr(self, "rpc_" + name, None)
+        if function is None:
+            raise NotImplementedError(f"{type(self).__name__} does not implement {name}.")
+        return Call(function, params or {})
+
+    def table(self, name):
+        return Table(self, name)
+
+    def insert_rows(self, rows, on_conflict=None):
+        raise NotImplementedError
+
+    def select_rows(self, columns, filters, order_by=None, descending=False, limit=None):
+        raise NotImplementedError
+
+    def rpc_dashboard_snapshot(self, current_hour, current_month, current_year, p_location=None):
+        if p_location:
+            seven_days = self.rpc_get_location_seven_days(p_location)
+        else:
+            seven_days = self.rpc_get_last_seven_days()
+
+        stats = self.rpc_period_stats([current_year], [current_month], current_hour, p_location=p_location)[0]
+
+        return {
+            'last_data': self.rpc_get_last_data(p_location),
+            'seven_days': seven_days,
+            'rainy_days': stats['rainy_days'],
+            'hour_avg_temp': stats['hour_avg_temp'],
+            'cold_days': stats['cold_days'],
+            'warm_days': stats['warm_days'],
+        }
+
+    def close(self):
+        pass
+
+
+class SQLBackend(StorageBackend):
+    """
+    Stored functions implemented as plain SQL over a DB-API connection.
+
+    Subclasses provide the dialect: the placeholder style, the expressions for
+    the day and hour of created_at, and the conversion of timestamps.
+    """
+
+    placeholder = "?"
+    day_expression = "date(created_at)"
+    hour_expression = "extract(hour from created_at)"
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.lock = threading.Lock()
+
+    # Dialect hooks
+
+    def to_db_timestamp(self, value):
+        """
+        Converts a naive UTC datetime into a query parameter.
+        """
+
+        return value
+
+    def from_db_timestamp(self, value):
+        """
+        Converts a created_at value returned by the database into a naive UTC datetime.
+        """
+
+        return du.parse_timestamp(value)
+
+    def begin(self):
+        pass
+
+    def cursor(self):
+        return self.connection.cursor()
+
+    def release(self, cursor):
+        cursor.close()
+
+    def commit(self):
+        self.connection.commit()
+
+    # Query helpers
+
+    def query(self, sql, params=()):
+        """
+        Runs a query and returns all rows as tuples.
+        """
+
+        if self.placeholder != "?":
+            sql = sql.replace("?", self.placeholder)
+
+        with self.lock:
+            cursor = self.cursor()
+            try:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall() if cursor.description else []
+            finally:
+                self.release(cursor)
+            self.commit()
+
+        return rows
+
+    def scalar(self, sql, params=()):
+        rows = self.query(sql, params)
+        return rows[0][0] if rows else None
+
+    def month_range(self, year, month):
+        start = datetime.datetime(year, month, 1)
+        end = datetime.datetime(*du.shift_month(year, month, 1), 1)
+        return self.to_db_timestamp(start), self.to_db_timestamp(end)
+
+    # Writes and reads on the weather_data table
+
+    def normalize_rows(self, rows):
+        """
+        Keeps the known columns of each row and parses created_at (defaulting to now).
+
+        Returns:
+            list: A list of dictionaries with a naive UTC datetime in 'created_at'.
+        """
+
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        normalized = []
+
+        for row in rows:
+            row = {column: row.get(column) for column in COLUMNS}
+            row['created_at'] = du.parse_timestamp(row['created_at']) if row['created_at'] else now
+            normalized.append(row)
+
+        return normalized
+
+    def on_conflict_clause(self, on_conflict):
+        """
+        Builds the "on conflict ... do update" clause of an upsert.
+        """
+
+        keys = [self._column(column.strip()) for column in on_conflict.split(",")]
+        updates = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS if column not in keys)
+        return f" on conflict ({', '.join(keys)}) do update set {updates}"
+
+    def insert_rows(self, rows, on_conflict=None):
+        normalized = self.normalize_rows(rows)
+
+        sql = (f"insert into weather_data ({', '.join(COLUMNS)}) "
+               f"values ({', '.join('?' for _ in COLUMNS)})")
+
+        if on_conflict:
+            sql += self.on_conflict_clause(on_conflict)
+
+        if self.placeholder != "?":
+            sql = sql.replace("?", self.placeholder)
+
+        params = [[self.to_db_timestamp(row[column]) if column == 'created_at' else row[column]
+                   for column in COLUMNS] for row in normalized]
+
+        # All rows are written in one transaction, so a failed batch writes nothing
+        with self.lock:
+            cursor = self.cursor()
+            try:
+                self.begin()
+                cursor.executemany(sql, params)
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+            finally:
+                self.release(cursor)
+
+        for row in normalized:
+            row['created_at'] = row['created_at'].replace(tzinfo=datetime.timezone.utc).isoformat()
+        return normalized
+
+    def select_rows(self, columns, filters, order_by=None, descending=False, limit=None):
+        if columns == "*":
+            names = ['id'] + list(COLUMNS)
+        else:
+            names = [self._column(column.strip()) for column in columns.split(",")]
+
+        sql = f"select {', '.join(names)} from weather_data"
+        params = []
+
+        if filters:
+            conditions = []
+            for column, operator, value in filters:
+                column = self._column(column)
+                if column == 'created_at':
+                    value = self.to_db_timestamp(du.parse_timestamp(value))
+                conditions.append(f"{column} {OPERATORS[operator]} ?")
+                params.append(value)
+            sql += " where " + " and ".join(conditions)
+
+        if order_by:
+            sql += f" order by {self._column(order_by)} {'desc' if descending else 'asc'}"
+        if limit is not None:
+            sql += f" limit {int(limit)}"
+
+        result = []
+        for values in self.query(sql, params):
+            row = dict(zip(names, values))
+            if row.get('created_at') is not None:
+                row['created_at'] = (self.from_db_timestamp(row['created_at'])
+                                     .replace(tzinfo=datetime.timezone.utc).isoformat())
+            result.append(row)
+
+        return result
+
+    # Stored functions
+
+    def rpc_get_last_data(self, p_location=None):
+        sql = ("select created_at, temperature_c, humidity, wind_speed, pressure, condition_text "
+               "from weather_data")
+        params = []
+        if p_location:
+            sql += " where location = ?"
+            params.append(p_location)
+        sql += " order by created_at desc limit 12"
+
+        result = []
+        for created_at, temp, hum, wind, press, condition in self.query(sql, params):
+            created_at = self.from_db_timestamp(created_at)
+            result.append({'d': created_at.date().isoformat(), 't': created_at.time().isoformat(),
+                           'temp': temp, 'hum': hum, 'wind': wind, 'press': press, 'condition': condition})
+        return result
+
+    def rpc_get_last_seven_days(self):
+        return self._seven_days(None)
+
+    def rpc_get_location_seven_days(self, p_location):
+        return self._seven_days(p_location)
+
+    def _seven_days(self, location):
+        since = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - datetime.timedelta(days=8)
+
+        sql = (f"select {self.day_expression} as ts, min(temperature_c), max(temperature_c) "
+               f"from weather_data where created_at >= ?")
+        params = [self.to_db_timestamp(since)]
+        if location:
+            sql += " and location = ?"
+            params.append(location)
+        sql += f" group by {self.day_expression} order by ts desc limit 7 offset 1"
+
+        return [{'ts': str(ts), 'min_temp': min_temp, 'max_temp': max_temp}
+                for ts, min_temp, max_temp in self.query(sql, params)]
+
+    def _count_days(self, current_month, current_year, condition, value):
+        start, end = self.month_range(current_year, current_month)
+        return self.scalar(f"select count(distinct {self.day_expression}) from weather_data "
+                           f"where created_at >= ? and created_at < ? and {condition}",
+                           (start, end, value))
+
+    def rpc_get_rainy_days(self, current_month, current_year):
+        return self._count_days(current_month, current_year, "condition_text = ?", RAIN_CONDITION)
+
+    def rpc_count_cold_days(self, current_month, current_year):
+        return self._count_days(current_month, current_year, "temperature_c <= ?", COLD_THRESHOLD)
+
+    def rpc_count_warm_days(self, current_month, current_year):
+        return self._count_days(current_month, current_year, "temperature_c >= ?", WARM_THRESHOLD)
+
+    def rpc_hour_avg_temp(self, current_hour, current_month, current_year):
+        start, end = self.month_range(current_year, current_month)
+        return self.scalar(f"select avg(temperature_c) from weather_data "
+                           f"where created_at >= ? and created_at < ? and {self.hour_expression} = ?",
+                           (start, end, current_hour))
+
+    def rpc_period_stats(self, p_years, p_months, current_hour=None, rain_condition=RAIN_CONDITION,
+                         cold_threshold=COLD_THRESHOLD, warm_threshold=WARM_THRESHOLD, p_location=None):
+        periods = sorted(set(zip(p_years, p_months)))
+        if not periods:
+            return []
+
+        # One scan over all the months, grouped by day and hour
+        start = datetime.datetime(*periods[0], 1)
+        end = datetime.datetime(*du.shift_month(*periods[-1], 1), 1)
+        params = [rain_condition, self.to_db_timestamp(start), self.to_db_timestamp(end)]
+        location_filter = ""
+        if p_location:
+            location_filter = "and location = ? "
+            params.append(p_location)
+
+        rows = self.query(f"select {self.day_expression}, {self.hour_expression}, min(temperature_c), "
+                          f"max(temperature_c), sum(temperature_c), count(temperature_c), "
+                          f"max(case when condition_text = ? then 1 else 0 end) "
+                          f"from weather_data where created_at >= ? and created_at < ? {location_filter}"
+                          f"group by {self.day_expression}, {self.hour_expression}",
+                          tuple(params))
+
+        months = {period: {'year': period[0], 'month': period[1], 'rainy': set(), 'cold': set(), 'warm': set(),
+                           'sum': 0.0, 'count': 0} for period in periods}
+
+        for day, hour, min_temp, max_temp, sum_temp, count, rainy in rows:
+            day = str(day)
+            month = months.get((int(day[:4]), int(day[5:7])))
+            if month is None:
+                continue
+
+            if rainy:
+                month['rainy'].add(day)
+            if min_temp is not None and min_temp <= cold_threshold:
+                month['cold'].add(day)
+            if max_temp is not None and max_temp >= warm_threshold:
+                month['warm'].add(day)
+            if current_hour is not None and int(hour) == int(current_hour) and count:
+                month['sum'] += sum_temp
+                month['count'] += count
+
+        return [{'year': month['year'], 'month': month['month'], 'rainy_days': len(month['rainy']),
+                 'cold_days': len(month['cold']), 'warm_days': len(month['warm']),
+                 'hour_avg_temp': month['sum'] / month['count'] if month['count'] else None}
+                for month in months.values()]
+
+    def rpc_rebuild_weather_rollups(self, start_day=None, end_day=None):
+        # Embedded backends aggregate the raw rows directly and have no rollups
+        return 0
+
+    def rpc_maintain_weather_partitions(self, months_ahead=3, retention_months=None, expired_action='detach'):
+        # Embedded backends store weather_data in a single table
+        return []
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _column(name):
+        if name != 'id' and name not in COLUMNS:
+            raise ValueError(f"Unknown column: {name}")
+        return name
+
+
+class SQLiteBackend(SQLBackend):
+    """
+    Embedded backend storing weather_data in a SQLite file.
+
+    Timestamps are stored as "YYYY-MM-DD HH:MM:SS.ffffff" text in UTC, which sorts
+    and compares correctly as text.
+    """
+
+    day_expression = "date(created_at)"
+    hour_expression = "cast(strftime('%H', created_at) as integer)"
+
+    def __init__(self, path):
+        super().__init__(sqlite3.connect(path, check_same_thread=False))
+        self.connection.executescript("""
+            create table if not exists weather_data (
+                id integer primary key autoincrement,
+                created_at text not null,
+                temperature_c real,
+                humidity integer,
+                wind_speed real,
+                pressure integer,
+                condition_text text,
+                location text
+            );
+            create index if not exists weather_data_created_at_idx on weather_data (created_at);
+            create unique index if not exists weather_data_location_created_at_key
+                on weather_data (location, created_at);
+        """)
+
+    def to_db_timestamp(self, value):
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+class DuckDBBackend(SQLBackend):
+    """
+    Embedded backend storing weather_data in a DuckDB file. Timestamps are stored in UTC.
+    """
+
+    day_expression = "cast(created_at as date)"
+    hour_expression = "extract(hour from created_at)"
+
+    def __init__(self, path):
+        import duckdb
+
+        super().__init__(duckdb.connect(path))
+        self.connection.execute("create sequence if not exists weather_data_id_seq")
+        self.connection.execute("""
+            create table if not exists weather_data (
+                id bigint primary key default nextval('weather_data_id_seq'),
+                created_at timestamp not null,
+                temperature_c double,
+                humidity integer,
+                wind_speed double,
+                pressure integer,
+                condition_text varchar,
+                location varchar,
+                unique (location, created_at)
+            )""")
+
+    def begin(self):
+        self.connection.begin()
+
+    def cursor(self):
+        # A DuckDB cursor is a separate connection; use the main one so transactions apply
+        return self.connection
+
+    def release(self, cursor):
+        pass
+
+    def commit(self):
+        # Queries outside insert_rows run in auto-commit mode
+        pass
+
+    def from_db_timestamp(self, value):
+        return value
+
+
+class PostgresBackend(SQLBackend):
+    """
+    Direct PostgreSQL mode that bypasses PostgREST.
+
+    Queries run on connections from a psycopg connection pool. The stored
+    functions from sql/stored_functions.sql are called as server-side prepared
+    statements, and rows are written with binary COPY. Upserts are copied into
+    a temporary table first and merged with a single insert ... on conflict.
+    """
+
+    placeholder = "%s"
+
+    # Binary COPY types of COLUMNS, matching the weather_data table
+    COPY_TYPES = ('timestamptz', 'real', 'smallint', 'real', 'smallint', 'text', 'text')
+
+    # Binary COPY sends smallints as two bytes without a range check, so larger values would wrap around
+    SMALLINT_RANGE = (-32768, 32767)
+
+    def __init__(self, url, min_size=1, max_size=10):
+        from psycopg_pool import ConnectionPool
+
+        self.pool = ConnectionPool(url, min_size=min_size, max_size=max_size, open=True)
+
+    def to_db_timestamp(self, value):
+        return value.replace(tzinfo=datetime.timezone.utc)
+
+    def query(self, sql, params=()):
+        if self.placeholder != "?":
+            sql = sql.replace("?", self.placeholder)
+
+        # The pool commits when the connection is returned
+        with self.pool.connection() as connection:
+            cursor = connection.execute(sql, params, prepare=True)
+            return cursor.fetchall() if cursor.description else []
+
+    def insert_rows(self, rows, on_conflict=None):
+        normalized = self.normalize_rows(rows)
+        columns = ", ".join(COLUMNS)
+
+        low, high = self.SMALLINT_RANGE
+        for row in normalized:
+            for column, kind in zip(COLUMNS, self.COPY_TYPES):
+                if kind == 'smallint' and row[column] is not None and not low <= row[column] <= high:
+                    raise ValueError(f"{column} out of range for type smallint: {row[column]}")
+
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                if on_conflict:
+                    cursor.execute(f"create temp table weather_data_load on commit drop as "
+                                   f"select {columns} from weather_data with no data")
+                    target = "weather_data_load"
+                else:
+                    target = "weather_data"
+
+                with cursor.copy(f"copy {target} ({columns}) from stdin (format binary)") as copy:
+                    copy.set_types(self.COPY_TYPES)
+                    for row in normalized:
+                        copy.write_row([self.to_db_timestamp(row[column]) if column == 'created_at'
+                                        else row[column] for column in COLUMNS])
+
+                if on_conflict:
+                    cursor.execute(f"insert into weather_data ({columns}) "
+                                   f"select {columns} from weather_data_load"
+                                   + self.on_conflict_clause(on_conflict))
+
+        for row in normalized:
+            row['created_at'] = row['created_at'].replace(tzinfo=datetime.timezone.utc).isoformat()
+        return normalized
+
+    def rpc(self, name, params=None):
+        if not re.fullmatch(r"[a-z_][a-z0-9_]*", name):
+            raise ValueError(f"Invalid function name: {name}")
+
+        params = params or {}
+        arguments = ", ".join(f"{key} => %s" for key in params)
+
+        for key in params:
+            if not re.fullmatch(r"[a-z_][a-z0-9_]*", key):
+                raise ValueError(f"Invalid parameter name: {key}")
+
+        def call():
+            if name in SCALAR_FUNCTIONS:
+                return to_json_value(self.scalar(f"select {name}({arguments})", list(params.values())))
+
+            with self.pool.connection() as connection:
+                cursor = connection.execute(f"select * from {name}({arguments})", list(params.values()),
+                                            prepare=True)
+                names = [column.name for column in cursor.description]
+                rows = cursor.fetchall()
+
+            return [{key: to_json_value(value) for key, value in zip(names, row)} for row in rows]
+
+        return Call(call, {})
+
+    def close(self):
+        self.pool.close()
+
+
+def to_json_value(value):
+    """
+    Converts a database value into the form PostgREST would return it in.
+    """
+
+    if isinstance(value, (datetime.date, datetime.time, datetime.datetime)):
+        return value.isoformat()
+    if value is not None and type(value).__name__ == 'Decimal':
+        return float(value)
+    return value
+
+
+def create_backend(name):
+    """
+    Creates a storage backend from its name and the environment.
+
+    Args:
+        name (str): 'sqlite' (SQLITE_PATH), 'duckdb' (DUCKDB_PATH) or 'postgres'
+                    (DATABASE_URL, DB_POOL_SIZE).
+
+    Returns:
+        StorageBackend: The backend, or None if it could not be created.
+    """
+
+    try:
+        if name == "sqlite":
+            return SQLiteBackend(os.environ.get("SQLITE_PATH", "weather.db"))
+        if name == "duckdb":
+            return DuckDBBackend(os.environ.get("DUCKDB_PATH", "weather.duckdb"))
+        if name == "postgres":
+            return PostgresBackend(os.environ["DATABASE_URL"],
+                                   max_size=int(os.environ.get("DB_POOL_SIZE", "10")))
+
+        print(f"Error: unknown storage backend {name}.")
+        return None
+
+    except Exception as e:
+        print(f"Error: could not open the {name} storage backend: {e}")
+        return None
@@ -0,0 +1,213 @@
+import datetime
+
+import numpy as np
+
+# Readings per location per year at the default 10 minute interval
+ROWS_PER_LOCATION_YEAR = 365 * 24 * 6
+
+# Average length of dry and rainy spells, in readings
+DRY_SPELL = 180
+RAIN_SPELL = 24
+
+
+def parse_count(value):
+    """
+    Parses a row count such as "1000", "10k" or "100M".
+
+    Args:
+        value (str): The count, with an optional k or M suffix.
+
+    Returns:
+        int: The number of rows.
+    """
+
+    value = value.strip()
+    multipliers = {'k': 1000, 'K': 1000, 'm': 1000000, 'M': 1000000}
+
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+def default_locations(count):
+    """
+    Returns the number of locations that keeps every location within about a year of readings.
+    """
+
+    return max(1, -(-count // ROWS_PER_LOCATION_YEAR))
+
+
+def location_keys(locations):
+    """
+    Returns the "lat,lon" keys of the synthetic locations.
+
+    Args:
+        locations (int): Number of locations.
+
+    Returns:
+        list: Location keys on a grid around Belgrade.
+    """
+
+    return [f"{44.0 + (i // 50) * 0.1:.2f},{20.0 + (i % 50) * 0.1:.2f}" for i in range(locations)]
+
+
+def generate_columns(count, locations=None, end=None, interval=600, seed=0, chunk_size=100000):
+    """
+    Generates realistic weather_data columns in chunks.
+
+    Temperatures follow a seasonal and a diurnal cycle (coldest before sunrise,
+    warmest mid-afternoon) plus noise. Rain comes in spells: dry and rainy periods
+    alternate with random lengths, and rainy readings are cooler, more humid and
+    have a lower pressure. The readings of each location are interval seconds apart
+    and end at end, so the stored functions find data in the current month.
+
+    Args:
+        count (int): Total number of rows.
+        locations (int): Number of locations (defaults to default_locations(count)).
+        end (datetime.datetime): Time of the last reading (defaults to now, UTC).
+        interval (int): Seconds between two readings of a location.
+        seed (int): Random seed; the same arguments always produce the same rows.
+        chunk_size (int): Maximum number of rows per chunk.
+
+    Yields:
+        dict: Column name mapped to a numpy array ('created_at' is datetime64[s]),
+              for one location and at most chunk_size rows.
+    """
+
+    locations = locations or default_locations(count)
+    end = end or datetime.datetime.now(datetime.timezone.utc)
+    end = np.datetime64(end.replace(tzinfo=None), 's')
+    end -= end.astype(np.int64) % interval
+    rng = np.random.default_rng(seed)
+
+    for index, key in enumerate(location_keys(locations)):
+        rows = count // locations + (index < count % locations)
+        latitude = float(key.split(",")[0])
+
+        # Colder climates further north
+        base = 12.0 - (latitude - 44.0) * 0.6
+
+        raining = False
+        for offset in range(0, rows, chunk_size):
+            size = min(chunk_size, rows - offset)
+            steps = np.arange(rows - offset - size, rows - offset)[::-1]
+            created_at = end - steps * np.timedelta64(interval, 's')
+
+            day_of_year = (created_at.astype('datetime64[D]') - created_at.astype('datetime64[Y]')).astype(np.int64)
+            hour = (created_at - created_at.astype('datetime64[D]')).astype(np.int64) / 3600.0
+
+            # Alternating dry and rainy spells with geometric lengths
+            spells = rng.geometric(1 / min(DRY_SPELL, RAIN_SPELL), size=size // RAIN_SPELL + 2)
+            states = (np.arange(len(spells)) % 2 == 1) != raining
+            lengths = np.where(states, spells, spells * (DRY_SPELL // RAIN_SPELL))
+            rain = np.repeat(states, lengths)[:size]
+            if len(rain) < size:
+                rain = np.concatenate([rain, np.zeros(size - len(rain), dtype=bool)])
+            raining = bool(rain[-1])
+
+            seasonal = -10.0 * np.cos(2 * np.pi * (day_of_year - 15) / 365.0)
+            diurnal = 5.0 * np.sin(2 * np.pi * (hour - 9) / 24.0)
+            temperature = base + seasonal + diurnal + rng.normal(0, 1.5, size) - 2.5 * rain
+
+            humidity = np.clip(65 - 1.5 * diurnal + 25 * rain + rng.normal(0, 6, size), 10, 100)
+            pressure = 1015 - 8 * rain + rng.normal(0, 4, size)
+            wind_speed = np.abs(rng.gamma(2.0, 1.6, size) + 2 * rain)
+
+            clouds = rng.random(size) < 0.4
+            condition_text = np.where(rain, "Rain", np.where(clouds, "Clouds", "Clear")).astype(object)
+
+            yield {
+                'created_at': created_at,
+                'temperature_c': np.round(temperature, 2),
+                'humidity': humidity.astype(np.int64),
+                'wind_speed': np.round(wind_speed, 2),
+                'pressure': pressure.astype(np.int64),
+                'condition_text': condition_text,
+                'location': np.full(size, key, dtype=object),
+            }
+
+
+def generate_rows(count, locations=None, end=None, interval=600, seed=0, chunk_size=100000):
+    """
+    Generates weather_data rows as dictionaries, in the shape written by the pipeline.
+
+    Rows are produced lazily, so even 100M rows can be streamed into a database.
+    The arguments are those of generate_columns.
+
+    Yields:
+        dict: A weather_data row with a UTC ISO 'created_at'.
+    """
+
+    for columns in generate_columns(count, locations, end, interval, seed, chunk_size):
+        created_at = [f"{value}+00:00" for value in columns['created_at'].astype(str)]
+        values = zip(created_at, columns['temperature_c'].tolist(), columns['humidity'].tolist(),
+                     columns['wind_speed'].tolist(), columns['pressure'].tolist(),
+                     columns['condition_text'], columns['location'])
+
+        for created, temperature_c, humidity, wind_speed, pressure, condition_text, location in values:
+            yield {
+                'created_at': created,
+                'temperature_c': temperature_c,
+                'humidity': humidity,
+                'wind_speed': wind_speed,
+                'pressure': pressure,
+                'condition_text': condition_text,
+                'location': location,
+            }
+
+
+def api_response(row):
+    """
+    Builds an OpenWeatherMap current weather response for a synthetic row.
+
+    Args:
+        row (dict): A row from generate_rows.
+
+    Returns:
+        dict: The response, as returned by data_utils.fetch_weather_data.
+    """
+
+    lat, lon = row['location'].split(",")
+    created_at = datetime.datetime.fromisoformat(row['created_at'])
+
+    return {
+        'coord': {'lon': float(lon), 'lat': float(lat)},
+        'weather': [{'id': 500 if row['condition_text'] == "Rain" else 800, 'main': row['condition_text'],
+                     'description': row['condition_text'].lower(), 'icon': "01d"}],
+        'base': "stations",
+        'main': {'temp': row['temperature_c'], 'feels_like': row['temperature_c'],
+                 'pressure': row['pressure'], 'humidity': row['humidity']},
+        'visibility': 10000,
+        'wind': {'speed': row['wind_speed'], 'deg': 180},
+        'clouds': {'all': 75 if row['condition_text'] != "Clear" else 0},
+        'dt': int(created_at.timestamp()),
+        'sys': {'country': "RS"},
+        'timezone': 7200,
+        'name': "Synthetic",
+        'cod': 200,
+    }
+
+
+def dashboard_data(rows):
+    """
+    Builds dashboard data in the shape of get_data_from_database from synthetic rows.
+
+    Args:
+        rows (list): Rows from generate_rows, newest last. All of them go into 'last_data'.
+
+    Returns:
+        dict: Data that can be passed to dashboard_generator.generate_html.
+    """
+
+    last_data = []
+    for row in reversed(rows):
+        created_at = datetime.datetime.fromisoformat(row['created_at'])
+        last_data.append({'d': created_at.date().isoformat(), 't': created_at.time().isoformat(),
+                          'temp': row['temperature_c'], 'hum': row['humidity'], 'wind': row['wind_speed'],
+                          'press': row['pressure'], 'condition': row['condition_text']})
+
+    seven_days = [{'ts': (datetime.date.today() - datetime.timedelta(days=day)).isoformat(),
+                   'min_temp': 10.0 - day, 'max_temp': 20.0 + day} for day in range(1, 8)]
+
+    return {'last_data': last_data, 'seven_days': seven_days, 'rainy_days': 4,
+            'hour_avg_temp': 17.5, 'cold_days': 2, 'warm_days': 0}
@@ -0,0 +1,76 @@
+-- Regression check: the date filters used by the stored functions must be
+-- able to use an index. Sequential scans are disabled for the check, so a plan
+-- that still contains a Seq Scan means a predicate is no longer sargable.
+-- The queries below mirror the bodies of the functions in stored_functions.sql.
+-- Raises an exception on failure.
+
+do $$
+declare
+  month_start date := date_trunc('month', now())::date;
+  plan json;
+  check_query text;
+  queries text[] := array[
+    -- get_rainy_days / count_cold_days / count_warm_days
+    'select count(distinct day) from weather_daily
+     where day >= %1$L::date and day < %1$L::date + interval ''1 month''
+       and rainy',
+    -- hour_avg_temp
+    'select sum(sum_temp) / nullif(sum(readings), 0) from weather_hourly
+     where day >= %1$L::date and day < %1$L::date + interval ''1 month''
+       and hour = 12',
+    -- period_stats for this month and the last one
+    'select day, hour, min_temp, max_temp, sum_temp, readings, rainy from weather_hourly
+     where day >= %1$L::date - interval ''1 month'' and day < %1$L::date + interval ''1 month''',
+    -- get_last_seven_days
+    'select day, min(min_temp), max(max_temp) from weather_daily
+     where day >= (now() - interval ''8 days'')::date
+     group by day order by day desc limit 7 offset 1',
+    -- get_location_seven_days
+    'select day, min_temp, max_temp from weather_daily
+     where location = (select location from weather_daily order by location limit 1)
+       and day >= (now() - interval ''8 days'')::date
+     order by day desc limit 7 offset 1',
+    -- period_stats for one location
+    'select day, hour, min_temp, max_temp, sum_temp, readings, rainy from weather_hourly
+     where location = (select location from weather_hourly order by location limit 1)
+       and day >= %1$L::date - interval ''1 month'' and day < %1$L::date + interval ''1 month''',
+    -- get_last_data
+    'select date(created_at), created_at::time, temperature_c, humidity, wind_speed, pressure, condition_text
+     from weather_data
+     order by weather_data.created_at desc limit 12',
+    -- get_last_data for one location
+    'select date(created_at), created_at::time, temperature_c, humidity, wind_speed, pressure, condition_text
+     from weather_data
+     where location_id = (select id from locations where key = (select key from locations order by id limit 1))
+     order by weather_data.created_at desc limit 12',
+    -- rebuild_weather_rollups
+    'select location, date(created_at), min(temperature_c), max(temperature_c) from weather_data
+     where created_at >= %1$L and created_at < %1$L::timestamptz + interval ''1 month''
+     group by location, date(created_at)'
+  ];
+begin
+  perform set_config('enable_seqscan', 'off', true);
+
+  foreach check_query in array queries loop
+    execute 'explain (format json) ' || format(check_query, month_start) into plan;
+
+    if plan::text like '%"Seq Scan"%' then
+      raise exception 'Sequential scan in: %', check_query;
+    end if;
+  end loop;
+
+  -- On the partitioned table, a month's range must only touch that month's partition
+  -- (and the default partition, which can hold rows of months without a partition)
+  if (select relkind from pg_class where oid = 'weather_data'::regclass) = 'p' then
+    execute format('explain (format json) select count(*) from weather_data
+                    where created_at >= %1$L and created_at < %1$L::timestamptz + interval ''1 month''',
+                   month_start::timestamp at time zone 'UTC') into plan;
+
+    if plan::text ~ '"Relation Name": "weather_data_\d{4}_\d{2}".*"Relation Name": "weather_data_\d{4}_\d{2}"' then
+      raise exception 'A one month range scans more than one partition.';
+    end if;
+  end if;
+
+  raise notice 'All % queries use index scans.', array_length(queries, 1);
+end;
+$$;
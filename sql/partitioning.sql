@@ -0,0 +1,186 @@
+-- Converts weather_data into a table partitioned by month on created_at.
+--
+-- Order: schema.sql, then this file, then stored_functions.sql (which recreates
+-- the triggers on the new table). The conversion runs once; re-running the file
+-- only replaces the maintenance functions.
+--
+-- Partitions are named weather_data_YYYY_MM and cover [first day of the month,
+-- first day of the next month) in UTC. Rows outside the existing partitions go to
+-- weather_data_default until maintain_weather_partitions creates their month.
+-- Queries that filter or order on created_at only touch the partitions they need,
+-- and expired months can be detached instead of deleted row by row, so old data
+-- no longer costs vacuum or index maintenance.
+
+
+-- Name of the partition of the month that contains month_start
+create or replace function weather_partition_name(month_start date)
+returns text as $$
+  select 'weather_data_' || to_char(month_start, 'YYYY_MM');
+$$ language sql immutable;
+
+
+-- Creates the partition of one month, if it doesn't exist. Rows of that month that
+-- are in the default partition are moved into it. Returns true if it was created.
+create or replace function create_weather_partition(month_start date)
+returns boolean as $$
+declare
+  first_day date := date_trunc('month', month_start)::date;
+  partition_name text := weather_partition_name(first_day);
+  range_start timestamptz := first_day::timestamp at time zone 'UTC';
+  range_end timestamptz := (first_day + interval '1 month')::timestamp at time zone 'UTC';
+begin
+  if to_regclass(partition_name) is not null then
+    return false;
+  end if;
+
+  -- Created as a plain table and attached afterwards, so rows of the month can be
+  -- moved out of the default partition first (attaching fails while they are there)
+  execute format('create table %I (like weather_data including defaults including constraints)', partition_name);
+
+  execute format(
+    'with moved as (delete from weather_data_default where created_at >= $1 and created_at < $2 returning *)
+     insert into %I select * from moved', partition_name)
+  using range_start, range_end;
+
+  execute format('alter table weather_data attach partition %I for values from (%L) to (%L)',
+                 partition_name, range_start, range_end);
+
+  return true;
+end;
+$$ language plpgsql;
+
+
+-- Creates the partitions of the current month and the next months_ahead months,
+-- and of every month that has rows in the default partition.
+-- With retention_months, the partitions of months that ended more than
+-- retention_months months ago are detached, and then:
+--   'detach'  - left as standalone tables (weather_data_YYYY_MM),
+--   'archive' - moved into the weather_archive schema,
+--   'drop'    - dropped.
+-- The rollup tables are not touched, so the dashboard aggregates keep their history.
+-- Schedule it daily, e.g. with pg_cron:
+--   select cron.schedule('weather-partitions', '0 3 * * *',
+--                        $$select * from maintain_weather_partitions(3, 24, 'archive')$$);
+create or replace function maintain_weather_partitions(months_ahead int default 3,
+                                                       retention_months int default null,
+                                                       expired_action text default 'detach')
+returns table (partition_name text, action text) as $$
+declare
+  current_month date := date_trunc('month', now() at time zone 'UTC')::date;
+  cutoff date;
+  month_start date;
+  expired record;
+begin
+  if expired_action not in ('detach', 'archive', 'drop') then
+    raise exception 'expired_action must be detach, archive or drop, not %', expired_action;
+  end if;
+
+  for month_start in
+    select generate_series(current_month, current_month + make_interval(months => months_ahead), interval '1 month')::date
+    union
+    select distinct date_trunc('month', created_at at time zone 'UTC')::date from weather_data_default
+    order by 1
+  loop
+    if create_weather_partition(month_start) then
+      partition_name := weather_partition_name(month_start);
+      action := 'created';
+      return next;
+    end if;
+  end loop;
+
+  if retention_months is null then
+    return;
+  end if;
+
+  cutoff := current_month - make_interval(months => retention_months);
+
+  for expired in
+    select c.relname, n.nspname
+    from pg_inherits i
+    join pg_class c on c.oid = i.inhrelid
+    join pg_namespace n on n.oid = c.relnamespace
+    where i.inhparent = 'weather_data'::regclass
+      and c.relname ~ '^weather_data_\d{4}_\d{2}$'
+      and to_date(right(c.relname, 7), 'YYYY_MM') < cutoff
+    order by c.relname
+  loop
+    execute format('alter table weather_data detach partition %I.%I', expired.nspname, expired.relname);
+
+    if expired_action = 'archive' then
+      create schema if not exists weather_archive;
+      execute format('alter table %I.%I set schema weather_archive', expired.nspname, expired.relname);
+    elsif expired_action = 'drop' then
+      execute format('drop table %I.%I', expired.nspname, expired.relname);
+    end if;
+
+    partition_name := expired.relname;
+    action := case expired_action when 'detach' then 'detached' when 'archive' then 'archived' else 'dropped' end;
+    return next;
+  end loop;
+end;
+$$ language plpgsql;
+
+
+-- One-time conversion. The old table is kept as weather_data_unpartitioned; drop it
+-- once the new table has been checked. Row level security policies and grants that
+-- were added to weather_data by hand have to be recreated on the new table.
+do $$
+declare
+  month_start date;
+begin
+  if (select relkind from pg_class where oid = 'weather_data'::regclass) = 'p' then
+    raise notice 'weather_data is already partitioned.';
+    return;
+  end if;
+
+  alter table weather_data rename to weather_data_unpartitioned;
+  drop trigger if exists weather_rollup_insert on weather_data_unpartitioned;
+  drop trigger if exists weather_rollup_update on weather_data_unpartitioned;
+  drop trigger if exists weather_rollup_delete on weather_data_unpartitioned;
+  drop trigger if exists weather_data_location_id on weather_data_unpartitioned;
+
+  -- Free the index names for the partitioned table
+  alter index if exists weather_data_pkey rename to weather_data_unpartitioned_pkey;
+  alter index if exists weather_data_location_created_at_key rename to weather_data_unpartitioned_location_created_at_key;
+  alter index if exists weather_data_created_at_idx rename to weather_data_unpartitioned_created_at_idx;
+  alter index if exists weather_data_location_id_created_at_idx rename to weather_data_unpartitioned_location_id_created_at_idx;
+
+  -- Unique keys of a partitioned table must include created_at
+  create table weather_data (
+    id bigint generated by default as identity,
+    created_at timestamptz not null default now(),
+    temperature_c real,
+    humidity smallint,
+    wind_speed real,
+    pressure smallint,
+    condition_text text,
+    location text,
+    location_id integer references locations (id),
+    primary key (id, created_at)
+  ) partition by range (created_at);
+
+  create table weather_data_default partition of weather_data default;
+
+  -- Indexes on the parent are created on every partition
+  create unique index weather_data_location_created_at_key on weather_data (location, created_at);
+  create index weather_data_created_at_idx on weather_data (created_at) include (temperature_c, condition_text);
+  create index weather_data_location_id_created_at_idx
+    on weather_data (location_id, created_at desc) include (temperature_c);
+
+  for month_start in
+    select distinct date_trunc('month', created_at at time zone 'UTC')::date from weather_data_unpartitioned
+  loop
+    perform create_weather_partition(month_start);
+  end loop;
+  perform maintain_weather_partitions();
+
+  insert into weather_data (id, created_at, temperature_c, humidity, wind_speed, pressure, condition_text,
+                            location, location_id)
+    overriding system value
+    select id, created_at, temperature_c, humidity, wind_speed, pressure, condition_text, location, location_id
+    from weather_data_unpartitioned;
+
+  perform setval(pg_get_serial_sequence('weather_data', 'id'),
+                 coalesce((select max(id) from weather_data), 0) + 1, false);
+end;
+$$;
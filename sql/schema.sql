@@ -0,0 +1,104 @@
+-- Schema changes for the weather_data table.
+-- Run after the table has been created; every statement can be re-run safely.
+
+
+-- Multi-location ingestion: each row is identified by its location ("lat,lon")
+-- and observation time, so that bulk upserts from retries don't create duplicates.
+alter table weather_data add column if not exists location text;
+
+create unique index if not exists weather_data_location_created_at_key
+  on weather_data (location, created_at);
+
+
+-- Locations get a small integer id, so the per-location indexes stay narrow.
+-- weather_data.location_id is filled from location by the weather_data_location_id
+-- trigger (see stored_functions.sql); the statements below fill it for existing rows.
+create table if not exists locations (
+  id integer generated by default as identity primary key,
+  key text not null unique,
+  lat double precision,
+  lon double precision
+);
+
+alter table weather_data add column if not exists location_id integer references locations (id);
+
+insert into locations (key, lat, lon)
+  select distinct location, split_part(location, ',', 1)::double precision,
+         split_part(location, ',', 2)::double precision
+  from weather_data
+  where location is not null
+on conflict (key) do nothing;
+
+update weather_data w
+set location_id = l.id
+from locations l
+where w.location = l.key and w.location_id is null;
+
+-- Latest readings of one location (get_last_data, get_location_seven_days)
+create index if not exists weather_data_location_id_created_at_idx
+  on weather_data (location_id, created_at desc) include (temperature_c);
+
+
+-- Range index for the monthly stored functions and get_last_seven_days.
+-- temperature_c and condition_text are included so the aggregates can be
+-- answered with index-only scans.
+create index if not exists weather_data_created_at_idx
+  on weather_data (created_at) include (temperature_c, condition_text);
+
+-- For very large, append-only tables a BRIN index is a much smaller alternative:
+-- create index if not exists weather_data_created_at_brin
+--   on weather_data using brin (created_at);
+
+
+-- Rollup tables kept up to date by the weather_rollup_* triggers
+-- (see stored_functions.sql). The dashboard aggregates read these instead of raw rows.
+-- They are kept per location; rows without a location are rolled up under ''.
+create table if not exists weather_daily (
+  location text not null default '',
+  day date not null,
+  min_temp real,
+  max_temp real,
+  sum_temp double precision not null default 0,
+  readings integer not null default 0,
+  rainy boolean not null default false,
+  primary key (location, day)
+);
+
+create table if not exists weather_hourly (
+  location text not null default '',
+  day date not null,
+  hour smallint not null,
+  min_temp real,
+  max_temp real,
+  sum_temp double precision not null default 0,
+  readings integer not null default 0,
+  rainy boolean not null default false,
+  primary key (location, day, hour)
+);
+
+-- Rollups created before they were kept per location hold the totals of every
+-- location and can't be split, so they are emptied. Run
+-- "python python/script.py --rebuild-rollups" after stored_functions.sql to refill them.
+do $$
+begin
+  if not exists (select 1 from information_schema.columns
+                 where table_name = 'weather_daily' and column_name = 'location') then
+    truncate weather_daily;
+    alter table weather_daily add column location text not null default '';
+    alter table weather_daily drop constraint weather_daily_pkey;
+    alter table weather_daily add primary key (location, day);
+  end if;
+
+  if not exists (select 1 from information_schema.columns
+                 where table_name = 'weather_hourly' and column_name = 'location') then
+    truncate weather_hourly;
+    alter table weather_hourly add column location text not null default '';
+    alter table weather_hourly drop constraint weather_hourly_pkey;
+    alter table weather_hourly add primary key (location, day, hour);
+  end if;
+end;
+$$;
+
+-- The fleet-wide aggregates read a day range over every location
+create index if not exists weather_daily_day_idx on weather_daily (day);
+create index if not exists weather_hourly_day_idx on weather_hourly (day, hour);
@@ -1,69 +1,151 @@
+-- The monthly functions read the weather_daily and weather_hourly rollups
+-- (see schema.sql), filtering on a half-open day range
+-- [first day of the month, first day of the next month) that uses their day indexes.
+-- The rollups are kept per location; these functions count the days of all
+-- locations together, so a day is rainy if it rained at any location.
+
 create OR replace function get_rainy_days(current_month int, current_year int)
 returns integer as $$
+declare
+  month_start date := make_date(current_year, current_month, 1);
 begin
   return (
-    select count(*)
-    from (
-      select date(created_at)
-      from weather_data
-      where extract(month from created_at) = current_month
-        and extract(year from created_at) = current_year
-        and condition_text = 'Rain'
-      group by date(created_at)
-    ) as rainy_days
+    select count(distinct day)
+    from weather_daily
+    where day >= month_start
+      and day < month_start + interval '1 month'
+      and rainy
   );
 end;
-$$ language plpgsql
+$$ language plpgsql stable;
 
 create or replace function hour_avg_temp(current_hour int, current_month int, current_year int)
 returns float as $$
+declare
+  month_start date := make_date(current_year, current_month, 1);
 begin
   return (
-    select avg(temperature_c)
-    from weather_data
-    where extract(hour from created_at) = current_hour
-    and extract(month from created_at) = current_month 
-    and extract(year from created_at) = current_year
+    select sum(sum_temp) / nullif(sum(readings), 0)
+    from weather_hourly
+    where day >= month_start
+    and day < month_start + interval '1 month'
+    and hour = current_hour
   );
   end;
-  $$ language plpgsql
+  $$ language plpgsql stable;
 
 
 create or replace function count_cold_days (current_month int, current_year int)
 returns integer as $$
+declare
+  month_start date := make_date(current_year, current_month, 1);
 begin
   return (
     select count (*)
     from (
-      select date(created_at)
-      from weather_data
-      where extract(month from created_at) = current_month 
-      and extract(year from created_at) = current_year 
-      and temperature_c <= 0
-      group by date(created_at)
-    ) as cold_days
+      select day
+      from weather_daily
+      where day >= month_start
+      and day < month_start + interval '1 month'
+      group by day
+      having min(min_temp) <= 0
+    ) as days
   );
 end;
-$$ language plpgsql
+$$ language plpgsql stable;
 
 create or replace function count_warm_days (current_month int, current_year int)
 returns integer as $$
+declare
+  month_start date := make_date(current_year, current_month, 1);
 begin
   return (
     select count (*)
     from (
-      select date(created_at)
-      from weather_data
-      where extract(month from created_at) = current_month and extract(year from created_at) = current_year and
-      temperature_c >= 35
-      group by date(created_at)
-    ) as warm_days
+      select day
+      from weather_daily
+      where day >= month_start and day < month_start + interval '1 month'
+      group by day
+      having max(max_temp) >= 35
+    ) as days
   );
 end;
-$$ language plpgsql
+$$ language plpgsql stable;
+
+
+
+-- Every metric of the monthly functions above for several months, from one scan of
+-- weather_hourly over the range they cover. The months are given as parallel arrays,
+-- e.g. period_stats(array[2025, 2024], array[1, 12], 14) for this month and last month.
+-- The rollups only track 'Rain', so another rain_condition scans weather_data instead.
+-- With p_location the counts are those of that location, otherwise of all locations.
+-- Months without data are returned with zero counts and a null average.
+drop function if exists period_stats(int[], int[], int, text, real, real);
+
+create or replace function period_stats(p_years int[], p_months int[], current_hour int default null,
+                                        rain_condition text default 'Rain',
+                                        cold_threshold real default 0, warm_threshold real default 35,
+                                        p_location text default null)
+returns table (year int, month int, rainy_days int, cold_days int, warm_days int, hour_avg_temp float) as $$
+declare
+  range_start date;
+  range_end date;
+begin
+  select min(make_date(y, m, 1)), max(make_date(y, m, 1) + interval '1 month')
+    into range_start, range_end
+  from unnest(p_years, p_months) as p(y, m);
+
+  return query
+  with periods as (
+    select p.y, p.m, make_date(p.y, p.m, 1) as month_start
+    from unnest(p_years, p_months) as p(y, m)
+  ),
+  hours as (
+    select h.day, h.hour, h.min_temp, h.max_temp, h.sum_temp, h.readings::bigint as readings, h.rainy
+    from weather_hourly h
+    where rain_condition = 'Rain'
+      and h.day >= range_start and h.day < range_end
+      and (p_location is null or h.location = p_location)
+    union all
+    select date(w.created_at), extract(hour from w.created_at)::smallint, min(w.temperature_c),
+           max(w.temperature_c), coalesce(sum(w.temperature_c), 0), count(w.temperature_c),
+           coalesce(bool_or(w.condition_text = rain_condition), false)
+    from weather_data w
+    where rain_condition <> 'Rain'
+      and w.created_at >= range_start and w.created_at < range_end
+      and (p_location is null or w.location = p_location)
+    group by 1, 2
+  ),
+  days as (
+    select hours.day,
+           min(hours.min_temp) as min_temp,
+           max(hours.max_temp) as max_temp,
+           bool_or(hours.rainy) as rainy,
+           sum(hours.sum_temp) filter (where hours.hour = current_hour) as hour_sum,
+           sum(hours.readings) filter (where hours.hour = current_hour) as hour_readings
+    from hours
+    group by hours.day
+  )
+  select p.y, p.m,
+         (count(*) filter (where d.rainy))::int,
+         (count(*) filter (where d.min_temp <= cold_threshold))::int,
+         (count(*) filter (where d.max_temp >= warm_threshold))::int,
+         (sum(d.hour_sum) / nullif(sum(d.hour_readings), 0))::float
+  from periods p
+  left join days d on d.day >= p.month_start and d.day < p.month_start + interval '1 month'
+  group by p.y, p.m
+  order by p.y, p.m;
+end;
+$$ language plpgsql stable;
 
+-- get_last_data used to take no arguments; drop that version so the call stays unambiguous
+drop function if exists get_last_data();
 
-create or replace function get_last_data()
+-- Ordered by created_at, so that on the partitioned table (see partitioning.sql) the
+-- newest partitions are scanned first and the scan stops after 12 rows. The two
+-- cases are separate queries, so each gets its own index: created_at for all
+-- locations, (location_id, created_at) for one.
+create or replace function get_last_data(p_location text default null)
 returns table (
     d date,
     t time,
@@ -74,21 +156,39 @@ returns table (
     condition text
 ) as $$
 begin
-    return query (
-        select
-            date(created_at),
-            created_at::time,
-            temperature_c,
-            humidity,
-            wind_speed,
-            pressure,
-            condition_text
-        from weather_data
-        order by id desc
-        limit 12
-    );
+    if p_location is null then
+        return query (
+            select
+                date(created_at),
+                created_at::time,
+                temperature_c,
+                humidity,
+                wind_speed,
+                pressure,
+                condition_text
+            from weather_data
+            -- Qualified: a bare created_at would be the created_at::time output column
+            order by weather_data.created_at desc
+            limit 12
+        );
+    else
+        return query (
+            select
+                date(created_at),
+                created_at::time,
+                temperature_c,
+                humidity,
+                wind_speed,
+                pressure,
+                condition_text
+            from weather_data
+            where location_id = (select id from locations where key = p_location)
+            order by weather_data.created_at desc
+            limit 12
+        );
+    end if;
 end;
-$$ language plpgsql
+$$ language plpgsql stable;
 
 
 CREATE OR REPLACE FUNCTION get_last_seven_days()
@@ -96,16 +196,284 @@ RETURNS TABLE (ts DATE, min_temp FLOAT, max_temp FLOAT) AS $$
 BEGIN
   RETURN QUERY
     SELECT 
-      date(created_at) as ts,  -- Cast to date to group correctly
-      min(temperature_c)::float as min_temp,
-      max(temperature_c)::float as max_temp
-    FROM weather_data
-    WHERE created_at >= now() - interval '8 days'  -- Get last 8 days to include yesterday
-      --AND created_at < now() - interval '1 day'    -- Exclude today
-    GROUP BY date(weather_data.created_at)  -- Group by the date
+      day as ts,
+      min(weather_daily.min_temp)::float as min_temp,
+      max(weather_daily.max_temp)::float as max_temp
+    FROM weather_daily
+    WHERE day >= (now() - interval '8 days')::date  -- Get last 8 days to include yesterday
+    GROUP BY day
     ORDER BY ts desc
     LIMIT 7
-    offset 1
+    offset 1  -- Exclude today
     ;
 END;
-$$ LANGUAGE plpgsql
+$$ LANGUAGE plpgsql;
+
+
+-- Same as get_last_seven_days, for a single location, from the same rollup rows.
+create or replace function get_location_seven_days(p_location text)
+returns table (ts date, min_temp float, max_temp float) as $$
+begin
+  return query
+    select
+      d.day,
+      d.min_temp::float,
+      d.max_temp::float
+    from weather_daily d
+    where d.location = p_location
+      and d.day >= (now() - interval '8 days')::date
+    order by d.day desc
+    limit 7
+    offset 1;
+end;
+$$ language plpgsql stable;
+
+
+-- Returns every section of the dashboard as one JSON document,
+-- so that the page can be built with a single round trip.
+-- With p_location, the readings, the seven-day table and the monthly counters are
+-- limited to that location.
+drop function if exists dashboard_snapshot(int, int, int);
+
+create or replace function dashboard_snapshot(current_hour int, current_month int, current_year int,
+                                              p_location text default null)
+returns json as $$
+begin
+  return (select json_build_object(
+    'last_data', (select coalesce(json_agg(l), '[]'::json) from get_last_data(p_location) as l),
+    'seven_days', (select coalesce(json_agg(s), '[]'::json)
+                   from (select * from get_last_seven_days() where p_location is null
+                         union all
+                         select * from get_location_seven_days(p_location) where p_location is not null
+                         order by ts desc) as s),
+    'rainy_days', stats.rainy_days,
+    'hour_avg_temp', stats.hour_avg_temp,
+    'cold_days', stats.cold_days,
+    'warm_days', stats.warm_days
+  )
+  from period_stats(array[current_year], array[current_month], current_hour,
+                    p_location => p_location) as stats);
+end;
+$$ language plpgsql stable;
+
+
+-- Adds the rows inserted by one statement to the weather_daily and weather_hourly rollups.
+-- Rows updated by an upsert are not in the transition table of the insert; the
+-- weather_rollup_update trigger below recomputes their days instead.
+create or replace function weather_rollup_insert()
+returns trigger as $$
+begin
+  insert into weather_daily as d (location, day, min_temp, max_temp, sum_temp, readings, rainy)
+    select
+      coalesce(location, ''),
+      date(created_at),
+      min(temperature_c),
+      max(temperature_c),
+      coalesce(sum(temperature_c), 0),
+      count(temperature_c),
+      coalesce(bool_or(condition_text = 'Rain'), false)
+    from new_rows
+    group by coalesce(location, ''), date(created_at)
+  on conflict (location, day) do update set
+    min_temp = least(d.min_temp, excluded.min_temp),
+    max_temp = greatest(d.max_temp, excluded.max_temp),
+    sum_temp = d.sum_temp + excluded.sum_temp,
+    readings = d.readings + excluded.readings,
+    rainy = d.rainy or excluded.rainy;
+
+  insert into weather_hourly as h (location, day, hour, min_temp, max_temp, sum_temp, readings, rainy)
+    select
+      coalesce(location, ''),
+      date(created_at),
+      extract(hour from created_at),
+      min(temperature_c),
+      max(temperature_c),
+      coalesce(sum(temperature_c), 0),
+      count(temperature_c),
+      coalesce(bool_or(condition_text = 'Rain'), false)
+    from new_rows
+    group by coalesce(location, ''), date(created_at), extract(hour from created_at)
+  on conflict (location, day, hour) do update set
+    min_temp = least(h.min_temp, excluded.min_temp),
+    max_temp = greatest(h.max_temp, excluded.max_temp),
+    sum_temp = h.sum_temp + excluded.sum_temp,
+    readings = h.readings + excluded.readings,
+    rainy = h.rainy or excluded.rainy;
+
+  return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists weather_rollup_insert on weather_data;
+create trigger weather_rollup_insert
+  after insert on weather_data
+  referencing new table as new_rows
+  for each statement execute function weather_rollup_insert();
+
+
+-- Recomputes the rollups of the given (location, day) pairs from weather_data.
+-- A minimum or maximum can't be taken back incrementally, so updated and deleted
+-- rows are handled by recomputing the days they belonged to.
+create or replace function recompute_weather_rollups(p_locations text[], p_days date[])
+returns void as $$
+begin
+  delete from weather_daily d
+  using unnest(p_locations, p_days) as k(location, day)
+  where d.location = k.location and d.day = k.day;
+
+  delete from weather_hourly h
+  using unnest(p_locations, p_days) as k(location, day)
+  where h.location = k.location and h.day = k.day;
+
+  insert into weather_daily (location, day, min_temp, max_temp, sum_temp, readings, rainy)
+    select
+      k.location,
+      k.day,
+      min(w.temperature_c),
+      max(w.temperature_c),
+      coalesce(sum(w.temperature_c), 0),
+      count(w.temperature_c),
+      coalesce(bool_or(w.condition_text = 'Rain'), false)
+    from (select distinct * from unnest(p_locations, p_days) as k(location, day)) as k
+    join weather_data w
+      on coalesce(w.location, '') = k.location
+     and w.created_at >= k.day::timestamptz and w.created_at < (k.day + 1)::timestamptz
+    group by k.location, k.day;
+
+  insert into weather_hourly (location, day, hour, min_temp, max_temp, sum_temp, readings, rainy)
+    select
+      k.location,
+      k.day,
+      extract(hour from w.created_at),
+      min(w.temperature_c),
+      max(w.temperature_c),
+      coalesce(sum(w.temperature_c), 0),
+      count(w.temperature_c),
+      coalesce(bool_or(w.condition_text = 'Rain'), false)
+    from (select distinct * from unnest(p_locations, p_days) as k(location, day)) as k
+    join weather_data w
+      on coalesce(w.location, '') = k.location
+     and w.created_at >= k.day::timestamptz and w.created_at < (k.day + 1)::timestamptz
+    group by k.location, k.day, extract(hour from w.created_at);
+end;
+$$ language plpgsql;
+
+
+-- Keeps the rollups right when rows are updated (including upserts that replace a
+-- reading) or deleted: the days of the old and the new versions are recomputed.
+-- Transition tables allow only one event per trigger, so there is a trigger per event.
+create or replace function weather_rollup_change()
+returns trigger as $$
+declare
+  locations text[];
+  days date[];
+begin
+  if tg_op = 'DELETE' then
+    select array_agg(k.location), array_agg(k.day) into locations, days
+    from (select distinct coalesce(location, '') as location, date(created_at) as day from old_rows) as k;
+  else
+    select array_agg(k.location), array_agg(k.day) into locations, days
+    from (select coalesce(location, '') as location, date(created_at) as day from old_rows
+          union
+          select coalesce(location, ''), date(created_at) from new_rows) as k;
+  end if;
+
+  if locations is not null then
+    perform recompute_weather_rollups(locations, days);
+  end if;
+
+  return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists weather_rollup_update on weather_data;
+create trigger weather_rollup_update
+  after update on weather_data
+  referencing old table as old_rows new table as new_rows
+  for each statement execute function weather_rollup_change();
+
+drop trigger if exists weather_rollup_delete on weather_data;
+create trigger weather_rollup_delete
+  after delete on weather_data
+  referencing old table as old_rows
+  for each statement execute function weather_rollup_change();
+
+
+-- Fills location_id from the location key, adding new locations to the locations table.
+create or replace function weather_data_location_id()
+returns trigger as $$
+begin
+  if new.location is null then
+    new.location_id := null;
+    return new;
+  end if;
+
+  select id into new.location_id from locations where key = new.location;
+
+  if new.location_id is null then
+    insert into locations (key, lat, lon)
+      values (new.location, split_part(new.location, ',', 1)::double precision,
+              split_part(new.location, ',', 2)::double precision)
+    on conflict (key) do nothing;
+
+    select id into new.location_id from locations where key = new.location;
+  end if;
+
+  return new;
+end;
+$$ language plpgsql;
+
+drop trigger if exists weather_data_location_id on weather_data;
+create trigger weather_data_location_id
+  before insert or update of location on weather_data
+  for each row execute function weather_data_location_id();
+
+
+-- Recomputes the rollups for [start_day, end_day) from weather_data
+-- (the whole history if the bounds are null). Returns the number of rebuilt
+-- location days.
+create or replace function rebuild_weather_rollups(start_day date default null, end_day date default null)
+returns integer as $$
+declare
+  range_start timestamptz := coalesce(start_day, '-infinity'::date);
+  range_end timestamptz := coalesce(end_day, 'infinity'::date);
+  rebuilt integer;
+begin
+  delete from weather_daily
+  where day >= range_start and day < range_end;
+
+  delete from weather_hourly
+  where day >= range_start and day < range_end;
+
+  insert into weather_daily (location, day, min_temp, max_temp, sum_temp, readings, rainy)
+    select
+      coalesce(location, ''),
+      date(created_at),
+      min(temperature_c),
+      max(temperature_c),
+      coalesce(sum(temperature_c), 0),
+      count(temperature_c),
+      coalesce(bool_or(condition_text = 'Rain'), false)
+    from weather_data
+    where created_at >= range_start and created_at < range_end
+    group by coalesce(location, ''), date(created_at);
+
+  get diagnostics rebuilt = row_count;
+
+  insert into weather_hourly (location, day, hour, min_temp, max_temp, sum_temp, readings, rainy)
+    select
+      coalesce(location, ''),
+      date(created_at),
+      extract(hour from created_at),
+      min(temperature_c),
+      max(temperature_c),
+      coalesce(sum(temperature_c), 0),
+      count(temperature_c),
+      coalesce(bool_or(condition_text = 'Rain'), false)
+    from weather_data
+    where created_at >= range_start and created_at < range_end
+    group by coalesce(location, ''), date(created_at), extract(hour from created_at);
+
+  return rebuilt;
+end;
+$$ language plpgsql;
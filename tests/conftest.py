@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules in python/ import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "python"))
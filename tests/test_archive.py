@@ -0,0 +1,44 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import archive
+import synthetic
+
+
+def make_rows(count):
+    rows = list(synthetic.generate_rows(count, locations=2, interval=600, seed=1,
+                                        end=datetime.datetime(2024, 3, 20, tzinfo=datetime.timezone.utc)))
+    for row_id, row in enumerate(rows, 1):
+        row['id'] = row_id
+    return rows
+
+
+def test_partial_reexport_keeps_the_rest_of_the_month(tmp_path):
+    rows = make_rows(3000)
+    assert archive.export(rows, str(tmp_path)) == 3000
+
+    changed = [dict(row, temperature_c=-1.0) for row in rows[-100:]]
+    archive.export(changed, str(tmp_path))
+
+    table = archive.read(str(tmp_path))
+    assert table.num_rows == 3000
+    assert sorted(table['id'].to_pylist()) == list(range(1, 3001))
+
+    temperatures = dict(zip(table['id'].to_pylist(), table['temperature_c'].to_pylist()))
+    assert all(temperatures[row['id']] == -1.0 for row in changed)
+    assert temperatures[rows[0]['id']] == rows[0]['temperature_c']
+
+
+def test_read_accepts_dates(tmp_path):
+    rows = make_rows(500)
+    archive.export(rows, str(tmp_path))
+
+    first_day = datetime.date.fromisoformat(rows[0]['created_at'][:10])
+    table = archive.read(str(tmp_path), first_day + datetime.timedelta(days=1), first_day + datetime.timedelta(days=2))
+
+    assert 0 < table.num_rows < 500
+    observations = archive.load_observations(str(tmp_path), first_day, first_day + datetime.timedelta(days=30))
+    assert len(observations.temperature_c) == 500
@@ -0,0 +1,120 @@
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("requests")
+
+import backfill
+import storage
+import synthetic
+
+START = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+END = datetime.datetime(2024, 3, 5, tzinfo=datetime.timezone.utc)
+LOCATIONS = [{'lat': "44.00", 'lon': "20.00"}, {'lat': "44.00", 'lon': "20.10"}]
+
+
+@pytest.fixture
+def responses():
+    """
+    Hourly API responses of both locations from START until END.
+    """
+
+    rows = synthetic.generate_rows(2 * 96, locations=2, interval=3600, seed=3,
+                                   end=END - datetime.timedelta(hours=1))
+    return [synthetic.api_response(row) for row in rows]
+
+
+@pytest.fixture
+def database(tmp_path):
+    backend = storage.SQLiteBackend(str(tmp_path / "weather.db"))
+    yield backend
+    backend.close()
+
+
+class FlakySource(backfill.FileSource):
+    """
+    FileSource that fails the chunks starting on the given days, and records every fetched chunk.
+    """
+
+    def __init__(self, path, failing_days=()):
+        super().__init__(path)
+        self.failing_days = set(failing_days)
+        self.fetched = []
+
+    def fetch(self, location, start, end):
+        self.fetched.append((location['lon'], start.day))
+        if start.day in self.failing_days:
+            return None
+        return super().fetch(location, start, end)
+
+
+def test_interrupted_backfill_resumes_from_the_checkpoint(tmp_path, responses, database):
+    path = tmp_path / "history.jsonl"
+    path.write_text("".join(json.dumps(response) + "\n" for response in responses))
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    source = FlakySource(str(path), failing_days={2, 4})
+    stats = backfill.backfill(database, source, LOCATIONS, START, END, chunk_hours=24, workers=3,
+                              checkpoint=backfill.Checkpoint(checkpoint_path))
+    assert stats == {'chunks': 8, 'skipped': 0, 'failed': 4, 'rows': 96}
+
+    # A new run, with a checkpoint read back from the file, only fetches the failed chunks
+    source = FlakySource(str(path))
+    stats = backfill.backfill(database, source, LOCATIONS, START, END, chunk_hours=24, workers=3,
+                              checkpoint=backfill.Checkpoint(checkpoint_path))
+    assert stats == {'chunks': 8, 'skipped': 4, 'failed': 0, 'rows': 96}
+    assert sorted(source.fetched) == [("20.00", 2), ("20.00", 4), ("20.10", 2), ("20.10", 4)]
+
+    assert database.scalar("select count(*) from weather_data") == 192
+    assert database.scalar("select count(distinct location || created_at) from weather_data") == 192
+
+    # Everything is done, so a third run fetches nothing
+    source = FlakySource(str(path))
+    stats = backfill.backfill(database, source, LOCATIONS, START, END, chunk_hours=24,
+                              checkpoint=backfill.Checkpoint(checkpoint_path))
+    assert (stats['skipped'], source.fetched) == (8, [])
+
+
+class HistoryHandler(BaseHTTPRequestHandler):
+    """
+    History API fixture: returns the responses of the requested location with start <= dt <= end.
+    """
+
+    def do_GET(self):
+        query = {name: values[0] for name, values in parse_qs(urlparse(self.path).query).items()}
+        readings = [response for response in self.server.responses
+                    if response['coord'] == {'lat': float(query['lat']), 'lon': float(query['lon'])}
+                    and int(query['start']) <= response['dt'] <= int(query['end'])]
+
+        body = json.dumps({'cod': "200", 'cnt': len(readings), 'list': readings}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_history_source_against_a_fixture_server(responses, database):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), HistoryHandler)
+    server.responses = responses
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    source = backfill.HistorySource("x", url=f"http://127.0.0.1:{server.server_address[1]}/history", backoff=0)
+    try:
+        stats = backfill.backfill(database, source, LOCATIONS, START, END, chunk_hours=36, workers=2)
+    finally:
+        source.close()
+        server.shutdown()
+        server.server_close()
+
+    # Chunk ends are exclusive, so the readings at chunk boundaries are stored once
+    assert stats == {'chunks': 6, 'skipped': 0, 'failed': 0, 'rows': 192}
+    assert database.scalar("select count(*) from weather_data") == 192
@@ -0,0 +1,53 @@
+import datetime
+import gzip
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import bundle
+import observations
+
+
+def make_batch(humidity):
+    start = np.datetime64("2024-03-04T00:00:00", "s")
+    count = len(humidity)
+    return observations.ObservationBatch.from_columns({
+        'created_at': start + np.arange(count) * 3600,
+        'temperature_c': np.linspace(0, 10, count),
+        'humidity': humidity,
+        'condition_text': np.array(["Clear"] * count, dtype=object),
+        'location': np.array(["44.00,20.00"] * count, dtype=object),
+    })
+
+
+def test_nullable_integers_become_missing():
+    pa = pytest.importorskip("pyarrow")
+
+    # Arrow turns a nullable int16 column into floats with NaN
+    humidity = pa.array([50, None, 70], type=pa.int16()).to_numpy(zero_copy_only=False)
+    batch = make_batch(humidity)
+
+    assert batch.humidity.tolist() == [50, observations.MISSING_INT, 70]
+    assert json.loads(bundle.encode_chunk(batch))['hum'] == [70, None, 50]
+
+
+def test_bundle_is_gzip_only(tmp_path):
+    stale = tmp_path / "2024-01-01.json.br"
+    stale.write_bytes(b"old")
+
+    manifest = bundle.write_bundle(make_batch(np.full(200, 60)), str(tmp_path))
+
+    assert sorted(os.listdir(tmp_path)) == ["2024-03-04.json.gz", "2024-03-11.json.gz", bundle.MANIFEST_NAME]
+    assert [chunk['rows'] for chunk in manifest['chunks']] == [32, 168]
+    assert len(json.loads(gzip.decompress((tmp_path / "2024-03-11.json.gz").read_bytes()))['t']) == 32
+
+
+def test_oldest_inline_reading():
+    weather_data = {'last_data': [{'d': "2024-03-12", 't': "10:00:00.250000"}, {'d': "2024-03-12", 't': "09:00:00"}]}
+
+    expected = datetime.datetime(2024, 3, 12, 9, tzinfo=datetime.timezone.utc).timestamp()
+    assert bundle.oldest_inline(weather_data) == expected
+    assert bundle.oldest_inline({'last_data': []}) is None
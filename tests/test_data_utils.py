@@ -0,0 +1,79 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+pytest.importorskip("requests")
+
+import data_utils as du
+
+LOCATIONS = [{'lat': "44.00", 'lon': "20.00"}, {'lat': "45.00", 'lon': "21.00"}, {'lat': "46.00", 'lon': "22.00"}]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Current weather endpoint that answers the first request of every location with 429,
+    and every request for lat 46.00 with 503.
+    """
+
+    def do_GET(self):
+        query = {name: values[0] for name, values in parse_qs(urlparse(self.path).query).items()}
+        key = (query['lat'], query['lon'])
+
+        with self.server.lock:
+            self.server.requests[key] = self.server.requests.get(key, 0) + 1
+            first = self.server.requests[key] == 1
+
+        if query['lat'] == "46.00" or first:
+            self.send_response(503 if query['lat'] == "46.00" else 429)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = json.dumps({'dt': 1709287200, 'main': {'temp': float(query['lat']), 'humidity': 50, 'pressure': 1010},
+                           'wind': {'speed': 1.0}, 'weather': [{'main': "Clear"}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.requests = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(du, "API_URL", f"http://127.0.0.1:{server.server_address[1]}/weather")
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_batch_fetch_retries_and_keeps_the_order(stub_server):
+    results = du.fetch_weather_data_batch(LOCATIONS, "x", retries=2, backoff=0, keyed=True)
+
+    assert [row and row['temperature_c'] for row in results] == [44.0, 45.0, None]
+    assert [row and row['location'] for row in results[:2]] == ["44.00,20.00", "45.00,21.00"]
+    # One 429 and one success per location, and every attempt for the failing one
+    assert stub_server.requests == {("44.00", "20.00"): 2, ("45.00", "21.00"): 2, ("46.00", "22.00"): 3}
+
+
+def test_batch_fetch_answers_from_the_cache(stub_server):
+    import cache as cache_utils
+
+    cache = cache_utils.Cache(":memory:")
+    du.fetch_weather_data_batch(LOCATIONS[:2], "x", retries=2, backoff=0, cache=cache)
+    results = du.fetch_weather_data_batch(LOCATIONS[:2], "x", retries=2, backoff=0, cache=cache)
+
+    assert [row['temperature_c'] for row in results] == [44.0, 45.0]
+    assert sum(stub_server.requests.values()) == 4
@@ -0,0 +1,169 @@
+import pytest
+
+import db_utils as db
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class RPCError(Exception):
+    def __init__(self, code):
+        super().__init__(f"error {code}")
+        self.code = code
+
+
+class Call:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return Response(self.result)
+
+
+class FakeClient:
+    """
+    Answers rpc() calls from a dictionary of function name to result or exception;
+    a tuple holds the results of consecutive calls.
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def rpc(self, name, params=None):
+        self.calls.append(name)
+        result = self.results[name]
+        if isinstance(result, tuple):
+            result, self.results[name] = result[0], result[1:]
+        return Call(result)
+
+
+@pytest.fixture(autouse=True)
+def snapshot_rpc(monkeypatch):
+    monkeypatch.setattr(db, '_snapshot_rpc_available', True)
+    monkeypatch.setattr(db.time, 'sleep', lambda seconds: None)
+
+
+SECTIONS = {'get_last_data': [{'temp': 1}], 'get_last_seven_days': [{'ts': '2024-01-01'}]}
+
+
+def test_missing_snapshot_function_falls_back_to_the_rendered_sections():
+    client = FakeClient(dict(SECTIONS, dashboard_snapshot=RPCError('PGRST202')))
+
+    data = db.get_dashboard_snapshot(client)
+
+    assert data == {'last_data': [{'temp': 1}], 'seven_days': [{'ts': '2024-01-01'}]}
+    assert sorted(client.calls) == ['dashboard_snapshot', 'get_last_data', 'get_last_seven_days']
+    assert db._snapshot_rpc_available is False
+
+
+def test_transient_snapshot_error_is_retried_and_keeps_the_rpc():
+    snapshot = {'last_data': [], 'seven_days': []}
+    client = FakeClient(dict(SECTIONS, dashboard_snapshot=(RPCError('503'), snapshot)))
+
+    assert db.get_dashboard_snapshot(client) == snapshot
+    assert client.calls == ['dashboard_snapshot', 'dashboard_snapshot']
+    assert db._snapshot_rpc_available is True
+
+
+def test_persistent_snapshot_error_returns_none_and_keeps_the_rpc():
+    client = FakeClient(dict(SECTIONS, dashboard_snapshot=(RPCError('500'),) * db.SNAPSHOT_ATTEMPTS))
+
+    assert db.get_dashboard_snapshot(client) is None
+    assert db._snapshot_rpc_available is True
+
+
+class Query:
+    """
+    weather_data query builder over a list of rows; data_none makes execute() return data=None
+    when no row matches, as PostgREST clients can.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.filters = []
+        self.count = None
+
+    def select(self, columns):
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row[column] >= value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row[column] < value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row[column] > value)
+        return self
+
+    def order(self, column):
+        return self
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    def execute(self):
+        self.client.requests += 1
+        rows = [row for row in self.client.rows if all(check(row) for check in self.filters)][:self.count]
+        return Response(rows or (None if self.client.data_none else []))
+
+
+class TableClient:
+    def __init__(self, rows, data_none=False):
+        self.rows = rows
+        self.data_none = data_none
+        self.requests = 0
+
+    def table(self, name):
+        return Query(self)
+
+
+ROWS = [{'id': row_id, 'created_at': f"2024-03-{row_id:02d}T00:00:00+00:00"} for row_id in range(1, 26)]
+
+
+@pytest.mark.parametrize('data_none', [False, True])
+def test_iter_row_pages_reads_every_page(data_none):
+    client = TableClient(ROWS[:20], data_none)
+
+    pages = list(db.iter_row_pages(client, page_size=10))
+
+    # The second page is full, so a third request finds no rows
+    assert [len(page) for page in pages] == [10, 10]
+    assert [row['id'] for page in pages for row in page] == list(range(1, 21))
+    assert client.requests == 3
+
+
+def test_iter_row_pages_filters_by_date_and_id():
+    import datetime
+
+    client = TableClient(ROWS)
+
+    pages = list(db.iter_row_pages(client, datetime.date(2024, 3, 5), datetime.date(2024, 3, 20),
+                                   page_size=4, after_id=6))
+
+    assert [[row['id'] for row in page] for page in pages] == [[7, 8, 9, 10], [11, 12, 13, 14], [15, 16, 17, 18],
+                                                               [19]]
+
+
+def test_iter_row_pages_without_rows():
+    assert list(db.iter_row_pages(TableClient([], data_none=True))) == []
+
+
+def test_query_results_are_logged_at_debug_level(capsys, caplog):
+    import logging
+
+    client = FakeClient({'get_rainy_days': 4})
+
+    with caplog.at_level(logging.DEBUG, logger="db_utils"):
+        assert db.count_rainy_days(client) == 4
+
+    assert capsys.readouterr().out == ""
+    assert caplog.messages == ["count_rainy_days: 4"]
@@ -0,0 +1,29 @@
+import datetime
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import archive
+import downsample
+import synthetic
+
+
+def test_archive_series_with_rows_without_location(tmp_path, monkeypatch):
+    rows = list(synthetic.generate_rows(600, locations=2, interval=3600, seed=2,
+                                        end=datetime.datetime(2024, 3, 20, tzinfo=datetime.timezone.utc)))
+    for row_id, row in enumerate(rows, 1):
+        row['id'] = row_id
+    for row in rows[:50]:
+        row['location'] = None
+    archive.export(rows, str(tmp_path / "archive"))
+
+    series_dir = tmp_path / "series"
+    monkeypatch.setattr(sys, "argv", ["downsample.py", "--start", "2024-02-01", "--end", "2024-03-21",
+                                      "--archive", str(tmp_path / "archive"), "--dir", str(series_dir)])
+    downsample.main()
+
+    assert sorted(os.listdir(series_dir)) == ["44.00_20.00.json", "44.00_20.10.json", "index.json"]
+    assert downsample.load_series(str(series_dir), None) is not None
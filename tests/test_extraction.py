@@ -0,0 +1,53 @@
+import io
+import json
+
+import extraction
+
+RESPONSE = {'coord': {'lon': 20.46, 'lat': 44.8}, 'dt': 1709287200, 'weather': [{'main': "Rain"}],
+            'main': {'temp': 10.5, 'humidity': 80, 'pressure': 1008}, 'wind': {'speed': 3.5}}
+
+
+def extract(*responses, **kwargs):
+    rejects = io.StringIO()
+    extractor = extraction.BatchExtractor(rejects=rejects, **kwargs)
+    for response in responses:
+        extractor.add(json.dumps(response))
+    return extractor, [json.loads(line) for line in rejects.getvalue().splitlines()]
+
+
+def test_coordinates_get_the_configured_key():
+    extractor, _ = extract(RESPONSE, dict(RESPONSE, coord={'lon': 19.84, 'lat': 45.25}),
+                           locations=[{'lat': "44.80", 'lon': "20.460"}])
+
+    assert extractor.build().locations == ["44.80,20.460", "45.25,19.84"]
+
+
+def test_configured_locations_default_to_the_environment(monkeypatch):
+    monkeypatch.setenv("LOCATIONS", "44.80,20.46;45.25,19.84")
+
+    extractor, _ = extract(RESPONSE)
+
+    assert extractor.build().locations == ["44.80,20.46"]
+
+
+def test_weather_of_the_wrong_kind_is_rejected():
+    extractor, rejects = extract(dict(RESPONSE, weather="x"), dict(RESPONSE, weather=["x"]), dict(RESPONSE, weather=[]),
+                                 locations=[])
+
+    assert (extractor.accepted, extractor.rejected) == (1, 2)
+    assert [reject['reason'] for reject in rejects] == ["weather: expected a list, got str",
+                                                        "weather.0: expected an object, got str"]
+    assert extractor.build().conditions == [None]
+
+
+def test_out_of_range_and_missing_values():
+    extractor, rejects = extract(dict(RESPONSE, main={'temp': 99.0}), dict(RESPONSE, dt=None), locations=[])
+
+    assert [reject['reason'] for reject in rejects] == ["main.temp: 99.0 out of range [-100, 70]", "dt: missing"]
+
+
+def test_malformed_coordinates_are_rejected():
+    extractor, rejects = extract(dict(RESPONSE, coord={'lat': [1], 'lon': 2}),
+                                 dict(RESPONSE, coord={'lat': "a", 'lon': 2}), locations=[])
+
+    assert [reject['reason'] for reject in rejects] == ["coord: expected numbers"] * 2
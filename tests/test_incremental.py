@@ -0,0 +1,81 @@
+import datetime
+import os
+
+import incremental
+
+
+NOW = datetime.datetime.now(datetime.timezone.utc).replace(minute=30, second=0, microsecond=0)
+
+
+def make_row(row_id, minutes_ago, temperature, location="44.00,20.00", condition="Clear"):
+    created_at = NOW - datetime.timedelta(minutes=minutes_ago)
+    return {'id': row_id, 'created_at': created_at.isoformat(), 'temperature_c': temperature, 'humidity': 50,
+            'wind_speed': 1.0, 'pressure': 1010, 'condition_text': condition, 'location': location}
+
+
+class FakeTable:
+    """
+    Rows of weather_data; iter_row_pages returns the committed rows created at or after start.
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def iter_row_pages(self, supabase_client, start=None, end=None, page_size=1000, **kwargs):
+        rows = sorted(self.rows, key=lambda row: row['id'])
+        if isinstance(start, datetime.datetime):
+            rows = [row for row in rows if datetime.datetime.fromisoformat(row['created_at']) >= start]
+        if rows:
+            yield rows
+
+
+def refresh(monkeypatch, table, tmp_path, locations=("44.00,20.00",)):
+    monkeypatch.setattr(incremental.db, "iter_row_pages", table.iter_row_pages)
+    return incremental.refresh(object(), list(locations), str(tmp_path / "docs"), state_dir=str(tmp_path / "state"))
+
+
+def load_state(tmp_path):
+    return incremental.DashboardState.load(str(tmp_path / "state" / incremental.STATE_NAME))
+
+
+def test_late_committed_rows_are_read_once(monkeypatch, tmp_path):
+    table = FakeTable()
+    table.rows = [make_row(1, 50, 10.0), make_row(3, 10, 12.0)]
+    assert refresh(monkeypatch, table, tmp_path) is not None
+
+    # Row 2 got its id before row 3 but committed after the first refresh
+    table.rows.append(make_row(2, 20, 11.0))
+    refresh(monkeypatch, table, tmp_path)
+    refresh(monkeypatch, table, tmp_path)
+
+    state = load_state(tmp_path)
+    recent = state.locations[incremental.ALL]['recent']
+    assert [row['temperature_c'] for row in recent] == [10.0, 11.0, 12.0]
+    assert state.locations[incremental.ALL]['hours'][NOW.strftime("%Y-%m")][str(NOW.hour)][1] == \
+        sum(1 for row in table.rows if datetime.datetime.fromisoformat(row['created_at']).hour == NOW.hour)
+
+
+def test_state_is_kept_outside_the_pages(monkeypatch, tmp_path):
+    table = FakeTable()
+    table.rows = [make_row(1, 5, 10.0)]
+    refresh(monkeypatch, table, tmp_path)
+
+    assert os.path.exists(tmp_path / "state" / incremental.STATE_NAME)
+    assert os.listdir(tmp_path / "docs") == ["index.html"]
+
+
+def test_monthly_counters_are_per_location(monkeypatch, tmp_path):
+    table = FakeTable()
+    table.rows = [make_row(1, 24 * 60, 5.0, "44.00,20.00", "Rain"),
+                  make_row(2, 24 * 60, -3.0, "45.00,21.00"),
+                  make_row(3, 5, 10.0, "44.00,20.00")]
+    refresh(monkeypatch, table, tmp_path, ("44.00,20.00", "45.00,21.00"))
+
+    state = load_state(tmp_path)
+    rainy = state.dashboard_data("44.00,20.00", NOW)
+    cold = state.dashboard_data("45.00,21.00", NOW)
+
+    # A day ago may be last month, where the counters don't look
+    counted = int((NOW - datetime.timedelta(days=1)).month == NOW.month)
+    assert (rainy['rainy_days'], rainy['cold_days']) == (counted, 0)
+    assert (cold['rainy_days'], cold['cold_days']) == (0, counted)
@@ -0,0 +1,67 @@
+import datetime
+
+import pytest
+
+pytest.importorskip("requests")
+
+import pipeline
+
+LOCATIONS = [{'lat': "44.00", 'lon': "20.00"}, {'lat': "45.00", 'lon': "21.00"}, {'lat': "46.00", 'lon': "22.00"}]
+
+
+def response(location):
+    return {'dt': int(datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc).timestamp()),
+            'main': {'temp': 10.0, 'humidity': 50, 'pressure': 1010}, 'wind': {'speed': 1.0},
+            'weather': [{'main': "Clear"}], 'coord': {'lat': float(location['lat']), 'lon': float(location['lon'])}}
+
+
+class FakeWriter:
+    """
+    WeatherDataWriter whose close() reports the rows of failing locations as failed.
+    """
+
+    failing = set()
+
+    def __init__(self, db_client, **kwargs):
+        self.rows = []
+
+    def add(self, row):
+        self.rows.append(row)
+
+    def close(self):
+        return [(row, "error") for row in self.rows if row['location'] in self.failing]
+
+
+@pytest.fixture
+def run(monkeypatch, tmp_path):
+    """
+    Runs the pipeline with the fetch failing for the first location and the store for the second.
+    """
+
+    monkeypatch.setenv("API_KEY", "x")
+    monkeypatch.setattr(pipeline.du, "fetch_location",
+                        lambda session, location, api_key, cache=None: None if location is LOCATIONS[0]
+                        else response(location))
+    FakeWriter.failing = {"45.00,21.00"}
+    monkeypatch.setattr(pipeline.db, "WeatherDataWriter", FakeWriter)
+    monkeypatch.setattr(pipeline.db, "get_data_from_database",
+                        lambda db_client, location, cache=None: {'last_data': [{'location': location}]})
+
+    built = {}
+    monkeypatch.setattr(pipeline.site_gen, "build_site", lambda pages, docs_path: built.update(pages) or [])
+
+    runner = pipeline.Pipeline(object(), extract_workers=2)
+    runner.run(LOCATIONS, str(tmp_path))
+    return runner, built
+
+
+def test_every_location_is_rendered(run):
+    runner, built = run
+    assert sorted(built) == ["44.00,20.00", "45.00,21.00", "46.00,22.00"]
+    assert all(built[key]['last_data'][0]['location'] == key for key in built)
+
+
+def test_failures_are_counted_per_stage(run):
+    runner, _ = run
+    assert runner.counts == {'fetched': 2, 'extracted': 2, 'stored': 1, 'rendered': 3,
+                             'fetch_failed': 1, 'extract_failed': 0, 'store_failed': 1, 'render_failed': 0}
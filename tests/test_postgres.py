@@ -0,0 +1,176 @@
+import datetime
+import os
+
+import pytest
+
+psycopg = pytest.importorskip("psycopg")
+pytest.importorskip("psycopg_pool")
+
+import db_utils as db
+import storage
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql")
+DATABASE = "weather_test"
+
+# The weather_data table as created in Supabase, before sql/schema.sql
+TABLE = """
+create table weather_data (
+  id bigint generated by default as identity primary key,
+  created_at timestamptz not null default now(),
+  temperature_c real,
+  humidity smallint,
+  wind_speed real,
+  pressure smallint,
+  condition_text text
+)"""
+
+
+@pytest.fixture(scope="module")
+def database_url(tmp_path_factory):
+    """
+    URL of an empty database with the weather_data table, sql/schema.sql and sql/stored_functions.sql.
+
+    The server is TEST_DATABASE_URL if set, otherwise a throwaway one started with pgserver.
+    """
+
+    url = os.environ.get("TEST_DATABASE_URL")
+    server = None
+    if not url:
+        pgserver = pytest.importorskip("pgserver")
+        try:
+            server = pgserver.get_server(str(tmp_path_factory.mktemp("pgdata")), cleanup_mode="stop")
+        except Exception as e:
+            pytest.skip(f"Could not start a Postgres server: {e}")
+        url = server.get_uri()
+
+    with psycopg.connect(url, autocommit=True) as connection:
+        connection.execute(f"drop database if exists {DATABASE}")
+        connection.execute(f"create database {DATABASE}")
+        # get_last_data returns dates and times in the session time zone; Supabase runs in UTC
+        connection.execute(f"alter database {DATABASE} set timezone = 'UTC'")
+
+    info = psycopg.conninfo.conninfo_to_dict(url)
+    info['dbname'] = DATABASE
+    test_url = psycopg.conninfo.make_conninfo(**info)
+
+    with psycopg.connect(test_url, autocommit=True) as connection:
+        connection.execute(TABLE)
+        for name in ("schema.sql", "stored_functions.sql"):
+            with open(os.path.join(SQL_DIR, name)) as f:
+                connection.execute(f.read())
+
+    yield test_url
+
+    if server is not None:
+        server.cleanup()
+
+
+@pytest.fixture
+def backend(database_url):
+    backend = storage.PostgresBackend(database_url, max_size=2)
+    backend.query("truncate weather_data, weather_daily, weather_hourly")
+    yield backend
+    backend.close()
+
+
+def make_rows(count, location="44.00,20.00", temperature=10.0):
+    start = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+    return [{'created_at': (start + datetime.timedelta(minutes=30 * i)).isoformat(), 'temperature_c': temperature + i,
+             'humidity': 50, 'wind_speed': 1.5, 'pressure': 1010, 'condition_text': "Clear", 'location': location}
+            for i in range(count)]
+
+
+def test_insert_copies_every_row(backend):
+    with db.WeatherDataWriter(backend, max_rows=100) as writer:
+        for row in make_rows(250):
+            writer.add(row)
+
+    assert writer.stored == 250 and writer.errors == []
+    assert backend.scalar("select count(*) from weather_data") == 250
+    assert backend.query("select min(temperature_c), max(temperature_c), min(humidity) from weather_data") == \
+        [(10.0, 259.0, 50)]
+
+
+def test_upsert_merges_on_location_and_created_at(backend):
+    with db.WeatherDataWriter(backend, upsert=True) as writer:
+        for row in make_rows(48) + make_rows(48, "45.00,21.00"):
+            writer.add(row)
+    with db.WeatherDataWriter(backend, upsert=True) as writer:
+        for row in make_rows(48, temperature=-20.0):
+            writer.add(row)
+
+    assert backend.scalar("select count(*) from weather_data") == 96
+    assert backend.query("select location, min(temperature_c) from weather_data group by location order by 1") == \
+        [("44.00,20.00", -20.0), ("45.00,21.00", 10.0)]
+
+    # The rollup triggers saw the replaced rows
+    daily = backend.query("select location, day, min_temp from weather_daily order by 1, 2")
+    assert daily == [("44.00,20.00", datetime.date(2024, 3, 1), -20.0),
+                     ("45.00,21.00", datetime.date(2024, 3, 1), 10.0)]
+
+
+def test_failed_copy_falls_back_to_row_by_row(backend):
+    rows = make_rows(10)
+    # Out of the smallint range, so the whole COPY fails
+    rows[3]['humidity'] = 100000
+
+    with db.WeatherDataWriter(backend, max_rows=100) as writer:
+        for row in rows:
+            writer.add(row)
+
+    assert writer.stored == 9
+    assert [row for row, _ in writer.errors] == [rows[3]]
+    assert backend.scalar("select count(*) from weather_data") == 9
+
+
+def test_stored_functions_are_called_with_named_parameters(backend):
+    with db.WeatherDataWriter(backend, upsert=True) as writer:
+        for row in make_rows(4) + make_rows(4, "45.00,21.00", temperature=-5.0):
+            writer.add(row)
+
+    stats = db.period_stats(backend, [(2024, 3)], hour=0)
+    cold = db.period_stats(backend, [(2024, 3)], hour=0, location="45.00,21.00")
+    warm = db.period_stats(backend, [(2024, 3)], hour=0, location="44.00,20.00")
+
+    assert stats[0]['cold_days'] == 1 and stats[0]['hour_avg_temp'] == pytest.approx((10.0 + 11.0 - 5.0 - 4.0) / 4)
+    assert (cold[0]['cold_days'], warm[0]['cold_days']) == (1, 0)
+
+
+def test_get_last_data_returns_the_newest_readings_in_time_order(backend):
+    # Readings on several days, so the newest ones don't have the latest time of day
+    start = datetime.datetime(2024, 3, 1, 23, 49, tzinfo=datetime.timezone.utc)
+    rows = []
+    for i in range(30):
+        for location, offset in (("44.00,20.00", 0), ("45.00,21.00", 7)):
+            created_at = start + datetime.timedelta(hours=5 * i, minutes=offset)
+            rows.append({'created_at': created_at.isoformat(), 'temperature_c': float(i), 'humidity': 50,
+                         'wind_speed': 1.0, 'pressure': 1010, 'condition_text': "Clear", 'location': location})
+
+    with db.WeatherDataWriter(backend, upsert=True) as writer:
+        for row in rows:
+            writer.add(row)
+
+    def newest(location=None):
+        times = sorted((row['created_at'] for row in rows if location in (None, row['location'])), reverse=True)
+        return [datetime.datetime.fromisoformat(created_at) for created_at in times[:12]]
+
+    def returned(location=None):
+        data = backend.rpc('get_last_data', {'p_location': location}).execute().data
+        return [datetime.datetime.fromisoformat(f"{row['d']}T{row['t']}+00:00") for row in data]
+
+    assert returned() == newest()
+    assert returned("45.00,21.00") == newest("45.00,21.00")
+
+
+def test_upsert_keeps_the_last_of_repeated_keys(backend):
+    rows = make_rows(10)
+    repeated = dict(rows[4], temperature_c=-7.0, created_at=rows[4]['created_at'].replace("+00:00", "Z"))
+
+    with db.WeatherDataWriter(backend, upsert=True) as writer:
+        for row in rows + [repeated]:
+            writer.add(row)
+
+    # One bulk upsert, without falling back to row by row
+    assert (writer.stored, writer.errors) == (10, [])
+    assert backend.scalar("select count(*) from weather_data") == 10
+    assert backend.scalar("select temperature_c from weather_data where created_at = '2024-03-01 02:00+00'") == -7.0
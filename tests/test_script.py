@@ -0,0 +1,51 @@
+import pytest
+
+import cache as cache_utils
+import script
+
+LOCATION = {'lat': "44.00", 'lon': "20.00"}
+RESPONSE = {'dt': 1709287200, 'main': {'temp': 10.0, 'humidity': 50, 'pressure': 1010}, 'wind': {'speed': 1.0},
+            'weather': [{'main': "Clear"}]}
+
+
+@pytest.fixture
+def single_location(monkeypatch):
+    """
+    Single-location fetch_and_store with a fake API; returns the stored rows and the store results to play back.
+    """
+
+    monkeypatch.setenv("LAT", LOCATION['lat'])
+    monkeypatch.setenv("LON", LOCATION['lon'])
+    monkeypatch.setattr(script.du, "fetch_weather_data", lambda env, cache=None: dict(RESPONSE))
+
+    stored = []
+    results = []
+
+    def store_weather_data(weather_data, db_client):
+        stored.append(weather_data)
+        return results.pop(0)
+
+    monkeypatch.setattr(script.db, "store_weather_data", store_weather_data)
+    return stored, results
+
+
+def test_cache_is_looked_up_once(single_location):
+    stored, results = single_location
+    results.append(True)
+    cache = cache_utils.Cache(":memory:")
+
+    script.fetch_and_store(object(), [LOCATION], cache)
+    assert (cache.hits, cache.misses, len(stored)) == (0, 1, 1)
+
+    script.fetch_and_store(object(), [LOCATION], cache)
+    assert (cache.hits, cache.misses, len(stored)) == (1, 1, 1)
+
+
+def test_failed_store_is_retried(single_location):
+    stored, results = single_location
+    results.extend([False, True])
+    cache = cache_utils.Cache(":memory:")
+
+    script.fetch_and_store(object(), [LOCATION], cache)
+    script.fetch_and_store(object(), [LOCATION], cache)
+    assert len(stored) == 2
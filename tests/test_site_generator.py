@@ -0,0 +1,34 @@
+import os
+
+import site_generator as site_gen
+
+
+def page(temperature, seven_days):
+    return {'last_data': [{'d': "2024-03-01", 't': "10:00:00", 'temp': temperature, 'hum': 50, 'wind': 1.0,
+                           'press': 1010, 'condition': "Clear"}],
+            'seven_days': seven_days, 'rainy_days': 0, 'hour_avg_temp': None, 'cold_days': 0, 'warm_days': 0}
+
+
+def test_only_changed_pages_and_index_rows_are_rebuilt(tmp_path, monkeypatch):
+    docs = tmp_path / "docs"
+    monkeypatch.setenv("BUILD_STATE_DIR", str(tmp_path / "state"))
+
+    rendered = []
+    render_index = site_gen.dash_gen.render_index
+    monkeypatch.setattr(site_gen.dash_gen, "render_index",
+                        lambda locations, out: rendered.append(len(locations)) or render_index(locations, out))
+
+    pages = {"44.00,20.00": page(10.0, []), "45.00,21.00": page(12.0, [])}
+    assert len(site_gen.build_site(pages, str(docs), processes=False)) == 3
+    assert sorted(os.listdir(docs)) == ["44.00_20.00.html", "45.00_21.00.html", "index.html"]
+    assert os.listdir(tmp_path / "state") == [site_gen.MANIFEST_NAME]
+
+    # A change the index doesn't show only rebuilds that location's page
+    pages["44.00,20.00"] = page(10.0, [{'ts': "2024-02-29", 'min_temp': 1.0, 'max_temp': 2.0}])
+    assert site_gen.build_site(pages, str(docs), processes=False) == [str(docs / "44.00_20.00.html")]
+    assert rendered == [2]
+
+    pages["45.00,21.00"] = page(13.0, [])
+    assert sorted(site_gen.build_site(pages, str(docs), processes=False)) == \
+        [str(docs / "45.00_21.00.html"), str(docs / "index.html")]
+    assert rendered == [2, 2]